@@ -1,26 +1,31 @@
 import streamlit as st
 import pandas as pd
-from thefuzz import process, fuzz
 import database
 import utils
+import ranking
+import importer
 import backup
 import audit
 import dashboard
 from datetime import date
 from io import StringIO
-import json
 import os
-import re
 
 st.set_page_config(page_title="Challenge Raids Orientation", layout="wide")
 
+# Schéma vérifié une fois par processus : aux reruns suivants, init_db()
+# retourne immédiatement (voir database._schema_ready)
 database.init_db()
 
 
 def main():
-    # Sauvegarde automatique quotidienne
+    # Sauvegarde automatique quotidienne, après archivage de l'historique
+    # ancien, puis incrémentale toutes les 15 minutes ; en arrière-plan : la
+    # page s'affiche sans attendre
     if backup.should_backup_today():
-        backup.create_backup()
+        backup.start_backup(prepare=audit.archive_old_modifications)
+    elif backup.should_take_changeset():
+        backup.start_changeset()
     
     st.sidebar.title("Navigation")
     pages = ["Import", "Édition", "Classement"]
@@ -266,68 +271,11 @@ def show_import():
         show_validation_interface()
 
 
-def normalize_name(s: str) -> str:
-    if pd.isna(s) or s is None:
-        return ""
-    result = str(s).strip()
-    return "" if result.lower() == "nan" else result
-
-
-def normalize_category(val):
-    """Normalise les catégories (H -> Homme, F -> Femme, M -> Mixte).
-    Détecte aussi les mots inclus dans une chaîne (ex: TrotteurHomme -> Homme).
-    """
-    if val is None or pd.isna(val):
-        return None
-    v = str(val).strip().upper()
-    if not v:
-        return None
-    
-    # Correspondance exacte d'abord
-    if v in ["H", "HOMME", "HOMMES", "MASCULIN", "MEN", "MALE"]:
-        return "Homme"
-    if v in ["F", "FEMME", "FEMMES", "DAME", "DAMES", "FÉMININE", "FEMININE", "WOMEN", "FEMALE"]:
-        return "Femme"
-    if v in ["M", "MIXTE", "MIXTES", "MIXED", "MIX"]:
-        return "Mixte"
-    
-    # Détection des mots inclus dans la chaîne (ex: TrotteurHomme, OrienteurFemme)
-    if "HOMME" in v or "MASCULIN" in v or "MEN" in v or "MALE" in v:
-        return "Homme"
-    if "FEMME" in v or "DAME" in v or "FEMININE" in v or "WOMEN" in v or "FEMALE" in v:
-        return "Femme"
-    if "MIXTE" in v or "MIXED" in v:
-        return "Mixte"
-    
-    # Si aucune correspondance, retourner la valeur originale
-    return v
-
-
-def check_category_match(val, target_cat):
-    """Vérifie si la catégorie val correspond au filtre target_cat (ex: 'H' -> 'Homme')."""
-    v = str(val).lower().strip()
-    t = target_cat.lower()
-    if t == "homme":
-        return "homme" in v or "masculin" in v or re.search(r"\bh\b", v) is not None
-    if t == "femme":
-        return "femme" in v or "féminine" in v or "dame" in v or re.search(r"\bf\b", v) is not None
-    if t == "mixte":
-        return "mixte" in v or re.search(r"\bm\b", v) is not None
-    return t in v
-
-
-def format_date_fr(date_str: str) -> str:
-    """Convertit YYYY-MM-DD en DD/MM/YY pour l'affichage."""
-    if not date_str:
-        return ""
-    try:
-        parts = date_str.split("-")
-        if len(parts) == 3:
-            year = parts[0][-2:]  # Prendre les 2 derniers chiffres de l'année
-            return f"{parts[2]}/{parts[1]}/{year}"
-    except:
-        pass
-    return date_str
+@st.cache_resource(max_entries=2)
+def get_name_index(db_name, data_version):
+    """Index de rapprochement des noms, partagé entre les reruns et reconstruit
+    dès que les données changent (nouvelle génération)."""
+    return importer.NameIndex(name for _, name in database.get_all_coureurs())
 
 
 def analyze_file(
@@ -341,47 +289,15 @@ def analyze_file(
     date_event,
     challenge_id=None,
 ):
+    # Barème applicable au challenge et au circuit importés
+    points_lookup = database.get_points_lookup(challenge_id, circuit)
+
     # Détection des conflits entre classement et points
     if col_points:
-        conflicts_detected = []
-        for idx, row in df.iterrows():
-            try:
-                rang = int(row.get(col_classement))
-                points_fichier = int(row.get(col_points))
-                
-                # Calculer les points attendus selon le rang
-                if col_categorie:
-                    # Utiliser le rang par catégorie si possible
-                    temp_df = df.copy()
-                    temp_df["_temp_sort_rank"] = pd.to_numeric(temp_df[col_classement], errors='coerce')
-                    valid_ranks_df = temp_df.dropna(subset=["_temp_sort_rank"]).copy()
-                    
-                    if not valid_ranks_df.empty:
-                        valid_ranks_df["_temp_cat"] = valid_ranks_df[col_categorie].apply(normalize_category)
-                        valid_ranks_df = valid_ranks_df.sort_values("_temp_sort_rank")
-                        valid_ranks_df["_calc_cat_rank"] = valid_ranks_df.groupby("_temp_cat").cumcount() + 1
-                        
-                        if idx in valid_ranks_df.index:
-                            rang_categorie = valid_ranks_df.loc[idx, "_calc_cat_rank"]
-                            points_attendus = utils.calculate_points(rang_categorie)
-                        else:
-                            points_attendus = utils.calculate_points(rang)
-                    else:
-                        points_attendus = utils.calculate_points(rang)
-                else:
-                    points_attendus = utils.calculate_points(rang)
-                
-                # Vérifier s'il y a conflit
-                if points_fichier != points_attendus:
-                    conflicts_detected.append({
-                        'ligne': idx + 1,
-                        'rang': rang,
-                        'points_fichier': points_fichier,
-                        'points_attendus': points_attendus
-                    })
-            except (ValueError, TypeError):
-                continue
-        
+        conflicts_detected = importer.detect_point_conflicts(
+            df, col_classement, col_points, col_categorie, points_lookup=points_lookup
+        )
+
         # Afficher les conflits détectés
         if conflicts_detected:
             st.error(f"⚠️ {len(conflicts_detected)} conflits détectés entre classement et points !")
@@ -409,159 +325,39 @@ def analyze_file(
             
             st.info("📝 **Recommandation :** Utilisez les classements si vous êtes sûr de leur exactitude, sinon utilisez les points du fichier.")
             return  # Arrêter ici jusqu'à ce que l'utilisateur choisisse
-    # Liste des coureurs existants (nom_complet)
-    existing_coureurs = database.get_all_coureurs()
-    existing_names_by_id = {id_: name for id_, name in existing_coureurs}
-    existing_names = list(existing_names_by_id.values())
+    # Index des coureurs existants (nom_complet)
+    name_index = get_name_index(database.DB_NAME, database.get_data_version())
     
     # Si aucun raid n'existe, nettoyer automatiquement les coureurs orphelins
-    if existing_names:
+    if name_index.names:
         total_courses = database.run_query("SELECT COUNT(*) as count FROM courses").iloc[0]['count']
         if total_courses == 0:
-            st.info(f"🧹 Nettoyage automatique de {len(existing_names)} coureurs orphelins...")
-            deleted_count = database.clean_invalid_coureurs()
-            st.success(f"✅ {deleted_count} coureurs orphelins supprimés automatiquement.")
-            # Recharger la liste des coureurs après nettoyage
-            existing_coureurs = database.get_all_coureurs()
-            existing_names_by_id = {id_: name for id_, name in existing_coureurs}
-            existing_names = list(existing_names_by_id.values())
-
-    # Pré-calcul des rangs par catégorie pour l'attribution correcte des points
-    # (ex: 10e au scratch mais 1ere Femme -> doit avoir les points du 1er)
-    calculated_cat_ranks = {}
-    if col_categorie and col_classement:
-        try:
-            temp_df = df.copy()
-            # Conversion numérique du classement pour trier correctement
-            temp_df["_temp_sort_rank"] = pd.to_numeric(temp_df[col_classement], errors='coerce')
-            
-            # On ne garde que les lignes avec un classement valide pour déterminer l'ordre
-            valid_ranks_df = temp_df.dropna(subset=["_temp_sort_rank"]).copy()
-            
-            if not valid_ranks_df.empty:
-                # Nettoyage et normalisation de la catégorie
-                valid_ranks_df["_temp_cat"] = valid_ranks_df[col_categorie].apply(normalize_category)
-                # Tri par classement scratch
-                valid_ranks_df = valid_ranks_df.sort_values("_temp_sort_rank")
-                # Calcul du rang au sein de chaque catégorie (1, 2, 3...)
-                valid_ranks_df["_calc_cat_rank"] = valid_ranks_df.groupby("_temp_cat").cumcount() + 1
-                # Mapping index ligne -> rang catégorie
-                calculated_cat_ranks = valid_ranks_df["_calc_cat_rank"].to_dict()
-        except Exception:
-            pass
-
-    to_process = []
-    progress_bar = st.progress(0)
-
-    for idx, row in df.iterrows():
-        # Classement (rang)
-        try:
-            rang = int(row.get(col_classement))
-        except Exception:
-            rang = 999  # défaut
-
-        # Points: soit la colonne, soit calculés à partir du rang
-        points = 0
-        points_calculated = False
-        if col_points:
-            try:
-                points = int(row.get(col_points))
-                points_calculated = True
-                
-                # Respecter le choix de l'utilisateur en cas de conflit
-                if st.session_state.get('import_use_ranks', False):
-                    # Forcer le recalcul des points selon le rang
-                    points_calculated = False
-                elif st.session_state.get('import_use_points', False):
-                    # Garder les points du fichier
-                    points_calculated = True
-            except Exception:
-                pass
-        
-        if not points_calculated:
-            # Si on a pu calculer un rang par catégorie, on l'utilise pour les points
-            if idx in calculated_cat_ranks:
-                points = utils.calculate_points(calculated_cat_ranks[idx])
-            else:
-                # ATTENTION: Sans catégorie définie, impossible de calculer correctement les points
-                # On met 1 point par défaut pour éviter les incohérences
-                points = 1  # Points minimum au lieu d'utiliser le rang scratch
-
-        # Catégorie à appliquer à tous les coéquipiers de la ligne
-        if col_categorie:
-            try:
-                categorie = normalize_category(row.get(col_categorie))
-            except Exception:
-                categorie = None
-        else:
-            categorie = None
-
-        # Pour chaque coéquipier mappé, créer une entrée
-        for mapping in name_mappings:
-            if mapping.get("mode") == "split":
-                prenom = normalize_name(row.get(mapping.get("prenom"), ""))
-                nom = normalize_name(row.get(mapping.get("nom"), ""))
-                full_name = f"{prenom} {nom}".strip()
-            elif mapping.get("mode") == "single":
-                full_cell = normalize_name(row.get(mapping.get("full"), ""))
-                # Tenter de séparer si possible (dernier token comme nom le plus fréquent "Prénom Nom")
-                parts = full_cell.split()
-                if len(parts) >= 2:
-                    prenom = " ".join(parts[:-1])
-                    nom = parts[-1]
-                else:
-                    prenom, nom = "", full_cell
-                full_name = f"{prenom} {nom}".strip()
-            else:
-                continue
-
-            # Vérifications plus strictes pour éviter les données invalides
-            if not full_name or full_name.lower() in ["nan", "nan nan", ""] or pd.isna(full_name):
-                continue
-            if not prenom or prenom.lower() == "nan" or pd.isna(prenom):
-                continue
-            if not nom or nom.lower() == "nan" or pd.isna(nom):
-                continue
-
-            status = "new"
-            match_proposal = None
-            score = 0
-
-            if full_name in existing_names:
-                status = "exact"
-                match_proposal = full_name
-                score = 100
-            elif existing_names:
-                best = process.extractOne(
-                    full_name, existing_names, scorer=fuzz.token_sort_ratio
-                )
-                if best:
-                    best_match, score = best
-                    if score == 100:
-                        status = "exact"
-                        match_proposal = best_match
-                    elif score >= 88:
-                        status = "conflict"
-                        match_proposal = best_match
-                    else:
-                        status = "new"
-
-            to_process.append(
-                {
-                    "prenom": prenom,
-                    "nom": nom,
-                    "full_name": full_name,
-                    "rang": rang,
-                    "points": points,
-                    "circuit": circuit,
-                    "categorie": categorie,
-                    "status": status,
-                    "match_proposal": match_proposal,
-                    "score": score,
-                }
+            st.info(f"🧹 Nettoyage automatique de {len(name_index.names)} coureurs orphelins...")
+            deleted = database.clean_invalid_coureurs()
+            st.success(
+                f"✅ {deleted['coureurs']} coureurs orphelins supprimés automatiquement "
+                f"({deleted['resultats']} résultats)."
             )
+            # Recharger l'index après nettoyage (la version des données a changé)
+            name_index = get_name_index(database.DB_NAME, database.get_data_version())
 
-        progress_bar.progress((idx + 1) / len(df))
+    # Analyse vectorisée : rangs, points et catégories sur tout le fichier,
+    # puis rapprochement des noms (seule étape par nom distinct)
+    progress_bar = st.progress(0)
+    to_process = importer.analyze_results(
+        df,
+        name_mappings,
+        col_classement,
+        col_points,
+        col_categorie,
+        circuit,
+        name_index,
+        # Respecter le choix de l'utilisateur en cas de conflit
+        use_ranks=st.session_state.get('import_use_ranks', False),
+        progress=progress_bar.progress,
+        points_lookup=points_lookup,
+    )
+    progress_bar.progress(1.0)
 
     st.session_state["import_data"] = to_process
     st.session_state["import_meta"] = {
@@ -627,57 +423,33 @@ def show_validation_interface():
                 st.divider()
 
         if st.form_submit_button("Valider et Sauvegarder"):
-            save_results(data, meta, conflicts)
-
-
-def save_results(data, meta, conflicts):
-    # Une course unique pour l'import courant (circuit sélectionné)
-    course_id = database.create_course(
-        meta["nom_event"], str(meta["date"]), meta["circuit"], meta.get("challenge_id")
-    )
-
-    # Mapping nom_complet -> id
-    existing_coureurs = dict(database.get_all_coureurs())  # {id, nom}
-    name_to_id = {name: id_ for id_, name in existing_coureurs.items()}
+            save_results(data, meta)
 
-    batch_results = []
-    count_added = 0
-    progress_bar = st.progress(0)
-    total_len = len(data)
-    for i, item in enumerate(data):
-        full_name = item["full_name"]
-        coureur_id = None
 
+def save_results(data, meta):
+    # Coureur retenu pour chaque participant : (nom_complet, à créer)
+    participants = []
+    conflict_index = 0
+    for item in data:
         if item["status"] == "exact":
-            coureur_id = name_to_id.get(item["match_proposal"])
-        elif item["status"] == "new":
-            coureur_id = database.add_coureur(full_name, None, None)
-            name_to_id[full_name] = coureur_id
+            coureur = (item["match_proposal"], False)
         elif item["status"] == "conflict":
-            widget_key = f"conflict_{conflicts.index(item)}"
-            user_choice = st.session_state.get(widget_key)
+            user_choice = st.session_state.get(f"conflict_{conflict_index}")
+            conflict_index += 1
             if user_choice and "même personne" in user_choice:
-                coureur_id = name_to_id.get(item["match_proposal"])
+                coureur = (item["match_proposal"], False)
             else:
-                coureur_id = database.add_coureur(full_name, None, None)
-                name_to_id[full_name] = coureur_id
-
-        if coureur_id:
-            # Collecter pour insertion groupée
-            batch_results.append((
-                course_id,
-                coureur_id,
-                item["rang"],
-                int(item["points"]),
-                item.get("categorie"),
-            ))
-            count_added += 1
-        
-        if total_len > 0:
-            progress_bar.progress((i + 1) / total_len)
+                coureur = (item["full_name"], True)
+        else:
+            coureur = (item["full_name"], True)
+        participants.append(
+            (*coureur, item["rang"], int(item["points"]), item.get("categorie"), item.get("rang_categorie"))
+        )
 
-    if batch_results:
-        database.add_results_batch(batch_results)
+    # Course, nouveaux coureurs et résultats en une seule transaction
+    _, count_added = database.import_results(
+        meta["nom_event"], str(meta["date"]), meta["circuit"], meta.get("challenge_id"), participants
+    )
 
     st.success(f"{count_added} résultats importés.")
     if "import_data" in st.session_state:
@@ -688,9 +460,8 @@ def save_results(data, meta, conflicts):
 
 def show_ranking():
     st.title("🏆 Classement Général")
-    df = database.get_ranking_data()
 
-    if df.empty:
+    if not database.has_results():
         st.warning("Aucun résultat.")
         return
 
@@ -707,73 +478,19 @@ def show_ranking():
     with c2:
         choix_circuit = st.selectbox("Circuit", ["trotteur", "orienteur", "raideur"])
     with c3:
-        choix_categorie = st.selectbox("Catégorie", ["Toutes", "Homme", "Femme", "Mixte"])
-
-    # Filtrage strict par ID de challenge
-    df_challenge = df[df["challenge_id"] == selected_ch_id]
+        choix_categorie = st.selectbox("Catégorie", ["Toutes"] + ranking.CATEGORIES)
 
-    # Filtrage par circuit
-    df_circuit_all = df_challenge[df_challenge["circuit"] == choix_circuit]
+    # Tous les classements du circuit (Toutes + chaque catégorie) en une passe
+    views = ranking.compute_circuit_rankings(selected_ch_id, choix_circuit)
 
-    # Récupération de la liste ordonnée des courses pour forcer l'affichage des colonnes
-    all_courses_raw = database.get_courses_by_circuit(choix_circuit)
-    challenge_courses = [c for c in all_courses_raw if c[4] == selected_ch_id]
-    challenge_courses.sort(key=lambda x: x[2])  # Tri par date
-    ordered_course_names = [c[1] for c in challenge_courses]
-    # Mapping nom_course -> date pour affichage
-    course_dates = {c[1]: format_date_fr(c[2]) for c in challenge_courses}
-
-    if df_circuit_all.empty:
+    if views["Toutes"].empty:
         st.info(f"Aucun résultat pour le circuit {choix_circuit} sur ce challenge.")
         return
 
-    # Filtrage pour l'affichage (selon sélection catégorie)
-    filtered_df = df_circuit_all.copy()
-    if choix_categorie != "Toutes":
-        filtered_df = filtered_df[filtered_df["categorie"].apply(lambda x: check_category_match(x, choix_categorie))]
-
     pivot = None
 
-    # Tri chronologique
-    if not filtered_df.empty:
-        filtered_df = filtered_df.sort_values(by="date", ascending=True)
-        
-        # IMPORTANT: Classement par catégorie séparée
-        # Un coureur peut être dans différentes catégories selon les étapes
-        # On groupe par (nom_complet, categorie) pour créer des "identités" séparées
-        
-        # Créer une clé unique combinant nom et catégorie pour chaque participation
-        filtered_df["coureur_categorie"] = filtered_df["nom_complet"] + " (" + filtered_df["categorie"].astype(str) + ")"
-        
-        # Construire le tableau: colonnes par course, valeurs = points, plus Total
-        pivot = filtered_df.pivot_table(
-            index=["nom_complet", "categorie"],  # Index multi-niveau
-            columns="nom_course",
-            values="points",
-            aggfunc="sum",
-            fill_value=0,
-        )
-        
-        # Forcer les colonnes pour inclure les raids sans résultats et respecter l'ordre chronologique
-        pivot = pivot.reindex(columns=ordered_course_names, fill_value=0)
-        
-        # Renommer les colonnes pour inclure les dates
-        new_columns = {}
-        for col in pivot.columns:
-            if col in course_dates:
-                new_columns[col] = f"{col}\n{course_dates[col]}"
-            else:
-                new_columns[col] = col
-        pivot = pivot.rename(columns=new_columns)
-
-        pivot["Total"] = pivot.sum(axis=1)
-        pivot = pivot.sort_values(by="Total", ascending=False)
-        pivot = pivot.reset_index()
-        
-        # Créer une colonne "Prénom Nom" qui combine nom et catégorie pour différencier
-        pivot["Prénom Nom"] = pivot["nom_complet"] + " (" + pivot["categorie"] + ")"
-        pivot = pivot.drop(columns=["nom_complet", "categorie"])
-        pivot.insert(0, "Classement", range(1, 1 + len(pivot)))
+    if not views[choix_categorie].empty:
+        pivot = views[choix_categorie]
 
         # Affichage du tableau récapitulatif
         titre_section = f"{choix_circuit}"
@@ -781,7 +498,10 @@ def show_ranking():
             titre_section += f" - {choix_categorie}"
 
         st.subheader(f"Classement - {titre_section}")
-        st.dataframe(pivot, use_container_width=True, hide_index=True)
+        if st.toggle("✏️ Modifier les points dans le tableau", key="ranking_edit_mode"):
+            show_points_editor(pivot, selected_ch_id, choix_circuit, choix_categorie)
+        else:
+            st.dataframe(pivot, use_container_width=True, hide_index=True)
     else:
         st.info(f"Aucun résultat pour le circuit {choix_circuit} ({choix_categorie}) sur ce challenge.")
     
@@ -794,7 +514,14 @@ def show_ranking():
         st.success("🗑️ Participant supprimé avec succès !")
         del st.session_state["participant_deleted"]
     
-    with st.expander("✏️ Modifier un participant"):
+    if st.session_state.get("points_grid_skipped"):
+        st.warning(
+            f"⚠️ {st.session_state['points_grid_skipped']} cellule(s) ignorée(s) : "
+            "sans résultat ou portées par plusieurs résultats (doublons)."
+        )
+        del st.session_state["points_grid_skipped"]
+
+    with st.expander("🗑️ Supprimer un participant"):
         if pivot is not None and not pivot.empty:
             participant_names = pivot["Prénom Nom"].tolist()
             selected_participant = st.selectbox("Sélectionner un participant", participant_names)
@@ -809,47 +536,7 @@ def show_ranking():
                 )
                 
                 if not results_df.empty:
-                    st.markdown(f"**Modification des points pour : {selected_participant}**")
-                    
-                    # Créer un formulaire pour modifier les points
-                    with st.form(f"edit_participant_{selected_participant}"):
-                        modified_points = {}
-                        cols = st.columns(min(3, len(results_df)))
-                        
-                        for idx, (_, result) in enumerate(results_df.iterrows()):
-                            col_idx = idx % 3
-                            with cols[col_idx]:
-                                new_points = st.number_input(
-                                    f"{result['nom_course']}",
-                                    min_value=0,
-                                    max_value=35,
-                                    value=int(result['points']),
-                                    key=f"points_{result['id']}"
-                                )
-                                modified_points[result['id']] = {
-                                    'course_id': result['course_id'],
-                                    'coureur_name': selected_participant,
-                                    'new_points': new_points,
-                                    'old_points': result['points']
-                                }
-                        
-                        if st.form_submit_button("✅ Sauvegarder les modifications"):
-                            # Mettre à jour les points modifiés
-                            changes_made = False
-                            for result_id, data in modified_points.items():
-                                if data['new_points'] != data['old_points']:
-                                    database.update_result_points_by_id(result_id, data['new_points'])
-                                    changes_made = True
-                            
-                            if changes_made:
-                                st.session_state["participant_updated"] = True
-                                st.rerun()
-                            else:
-                                st.info("Aucune modification détectée.")
-                    
-                    # Section suppression
-                    st.divider()
-                    st.markdown("**🗑️ Supprimer ce participant**")
+                    st.markdown(f"**{selected_participant}** : {len(results_df)} résultat(s) sur ce circuit")
                     
                     # Stocker les IDs des résultats à supprimer
                     result_ids_to_delete = [int(r['id']) for _, r in results_df.iterrows()]
@@ -857,82 +544,167 @@ def show_ranking():
                     confirm_key = f"confirm_delete_participant_{participant_name_only}"
                     if st.checkbox(f"Je confirme vouloir supprimer {selected_participant} de ce circuit", key=confirm_key):
                         if st.button("🗑️ Supprimer définitivement", type="primary", key=f"delete_{participant_name_only}"):
-                            for result_id in result_ids_to_delete:
-                                database.delete_result_by_id(result_id)
+                            database.delete_results(result_ids_to_delete)
                             st.session_state["participant_deleted"] = True
                             st.rerun()
                 else:
                     st.info("Aucun résultat trouvé pour ce participant.")
         else:
-            st.info("Aucun participant à modifier dans cette vue.")
+            st.info("Aucun participant dans cette vue.")
     
+    # PDF générés à la demande puis mis en cache (disque) par version des données
+    data_version = database.get_data_version()
     col_pdf_1, col_pdf_2 = st.columns(2)
 
     with col_pdf_1:
         if pivot is not None:
-            pdf_pivot = pivot.rename(columns={"Prénom Nom": "Nom Prénom"})
-            # Titre pour le PDF simple
-            titre_simple = f"{choix_circuit}"
-            if choix_categorie != "Toutes":
-                titre_simple += f" - {choix_categorie}"
-            
-            pdf_input = {titre_simple: (pdf_pivot, ch_map[selected_ch_id])}
-            pdf_bytes = utils.generate_pdf(pdf_input)
-            st.download_button(
-                "📄 Télécharger la catégorie affichée", pdf_bytes, "classement_categorie.pdf", "application/pdf"
-            )
+            pdf_key = ("categorie", selected_ch_id, choix_circuit, choix_categorie)
+            pdf_bytes = utils.get_cached_pdf(pdf_key, data_version)
+            from_cache = pdf_bytes is not None
+            if pdf_bytes is None and st.button("📄 Préparer le PDF de la catégorie affichée"):
+                pdf_pivot = pivot.rename(columns={"Prénom Nom": "Nom Prénom"})
+                # Titre pour le PDF simple
+                titre_simple = f"{choix_circuit}"
+                if choix_categorie != "Toutes":
+                    titre_simple += f" - {choix_categorie}"
+
+                pdf_input = {titre_simple: (pdf_pivot, ch_map[selected_ch_id])}
+                pdf_bytes = utils.render_cached_pdf(pdf_key, data_version, pdf_input)
+            if pdf_bytes is not None:
+                st.download_button(
+                    "📄 Télécharger la catégorie affichée", pdf_bytes, "classement_categorie.pdf", "application/pdf",
+                    on_click=utils.count_pdf_download, args=(from_cache,),
+                )
         else:
             st.write("Pas de données à télécharger pour cette vue.")
 
     with col_pdf_2:
-        # Génération du PDF complet (Femme -> Mixte -> Homme)
-        pdf_input_full = {}
-        range_str = ch_map[selected_ch_id]
-        
-        # Ordre spécifique demandé : Femme, Mixte, Homme
-        for cat in ["Femme", "Mixte", "Homme"]:
-            # Filtrer sur la catégorie dans les données globales du circuit
-            df_cat = df_circuit_all[df_circuit_all["categorie"].apply(lambda x: check_category_match(x, cat))]
-            if not df_cat.empty:
-                df_cat = df_cat.sort_values(by="date", ascending=True)
-                
-                # Pivot avec index multi-niveau pour gérer les participations multiples
-                p_cat = df_cat.pivot_table(
-                    index=["nom_complet", "categorie"],
-                    columns="nom_course",
-                    values="points",
-                    aggfunc="sum",
-                    fill_value=0,
-                )
-                p_cat = p_cat.reindex(columns=ordered_course_names, fill_value=0)
-                
-                # Renommer les colonnes pour inclure les dates dans le PDF
-                new_columns_pdf = {}
-                for col in p_cat.columns:
-                    if col in course_dates:
-                        new_columns_pdf[col] = f"{col}\n{course_dates[col]}"
-                    else:
-                        new_columns_pdf[col] = col
-                p_cat = p_cat.rename(columns=new_columns_pdf)
-                p_cat["Total"] = p_cat.sum(axis=1)
-                p_cat = p_cat.sort_values(by="Total", ascending=False)
-                p_cat = p_cat.reset_index()
-                
-                # Créer la colonne "Nom Prénom" avec catégorie pour le PDF
-                p_cat["Nom Prénom"] = p_cat["nom_complet"] + " (" + p_cat["categorie"] + ")"
-                p_cat = p_cat.drop(columns=["nom_complet", "categorie"])
-                p_cat.insert(0, "Classement", range(1, 1 + len(p_cat)))
-                
-                title_cat = f"{choix_circuit} - {cat}"
-                pdf_input_full[title_cat] = (p_cat, range_str)
-        
-        if pdf_input_full:
-            pdf_bytes_full = utils.generate_pdf(pdf_input_full)
+        pdf_key_full = ("complet", selected_ch_id, choix_circuit)
+        pdf_bytes_full = utils.get_cached_pdf(pdf_key_full, data_version)
+        from_cache_full = pdf_bytes_full is not None
+        if pdf_bytes_full is None and st.button("📄 Préparer le PDF du circuit complet"):
+            # Génération du PDF complet (Femme -> Mixte -> Homme)
+            pdf_input_full = {}
+            range_str = ch_map[selected_ch_id]
+
+            # Ordre spécifique demandé : Femme, Mixte, Homme
+            for cat in ranking.PDF_CATEGORY_ORDER:
+                if not views[cat].empty:
+                    p_cat = views[cat].rename(columns={"Prénom Nom": "Nom Prénom"})
+
+                    title_cat = f"{choix_circuit} - {cat}"
+                    pdf_input_full[title_cat] = (p_cat, range_str)
+
+            if pdf_input_full:
+                pdf_bytes_full = utils.render_cached_pdf(pdf_key_full, data_version, pdf_input_full)
+            else:
+                st.info("Pas de données pour générer le PDF complet.")
+        if pdf_bytes_full is not None:
             st.download_button(
-                "📄 Télécharger le circuit complet", pdf_bytes_full, "classement_complet.pdf", "application/pdf"
+                "📄 Télécharger le circuit complet", pdf_bytes_full, "classement_complet.pdf", "application/pdf",
+                on_click=utils.count_pdf_download, args=(from_cache_full,),
             )
-        else:
-            st.info("Pas de données pour générer le PDF complet.")
+
+    stats = utils.pdf_cache_stats
+    total_requests = stats["hits"] + stats["misses"]
+    if total_requests:
+        caption = f"Cache PDF : {stats['hits']}/{total_requests} servis depuis le cache ({stats['hits'] / total_requests:.0%})"
+        if stats["last_render_ms"] is not None:
+            caption += f" — dernier rendu : {stats['last_render_ms']:.0f} ms"
+        st.caption(caption)
+
+    query_stats = database.get_query_cache_info()
+    total_queries = query_stats["hits"] + query_stats["misses"]
+    if total_queries:
+        st.caption(
+            f"Cache requêtes : {query_stats['hits']}/{total_queries} servies depuis le cache "
+            f"({query_stats['hits'] / total_queries:.0%}) — {query_stats['size']}/{query_stats['max_size']} entrées"
+        )
+
+
+def show_points_editor(pivot, challenge_id, circuit, categorie):
+    """Grille d'édition des points du classement.
+
+    Toutes les cellules modifiées sont enregistrées en un seul lot, refusé si
+    un des résultats a changé depuis le chargement de la grille.
+    """
+    grid_key = f"points_grid_{challenge_id}_{circuit}_{categorie}"
+    # Instantané au chargement : référence du contrôle de concurrence
+    if grid_key not in st.session_state:
+        st.session_state[grid_key] = (pivot, ranking.build_result_cells(challenge_id, circuit))
+    base, cells = st.session_state[grid_key]
+    fixed_columns = ["Classement", "Total", "Prénom Nom"]
+    raid_columns = [c for c in base.columns if c not in fixed_columns]
+
+    with st.form(f"{grid_key}_form"):
+        edited = st.data_editor(
+            base,
+            disabled=fixed_columns,
+            column_config={
+                c: st.column_config.NumberColumn(min_value=0, max_value=database.MAX_POINTS, step=1)
+                for c in raid_columns
+            },
+            hide_index=True,
+            use_container_width=True,
+            key=f"{grid_key}_editor",
+        )
+        submitted = st.form_submit_button("✅ Enregistrer les modifications")
+
+    if st.button("🔄 Recharger le tableau", key=f"{grid_key}_reload"):
+        del st.session_state[grid_key]
+        st.rerun()
+
+    if submitted:
+        # Cellule vidée = inchangée
+        new_values = edited[raid_columns].fillna(base[raid_columns]).to_numpy()
+        changes, skipped = [], 0
+        for row, col in zip(*(new_values != base[raid_columns].to_numpy()).nonzero()):
+            cell = cells.get((base["Prénom Nom"].iat[row], raid_columns[col]))
+            if cell is None:
+                skipped += 1
+            else:
+                changes.append((cell[0], cell[1], new_values[row, col]))
+
+        if not changes and not skipped:
+            st.info("Aucune modification détectée.")
+            return
+        result = database.update_results_points(changes)
+        if result["conflits"]:
+            st.error(
+                f"⚠️ {len(result['conflits'])} résultat(s) modifié(s) depuis le chargement du tableau : "
+                "aucune modification enregistrée. Rechargez le tableau puis recommencez."
+            )
+            return
+        del st.session_state[grid_key]
+        st.session_state["participant_updated"] = bool(result["resultats"])
+        st.session_state["points_grid_skipped"] = skipped
+        st.rerun()
+
+
+# Lignes par page de l'historique des modifications
+HISTORY_PAGE_SIZE = 50
+
+
+def history_cursor(key):
+    """Curseur (timestamp, id) de la page d'historique affichée, None pour la
+    première page. Les curseurs des pages précédentes sont empilés en session."""
+    cursors = st.session_state.get(f"{key}_cursors", [])
+    return cursors[-1] if cursors else None
+
+
+def history_pager(key, page, page_size):
+    """Boutons de navigation de l'historique (pagination par clé)."""
+    cursors = st.session_state.setdefault(f"{key}_cursors", [])
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("⬅️ Plus récentes", key=f"{key}_newer", disabled=not cursors):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("Plus anciennes ➡️", key=f"{key}_older", disabled=len(page) < page_size):
+            last = page.iloc[-1]
+            cursors.append((last["timestamp"], int(last["id"])))
+            st.rerun()
 
 
 def show_edition():
@@ -963,7 +735,7 @@ def show_edition():
                 st.warning("Aucun raid trouvé.")
                 selected_raid_id = None
             else:
-                raid_options = {r[0]: f"{r[1]} ({format_date_fr(r[2])}) - {r[3]}" for r in all_season_raids}
+                raid_options = {r[0]: f"{r[1]} ({utils.format_date_fr(r[2])}) - {r[3]}" for r in all_season_raids}
                 selected_raid_id = st.selectbox("🏃 Raid", options=list(raid_options.keys()), format_func=lambda x: raid_options[x])
 
         # Formulaire d'ajout
@@ -983,8 +755,10 @@ def show_edition():
                 with col_perf1:
                     rang = st.number_input("🏅 Classement (catégorie)", min_value=1, value=1, key="edition_rang")
                 with col_perf2:
-                    # Calcul automatique des points basé sur le rang
-                    points_auto = utils.calculate_points(rang)
+                    # Calcul automatique des points basé sur le rang (barème du raid)
+                    raid = next(r for r in all_season_raids if r[0] == selected_raid_id)
+                    points_lookup = database.get_points_lookup(raid[4], raid[3])
+                    points_auto = utils.calculate_points(rang, points_lookup)
                     st.number_input("⭐ Points (automatique)", value=points_auto, disabled=True, key="edition_points_display")
                 
                 if st.form_submit_button("✅ Enregistrer le résultat", use_container_width=True):
@@ -993,20 +767,24 @@ def show_edition():
                         st.error("Le nom et le prénom sont requis.")
                     else:
                         # Calcul automatique des points basé sur le rang
-                        points_final = utils.calculate_points(rang)
+                        points_final = utils.calculate_points(rang, points_lookup)
                         
                         # Vérification de conflit
                         conflict_df = database.run_query(
-                            "SELECT c.nom_complet FROM resultats r JOIN coureurs c ON r.coureur_id = c.id WHERE r.course_id = ? AND r.rang = ? AND r.categorie_course = ?",
+                            "SELECT c.nom_complet FROM resultats r JOIN coureurs c ON r.coureur_id = c.id "
+                            "WHERE r.course_id = ? AND COALESCE(r.rang_categorie, r.rang) = ? AND r.categorie_course = ?",
                             (selected_raid_id, rang, categorie)
                         )
                         if not conflict_df.empty:
                             existing_name = conflict_df.iloc[0]["nom_complet"]
                             st.error(f"⚠️ Conflit : Le rang {rang} en '{categorie}' est déjà attribué à '{existing_name}'.")
                         else:
-                            full_name = normalize_name(full_name)
+                            full_name = importer.normalize_name(full_name)
                             coureur_id = database.add_coureur(full_name, None, None)
-                            database.add_result(selected_raid_id, coureur_id, rang, int(points_final), categorie)
+                            # Pas de rang scratch connu : le classement saisi sert aux deux rangs
+                            database.add_result(
+                                selected_raid_id, coureur_id, rang, int(points_final), categorie, rang_categorie=rang
+                            )
                             st.success(f"✅ Résultat ajouté : {full_name} - {points_final} pts")
 
     st.divider()
@@ -1027,7 +805,7 @@ def show_edition():
                 st.info("Aucun raid pour cette saison.")
                 man_sel_raid_id = None
             else:
-                man_raid_opts = {r[0]: f"{r[1]} ({format_date_fr(r[2])}) - {r[3]}" for r in man_raids}
+                man_raid_opts = {r[0]: f"{r[1]} ({utils.format_date_fr(r[2])}) - {r[3]}" for r in man_raids}
                 man_sel_raid_id = st.selectbox("🏃 Raid à gérer", options=list(man_raid_opts.keys()), format_func=lambda x: man_raid_opts[x], key="man_raid_select")
 
         if man_sel_raid_id:
@@ -1081,188 +859,294 @@ def show_edition():
     with st.container():
         st.markdown("### 🔧 Maintenance")
         
-        # Vérification préalable pour notification
-        invalid_coureurs = database.get_invalid_coureurs()
-        duplicates = database.get_duplicate_results()
-        aberrant_points = database.get_aberrant_points()
-        
-        total_issues = len(invalid_coureurs) + (0 if duplicates.empty else len(duplicates.groupby(['nom_complet', 'nom_course']))) + len(aberrant_points)
+        # Compteurs tenus à jour par triggers (table data_issues) : pas de scan
+        issue_counts = database.get_data_issue_counts()
+        total_issues = sum(issue_counts.values())
         
         if total_issues > 0:
             st.toast(f"⚠️ {total_issues} problème(s) de données détecté(s) — Voir Nettoyage", icon="🔧")
         
         with st.expander("🧹 Nettoyage des données invalides"):
-            # Nettoyage des coureurs invalides
-            st.markdown("**Recherche des coureurs invalides...**")
-            st.caption("Coureurs avec noms vides, 'nan', ou mal formatés (souvent causé par des cellules vides dans le fichier importé)")
+            st.caption(
+                f"{issue_counts['nom_invalide']} coureur(s) invalide(s) · "
+                f"{issue_counts['doublon']} cas de doublon(s) · "
+                f"{issue_counts['points_aberrants']} résultat(s) avec points > {database.MAX_POINTS}"
+            )
+            # Les listes détaillées ne sont chargées qu'à la demande
+            show_details = st.toggle("🔍 Afficher le détail", key="show_data_issues", disabled=total_issues == 0)
+            if show_details:
+                invalid_coureurs = database.get_invalid_coureurs()
+                duplicates = database.get_duplicate_results()
+                aberrant_points = database.get_aberrant_points()
+
+                # Nettoyage des coureurs invalides
+                st.markdown("**Recherche des coureurs invalides...**")
+                st.caption("Coureurs avec noms vides, 'nan', ou mal formatés (souvent causé par des cellules vides dans le fichier importé)")
             
-            if invalid_coureurs.empty:
-                st.success("✅ Aucun coureur invalide trouvé.")
-            else:
-                st.warning(f"⚠️ {len(invalid_coureurs)} coureur(s) invalide(s) détecté(s)")
+                if invalid_coureurs.empty:
+                    st.success("✅ Aucun coureur invalide trouvé.")
+                else:
+                    st.warning(f"⚠️ {len(invalid_coureurs)} coureur(s) invalide(s) détecté(s)")
                 
-                for _, row in invalid_coureurs.iterrows():
-                    coureur_id = row['id']
-                    nom = row['nom_complet']
-                    nb_res = row['nb_resultats']
+                    for _, row in invalid_coureurs.iterrows():
+                        coureur_id = row['id']
+                        nom = row['nom_complet']
+                        nb_res = row['nb_resultats']
                     
-                    # Déterminer la raison
-                    if nom is None or str(nom).strip() == '':
-                        raison = "Nom vide"
-                    elif 'nan' in str(nom).lower():
-                        raison = "Contient 'nan' (cellule vide à l'import)"
-                    else:
-                        raison = "Format invalide"
+                        # Déterminer la raison
+                        if nom is None or str(nom).strip() == '':
+                            raison = "Nom vide"
+                        elif 'nan' in str(nom).lower():
+                            raison = "Contient 'nan' (cellule vide à l'import)"
+                        else:
+                            raison = "Format invalide"
                     
-                    # Récupérer les courses associées
-                    coureur_info = database.get_coureur_by_id(coureur_id)
-                    courses_list = coureur_info['nom_course'].dropna().unique().tolist() if not coureur_info.empty else []
+                        # Récupérer les courses associées
+                        coureur_info = database.get_coureur_by_id(coureur_id)
+                        courses_list = coureur_info['nom_course'].dropna().unique().tolist() if not coureur_info.empty else []
                     
-                    with st.container():
-                        col1, col2 = st.columns([3, 2])
-                        with col1:
-                            st.markdown(f"**Coureur ID {coureur_id}** — {raison}")
-                            st.caption(f"Nom actuel : `{nom if nom else '(vide)'}` | {nb_res} résultat(s)")
-                            if courses_list:
-                                st.caption(f"Course(s) : {', '.join(courses_list)}")
+                        with st.container():
+                            col1, col2 = st.columns([3, 2])
+                            with col1:
+                                st.markdown(f"**Coureur ID {coureur_id}** — {raison}")
+                                st.caption(f"Nom actuel : `{nom if nom else '(vide)'}` | {nb_res} résultat(s)")
+                                if courses_list:
+                                    st.caption(f"Course(s) : {', '.join(courses_list)}")
                         
-                        with col2:
-                            # Option 1: Modifier le nom
-                            new_name = st.text_input(
-                                "Corriger le nom",
-                                placeholder="Prénom NOM",
-                                key=f"fix_name_{coureur_id}"
-                            )
+                            with col2:
+                                # Option 1: Modifier le nom
+                                new_name = st.text_input(
+                                    "Corriger le nom",
+                                    placeholder="Prénom NOM",
+                                    key=f"fix_name_{coureur_id}"
+                                )
                             
-                            col_btn1, col_btn2 = st.columns(2)
-                            with col_btn1:
-                                if st.button("✏️ Modifier", key=f"save_{coureur_id}", disabled=not new_name):
-                                    if new_name.strip():
-                                        database.update_coureur_name(coureur_id, new_name.strip())
-                                        st.success("Nom corrigé !")
+                                col_btn1, col_btn2 = st.columns(2)
+                                with col_btn1:
+                                    if st.button("✏️ Modifier", key=f"save_{coureur_id}", disabled=not new_name):
+                                        if new_name.strip():
+                                            database.update_coureur_name(coureur_id, new_name.strip())
+                                            st.success("Nom corrigé !")
+                                            st.rerun()
+                                with col_btn2:
+                                    if st.button("🗑️ Supprimer", key=f"del_{coureur_id}", type="secondary"):
+                                        database.delete_coureur(coureur_id)
                                         st.rerun()
-                            with col_btn2:
-                                if st.button("🗑️ Supprimer", key=f"del_{coureur_id}", type="secondary"):
-                                    conn = database.get_connection()
-                                    cursor = conn.cursor()
-                                    cursor.execute("DELETE FROM resultats WHERE coureur_id = ?", (coureur_id,))
-                                    cursor.execute("DELETE FROM coureurs WHERE id = ?", (coureur_id,))
-                                    conn.commit()
-                                    conn.close()
-                                    st.rerun()
                         
-                        st.divider()
+                            st.divider()
             
-            st.divider()
+                st.divider()
             
-            # Recherche des points aberrants
-            st.markdown("**Recherche des points aberrants...**")
+                # Recherche des points aberrants
+                st.markdown("**Recherche des points aberrants...**")
             
-            if aberrant_points.empty:
-                st.success("✅ Aucun point aberrant trouvé.")
-            else:
-                st.warning(f"⚠️ {len(aberrant_points)} résultats avec points > 35 détectés")
+                if aberrant_points.empty:
+                    st.success("✅ Aucun point aberrant trouvé.")
+                else:
+                    st.warning(f"⚠️ {len(aberrant_points)} résultats avec points > 35 détectés")
+
+                    if st.button("⚡ Recalculer tous selon le barème", key="auto_fix_aberrant"):
+                        fixed = database.fix_aberrant_points()
+                        st.success(
+                            "✅ Points recalculés : "
+                            + ", ".join(f"{cat} : {nb}" for cat, nb in fixed.items())
+                        )
+                        st.rerun()
                 
-                # Correction manuelle pour chaque résultat aberrant
-                with st.form("fix_aberrant_points_form"):
-                    st.markdown("**Correction manuelle des points :**")
-                    corrections = {}
+                    # Correction manuelle pour chaque résultat aberrant
+                    with st.form("fix_aberrant_points_form"):
+                        st.markdown("**Correction manuelle des points :**")
+                        corrections = {}
                     
-                    for idx, row in aberrant_points.iterrows():
-                        col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
+                        for idx, row in aberrant_points.iterrows():
+                            col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
                         
-                        with col1:
-                            st.write(f"**{row['nom_complet']}**")
-                            st.caption(f"{row['nom_course']} - {row['categorie_course']}")
+                            with col1:
+                                st.write(f"**{row['nom_complet']}**")
+                                st.caption(f"{row['nom_course']} - {row['categorie_course']}")
                         
-                        with col2:
-                            st.write(f"Rang: {row['rang']}")
+                            with col2:
+                                st.write(f"Rang: {row['rang']}")
                         
-                        with col3:
-                            st.write(f"Points actuels: **{row['points']}**")
+                            with col3:
+                                st.write(f"Points actuels: **{row['points']}**")
                         
-                        with col4:
-                            # Points suggérés selon le rang
-                            suggested_points = utils.calculate_points(row['rang'])
-                            new_points = st.number_input(
-                                "Nouveaux points",
-                                min_value=0,
-                                max_value=35,
-                                value=suggested_points,
-                                key=f"points_fix_{row['id']}"
-                            )
-                            corrections[row['id']] = {
-                                'new_points': new_points,
-                                'old_points': row['points']
-                            }
+                            with col4:
+                                # Points suggérés selon le rang
+                                suggested_points = utils.calculate_points(
+                                    row['rang'], database.get_points_lookup(row['challenge_id'], row['circuit'])
+                                )
+                                new_points = st.number_input(
+                                    "Nouveaux points",
+                                    min_value=0,
+                                    max_value=35,
+                                    value=suggested_points,
+                                    key=f"points_fix_{row['id']}"
+                                )
+                                corrections[row['id']] = {
+                                    'new_points': new_points,
+                                    'old_points': row['points']
+                                }
                         
-                        st.divider()
+                            st.divider()
                     
-                    if st.form_submit_button("🔧 Appliquer les corrections", type="primary", use_container_width=True):
-                        changes_made = 0
-                        for result_id, correction in corrections.items():
-                            if correction['new_points'] != correction['old_points']:
-                                database.update_result_points_by_id(result_id, correction['new_points'])
-                                changes_made += 1
+                        if st.form_submit_button("🔧 Appliquer les corrections", type="primary", use_container_width=True):
+                            changes_made = 0
+                            for result_id, correction in corrections.items():
+                                if correction['new_points'] != correction['old_points']:
+                                    database.update_result_points_by_id(result_id, correction['new_points'])
+                                    changes_made += 1
                         
-                        if changes_made > 0:
-                            st.success(f"✅ {changes_made} résultats corrigés.")
-                            st.rerun()
-                        else:
-                            st.info("Aucune modification appliquée.")
+                            if changes_made > 0:
+                                st.success(f"✅ {changes_made} résultats corrigés.")
+                                st.rerun()
+                            else:
+                                st.info("Aucune modification appliquée.")
             
-            st.divider()
+                st.divider()
             
-            # Recherche des doublons
-            st.markdown("**Recherche des doublons...**")
-            st.caption("Même participant inscrit plusieurs fois sur la même course (souvent dû à un double import du fichier)")
+                # Recherche des doublons
+                st.markdown("**Recherche des doublons...**")
+                st.caption("Même participant inscrit plusieurs fois sur la même course (souvent dû à un double import du fichier)")
             
-            if duplicates.empty:
-                st.success("✅ Aucun doublon trouvé.")
-            else:
-                # Grouper par coureur + course
-                grouped = duplicates.groupby(['nom_complet', 'nom_course'])
-                nb_doublons = len(grouped)
-                st.warning(f"⚠️ {nb_doublons} cas de doublon(s) détecté(s)")
+                if duplicates.empty:
+                    st.success("✅ Aucun doublon trouvé.")
+                else:
+                    # Grouper par coureur + course
+                    grouped = duplicates.groupby(['nom_complet', 'nom_course'])
+                    nb_doublons = len(grouped)
+                    st.warning(f"⚠️ {nb_doublons} cas de doublon(s) détecté(s)")
                 
-                # Collecter tous les IDs à supprimer (garder le premier de chaque groupe)
-                ids_to_delete = []
+                    # Collecter tous les IDs à supprimer (garder le premier de chaque groupe)
+                    ids_to_delete = []
                 
-                # Affichage en tableau clair
-                display_data = []
-                for (nom, course), group in grouped:
-                    sorted_group = group.sort_values('id')
-                    nb_entries = len(sorted_group)
-                    first = sorted_group.iloc[0]
-                    # Garder le premier ID, marquer les autres pour suppression
-                    ids_to_delete.extend(sorted_group['id'].iloc[1:].tolist())
+                    # Affichage en tableau clair
+                    display_data = []
+                    for (nom, course), group in grouped:
+                        sorted_group = group.sort_values('id')
+                        nb_entries = len(sorted_group)
+                        first = sorted_group.iloc[0]
+                        # Garder le premier ID, marquer les autres pour suppression
+                        ids_to_delete.extend(sorted_group['id'].iloc[1:].tolist())
                     
-                    display_data.append({
-                        "Participant": nom,
-                        "Course": course,
-                        "Inscriptions": f"{nb_entries}x (doublon !)",
-                        "Entrée conservée": f"Rang {first['rang']}, {first['points']} pts",
-                        "Entrées supprimées": nb_entries - 1
-                    })
+                        display_data.append({
+                            "Participant": nom,
+                            "Course": course,
+                            "Inscriptions": f"{nb_entries}x (doublon !)",
+                            "Entrée conservée": f"Rang {first['rang']}, {first['points']} pts",
+                            "Entrées supprimées": nb_entries - 1
+                        })
                 
-                st.dataframe(display_data, use_container_width=True, hide_index=True)
+                    st.dataframe(display_data, use_container_width=True, hide_index=True)
                 
-                if ids_to_delete:
-                    st.markdown(f"""
-                    **Action proposée :**  
-                    Supprimer **{len(ids_to_delete)} entrée(s) en double** tout en conservant la première inscription de chaque participant.
-                    """)
+                    if ids_to_delete:
+                        st.markdown(f"""
+                        **Action proposée :**  
+                        Supprimer **{len(ids_to_delete)} entrée(s) en double** tout en conservant la première inscription de chaque participant.
+                        """)
                     
-                    if st.button("🗑️ Supprimer les doublons", type="primary"):
-                        progress_bar = st.progress(0, text="Suppression des doublons...")
-                        total = len(ids_to_delete)
-                        for i, rid in enumerate(ids_to_delete):
-                            database.delete_result_by_id(int(rid))
-                            progress_bar.progress((i + 1) / total, text=f"Suppression... {i + 1}/{total}")
-                        progress_bar.progress(1.0, text="Terminé !")
-                        st.success(f"✅ {len(ids_to_delete)} doublon(s) supprimé(s)")
-                        st.rerun()
+                        if st.button("🗑️ Supprimer les doublons", type="primary"):
+                            deleted = database.delete_results(ids_to_delete)
+                            st.success(f"✅ {deleted} doublon(s) supprimé(s)")
+                            st.rerun()
             
+
+        with st.expander("📐 Barème des points"):
+            st.caption(
+                "Barème par challenge et/ou circuit ; à défaut, le barème le plus général s'applique. "
+                "Au-delà du dernier rang, ses points s'appliquent. Les points déjà enregistrés ne changent pas."
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                bareme_ch = st.selectbox(
+                    "Challenge", [None] + list(ch_map.keys()),
+                    format_func=lambda x: "Tous" if x is None else ch_map[x], key="bareme_challenge",
+                )
+            with col2:
+                bareme_circuit = st.selectbox(
+                    "Circuit", [None, "trotteur", "orienteur", "raideur"],
+                    format_func=lambda x: "Tous" if x is None else x, key="bareme_circuit",
+                )
+
+            scale = database.get_points_scale(bareme_ch, bareme_circuit)
+            own_scale = any(
+                s["challenge_id"] == bareme_ch and s["circuit"] == bareme_circuit
+                for s in database.get_points_scales()
+            )
+            if not own_scale:
+                st.info("Pas de barème propre : le barème affiché est hérité.")
+            edited = st.data_editor(
+                pd.DataFrame({"rang": list(scale), "points": list(scale.values())}),
+                num_rows="dynamic", hide_index=True, use_container_width=True,
+                key=f"bareme_editor_{bareme_ch}_{bareme_circuit}",
+            )
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("💾 Enregistrer le barème", use_container_width=True):
+                    try:
+                        edited = edited.dropna()
+                        database.set_points_scale(
+                            dict(zip(edited["rang"], edited["points"])), bareme_ch, bareme_circuit
+                        )
+                        st.success("✅ Barème enregistré.")
+                    except ValueError as e:
+                        st.error(str(e))
+            with col2:
+                if own_scale and (bareme_ch is not None or bareme_circuit is not None):
+                    if st.button("🗑️ Supprimer ce barème", use_container_width=True):
+                        database.delete_points_scale(bareme_ch, bareme_circuit)
+                        st.success("✅ Barème supprimé : le barème général s'applique.")
+                        st.rerun()
+
+        with st.expander("🔁 Recalcul des points"):
+            st.caption(
+                "Recalcule les rangs par catégorie et les points selon le barème applicable, "
+                "par exemple après une correction de catégories ou un changement de barème."
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                rescore_ch = st.selectbox(
+                    "Saison", list(ch_map.keys()), format_func=lambda x: ch_map[x], key="rescore_challenge"
+                )
+            with col2:
+                rescore_raids = {r[0]: f"{r[1]} ({utils.format_date_fr(r[2])}) - {r[3]}" for r in all_courses if r[4] == rescore_ch}
+                rescore_raid = st.selectbox(
+                    "Raid", [None] + list(rescore_raids.keys()),
+                    format_func=lambda x: "Tous les raids de la saison" if x is None else rescore_raids[x],
+                    key="rescore_raid",
+                )
+
+            if st.button("🔁 Recalculer les points", use_container_width=True):
+                if rescore_raid is None:
+                    changed = database.rescore_results(challenge_id=rescore_ch)
+                else:
+                    changed = database.rescore_results(course_id=rescore_raid)
+                if changed:
+                    st.success(
+                        "✅ Points recalculés : "
+                        + ", ".join(f"{cat} : {nb}" for cat, nb in changed.items())
+                    )
+                else:
+                    st.info("Aucun point à modifier.")
+
+        with st.expander("📊 Cohérence du classement"):
+            st.caption("Compare le classement matérialisé aux résultats enregistrés (recalcul complet)")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("🔍 Vérifier le classement", use_container_width=True):
+                    ecarts = database.check_standings()
+                    if ecarts.empty:
+                        st.success("✅ Classement cohérent avec les résultats.")
+                    else:
+                        st.warning(f"⚠️ {len(ecarts)} écart(s) détecté(s)")
+                        st.dataframe(ecarts, use_container_width=True, hide_index=True)
+            with col2:
+                if st.button("🔄 Reconstruire le classement", use_container_width=True):
+                    database.rebuild_standings()
+                    st.success("✅ Classement reconstruit à partir des résultats.")
+
         with st.expander("💾 Gestion des sauvegardes"):
             col1, col2 = st.columns(2)
             
@@ -1284,7 +1168,34 @@ def show_edition():
             if backups:
                 st.markdown("**Sauvegardes disponibles :**")
                 for b in backups:
-                    st.text(f"• {b['filename']} - {b['date']} ({b['size']})")
+                    st.text(f"• {b['filename']} - {b['date']} ({b['size']}, {b['changesets']} incrémentale(s))")
+
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    choix = st.selectbox(
+                        "Restaurer la sauvegarde", backups,
+                        format_func=lambda b: f"{b['filename']} - {b['date']}", key="restore_choice",
+                    )
+                    confirmer = st.checkbox("Je confirme remplacer toutes les données actuelles", key="restore_confirm")
+                with col2:
+                    st.write("")
+                    if st.button("♻️ Restaurer", use_container_width=True, disabled=not confirmer):
+                        backup.restore_backup(choix["hash"])
+                        st.success(f"✅ Base restaurée : {choix['filename']}")
+
+                col1, col2, col3 = st.columns([2, 2, 1])
+                with col1:
+                    jour = st.date_input("Restaurer l'état du", value=date.today(), key="restore_day")
+                with col2:
+                    heure = st.time_input("à", key="restore_time", step=60)
+                with col3:
+                    st.write("")
+                    if st.button("⏪ Restaurer à cette heure", use_container_width=True, disabled=not confirmer):
+                        try:
+                            etat = backup.restore_point_in_time(f"{jour.isoformat()}T{heure.isoformat()}")
+                            st.success(f"✅ Base restaurée à l'état du {pd.to_datetime(etat).strftime('%d/%m/%Y %H:%M:%S')}")
+                        except ValueError as e:
+                            st.error(f"❌ {e}")
             else:
                 st.info("Aucune sauvegarde trouvée")
 
@@ -1294,13 +1205,10 @@ def show_edition():
     with st.container():
         st.markdown("### 📝 Historique des modifications")
         
-        # Initialiser l'audit log si nécessaire
-        audit.init_audit_log()
-        
-        tab1, tab2 = st.tabs(["Modifications récentes", "Changements de points"])
+        tab1, tab2, tab3 = st.tabs(["Modifications récentes", "Changements de points", "Archives"])
         
         with tab1:
-            recent_mods = audit.get_recent_modifications()
+            recent_mods = audit.get_recent_modifications(HISTORY_PAGE_SIZE, history_cursor("history_recent"))
             
             if not recent_mods.empty:
                 display_data = []
@@ -1311,7 +1219,10 @@ def show_edition():
                     action_map = {
                         'UPDATE': '✏️ Modification',
                         'DELETE': '🗑️ Suppression',
-                        'INSERT': '➕ Ajout'
+                        'INSERT': '➕ Ajout',
+                        'BATCH_INSERT': '📥 Import groupé',
+                        'BATCH_UPDATE': '🔧 Correction groupée',
+                        'BATCH_DELETE': '🧹 Nettoyage groupé'
                     }
                     action_label = action_map.get(mod['action'], mod['action'])
                     
@@ -1319,14 +1230,17 @@ def show_edition():
                     table_map = {
                         'resultats': 'Résultat',
                         'coureurs': 'Coureur',
-                        'courses': 'Course'
+                        'courses': 'Course',
+                        'challenges': 'Challenge',
+                        'bareme_points': 'Barème'
                     }
                     table_label = table_map.get(mod['table_name'], mod['table_name'])
                     
                     # Construire la description
-                    participant = mod.get('nom_complet') or ""
-                    course = mod.get('nom_course') or ""
-                    circuit = mod.get('circuit') or ""
+                    # Jointures sans correspondance (résultat supprimé, opération groupée) : NaN
+                    participant = mod['nom_complet'] if pd.notna(mod['nom_complet']) else ""
+                    course = mod['nom_course'] if pd.notna(mod['nom_course']) else ""
+                    circuit = mod['circuit'] if pd.notna(mod['circuit']) else ""
                     
                     details = ""
                     if participant:
@@ -1337,6 +1251,12 @@ def show_edition():
                             details += f" ({circuit})"
                     elif course:
                         details = f"{course} ({circuit})" if circuit else course
+                    else:
+                        # Opération groupée : résumé des volumes traités
+                        details = ", ".join(
+                            f"{int(mod[f'nb_{k}'])} {k}" for k in ("courses", "coureurs", "resultats")
+                            if pd.notna(mod[f'nb_{k}'])
+                        )
                     
                     display_data.append({
                         "Date": timestamp,
@@ -1348,9 +1268,10 @@ def show_edition():
                 st.dataframe(display_data, use_container_width=True, hide_index=True)
             else:
                 st.info("Aucune modification enregistrée")
+            history_pager("history_recent", recent_mods, HISTORY_PAGE_SIZE)
         
         with tab2:
-            point_mods = audit.get_point_modifications()
+            point_mods = audit.get_point_modifications(HISTORY_PAGE_SIZE, history_cursor("history_points"))
             
             if not point_mods.empty:
                 st.markdown("**Dernières modifications de points :**")
@@ -1358,32 +1279,65 @@ def show_edition():
                 display_data = []
                 for _, mod in point_mods.iterrows():
                     timestamp = pd.to_datetime(mod['timestamp']).strftime('%d/%m/%Y %H:%M')
-                    
-                    # Parser old/new values
-                    old_pts = ""
-                    new_pts = ""
-                    try:
-                        if mod['old_values']:
-                            old_data = json.loads(mod['old_values']) if isinstance(mod['old_values'], str) else mod['old_values']
-                            old_pts = old_data.get('points', '?')
-                        if mod['new_values']:
-                            new_data = json.loads(mod['new_values']) if isinstance(mod['new_values'], str) else mod['new_values']
-                            new_pts = new_data.get('points', '?')
-                    except:
-                        pass
+                    old_pts = int(mod['old_points']) if pd.notna(mod['old_points']) else "?"
+                    new_pts = int(mod['new_points']) if pd.notna(mod['new_points']) else "?"
                     
                     display_data.append({
                         "Date": timestamp,
-                        "Participant": mod['nom_complet'] or "(supprimé)",
-                        "Course": mod['nom_course'] or "(supprimée)",
-                        "Circuit": mod['circuit'] or "-",
-                        "Catégorie": mod['categorie_course'] or "-",
+                        "Participant": mod['nom_complet'] if pd.notna(mod['nom_complet']) else "(inconnu)",
+                        "Course": mod['nom_course'] if pd.notna(mod['nom_course']) else "(inconnue)",
+                        "Circuit": mod['circuit'] if pd.notna(mod['circuit']) else "-",
+                        "Catégorie": mod['categorie_course'] if pd.notna(mod['categorie_course']) else "-",
                         "Modification": f"{old_pts} → {new_pts} pts"
                     })
                 
                 st.dataframe(display_data, use_container_width=True, hide_index=True)
             else:
                 st.info("Aucune modification de points enregistrée")
+            history_pager("history_points", point_mods, HISTORY_PAGE_SIZE)
+
+        with tab3:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                retention = st.number_input(
+                    "Archiver les modifications de plus de (jours)",
+                    min_value=1, value=audit.AUDIT_RETENTION_DAYS, step=30,
+                )
+            with col2:
+                st.write("")
+                if st.button("📦 Archiver maintenant", use_container_width=True):
+                    nb = audit.archive_old_modifications(int(retention), vacuum=True)
+                    st.success(f"✅ {nb} modification(s) archivée(s)")
+
+            archives = audit.get_archives()
+            if archives.empty:
+                st.info("Aucune archive")
+            else:
+                st.dataframe(
+                    archives.rename(columns={
+                        "mois": "Mois", "nb_lignes": "Modifications",
+                        "premier_ts": "Première", "dernier_ts": "Dernière",
+                    })[["Mois", "Modifications", "Première", "Dernière"]],
+                    use_container_width=True, hide_index=True,
+                )
+
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    recherche = st.text_input("Rechercher un participant ou une course", key="archive_search")
+                with col2:
+                    table = st.selectbox("Table", ["Toutes", "resultats", "coureurs", "courses", "challenges"])
+                if recherche:
+                    found = audit.search_archives(recherche, None if table == "Toutes" else table)
+                    if found.empty:
+                        st.info("Aucune modification archivée trouvée")
+                    else:
+                        found["timestamp"] = pd.to_datetime(found["timestamp"]).dt.strftime('%d/%m/%Y %H:%M')
+                        st.dataframe(
+                            found[["timestamp", "action", "table_name", "nom_complet", "nom_course",
+                                   "old_values", "new_values"]],
+                            use_container_width=True, hide_index=True,
+                        )
+
 
 if __name__ == "__main__":
     main()
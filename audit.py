@@ -1,28 +1,24 @@
-import sqlite3
 import database
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import groupby
+import gzip
 import json
+import os
+import pandas as pd
+
+# Archives mensuelles de audit_log : JSON Lines compressé (gzip), un fichier par mois
+ARCHIVE_DIR = "archives"
+# Ancienneté (en jours) au-delà de laquelle les modifications sont archivées
+AUDIT_RETENTION_DAYS = 365
+# Colonnes de audit_log conservées dans les archives
+AUDIT_COLUMNS = [
+    "id", "timestamp", "action", "table_name", "record_id",
+    "old_values", "new_values", "user_info",
+] + database.AUDIT_LABEL_COLUMNS
 
 def init_audit_log():
-    """Initialise la table d'audit pour l'historique des modifications."""
-    conn = database.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS audit_log (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        action TEXT NOT NULL,
-        table_name TEXT NOT NULL,
-        record_id INTEGER,
-        old_values TEXT,
-        new_values TEXT,
-        user_info TEXT
-    )
-    """)
-    
-    conn.commit()
-    conn.close()
+    """Initialise la table d'audit (créée par les migrations de database.init_db)."""
+    database.init_db()
 
 def _convert_to_native(obj):
     """Convertit les types numpy/pandas en types Python natifs pour JSON."""
@@ -30,74 +26,250 @@ def _convert_to_native(obj):
         return obj.item()
     return obj
 
-def log_modification(action, table_name, record_id=None, old_values=None, new_values=None, user_info="System"):
-    """Enregistre une modification dans l'audit log."""
-    conn = database.get_connection()
-    cursor = conn.cursor()
-    
-    # Convertir les valeurs numpy en types natifs Python
+def _audit_row(action, table_name, record_id=None, old_values=None, new_values=None, user_info="System"):
+    """Ligne d'audit_log prête à insérer (valeurs numpy/pandas converties pour JSON)."""
     if old_values:
         old_values = {k: _convert_to_native(v) for k, v in old_values.items()}
     if new_values:
         new_values = {k: _convert_to_native(v) for k, v in new_values.items()}
-    
-    cursor.execute("""
-    INSERT INTO audit_log (timestamp, action, table_name, record_id, old_values, new_values, user_info)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
+    return (
         datetime.now().isoformat(),
         action,
         table_name,
         int(record_id) if record_id is not None else None,
         json.dumps(old_values) if old_values else None,
         json.dumps(new_values) if new_values else None,
-        user_info
-    ))
-    
-    conn.commit()
-    conn.close()
-
-def get_recent_modifications(limit=50):
-    """Récupère les modifications récentes avec détails."""
-    query = """
-    SELECT 
-        a.timestamp, 
-        a.action, 
-        a.table_name, 
-        a.record_id, 
-        a.old_values, 
-        a.new_values,
-        c.nom_complet,
-        co.nom_course,
-        co.circuit
-    FROM audit_log a
-    LEFT JOIN resultats r ON a.record_id = r.id AND a.table_name = 'resultats'
-    LEFT JOIN coureurs c ON r.coureur_id = c.id
-    LEFT JOIN courses co ON r.course_id = co.id
-    ORDER BY a.timestamp DESC
+        user_info,
+    )
+
+def log_modifications(records):
+    """Enregistre plusieurs modifications en une seule insertion.
+
+    records : itérable de tuples (action, table_name, record_id, old_values,
+    new_values). Appelée dans une transaction (database.transaction), l'écriture
+    fait partie de celle-ci : audit et données sont validés ou annulés ensemble,
+    avec un seul commit.
+    """
+    rows = [_audit_row(*record) for record in records]
+    if not rows:
+        return
+    with database.transaction() as conn:
+        conn.executemany("""
+        INSERT INTO audit_log (timestamp, action, table_name, record_id, old_values, new_values, user_info)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+def log_modification(action, table_name, record_id=None, old_values=None, new_values=None, user_info="System"):
+    """Enregistre une modification dans l'audit log (dans la transaction courante s'il y en a une)."""
+    log_modifications([(action, table_name, record_id, old_values, new_values, user_info)])
+
+def log_batch(action, table_name, summary, user_info="System"):
+    """Enregistre une opération groupée (un seul enregistrement, résumé dans new_values)."""
+    log_modification(action, table_name, None, None, summary, user_info)
+
+def _keyset(before, conditions=()):
+    """Clause WHERE de pagination par clé : lignes antérieures à before,
+    (timestamp, id) de la dernière ligne de la page précédente."""
+    conditions = list(conditions)
+    params = []
+    if before is not None:
+        conditions.append("(timestamp, id) < (?, ?)")
+        params = [before[0], int(before[1])]
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+def get_recent_modifications(limit=50, before=None):
+    """Récupère les modifications récentes avec détails.
+
+    Les libellés sont ceux enregistrés avec la modification (pas de jointure) ;
+    une opération groupée expose ses volumes (nb_courses, nb_coureurs,
+    nb_resultats). Page suivante : before = (timestamp, id) de la dernière ligne.
+    """
+    where, params = _keyset(before)
+    query = f"""
+    SELECT
+        id,
+        timestamp,
+        action,
+        table_name,
+        record_id,
+        old_values,
+        new_values,
+        nom_complet,
+        nom_course,
+        circuit,
+        CASE WHEN action LIKE 'BATCH_%' THEN json_extract(new_values, '$.courses') END AS nb_courses,
+        CASE WHEN action LIKE 'BATCH_%' THEN json_extract(new_values, '$.coureurs') END AS nb_coureurs,
+        CASE WHEN action LIKE 'BATCH_%' THEN json_extract(new_values, '$.resultats') END AS nb_resultats
+    FROM audit_log
+    {where}
+    ORDER BY timestamp DESC, id DESC
     LIMIT ?
     """
-    return database.run_query(query, (limit,))
-
-def get_point_modifications():
-    """Récupère spécifiquement les modifications de points avec détails complets."""
-    query = """
-    SELECT 
-        a.timestamp, 
-        a.action, 
-        a.record_id, 
-        a.old_values, 
-        a.new_values,
-        c.nom_complet,
-        co.nom_course,
-        co.circuit,
-        r.categorie_course
-    FROM audit_log a
-    LEFT JOIN resultats r ON a.record_id = r.id
-    LEFT JOIN coureurs c ON r.coureur_id = c.id
-    LEFT JOIN courses co ON r.course_id = co.id
-    WHERE a.table_name = 'resultats' AND a.action = 'UPDATE'
-    ORDER BY a.timestamp DESC
-    LIMIT 20
+    return database.run_query(query, params + [limit])
+
+def get_point_modifications(limit=20, before=None):
+    """Récupère spécifiquement les modifications de points avec détails complets.
+
+    Anciens et nouveaux points sont extraits par SQLite (old_points, new_points).
+    Page suivante : before = (timestamp, id) de la dernière ligne.
+    """
+    where, params = _keyset(before, [database.AUDIT_POINTS_FILTER])
+    query = f"""
+    SELECT
+        id,
+        timestamp,
+        action,
+        record_id,
+        json_extract(old_values, '$.points') AS old_points,
+        json_extract(new_values, '$.points') AS new_points,
+        nom_complet,
+        nom_course,
+        circuit,
+        categorie_course
+    FROM audit_log
+    {where}
+    ORDER BY timestamp DESC, id DESC
+    LIMIT ?
     """
-    return database.run_query(query)
\ No newline at end of file
+    return database.run_query(query, params + [limit])
+
+def _archive_path(mois):
+    return os.path.join(ARCHIVE_DIR, f"audit_{mois}.jsonl.gz")
+
+def _append_archive(path, lines):
+    """Ajoute des lignes JSON à une archive gzip (nouveau membre gzip, compressé
+    en une fois) et force l'écriture sur disque avant de rendre la main."""
+    data = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=6)
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def archive_old_modifications(days=AUDIT_RETENTION_DAYS, vacuum=False):
+    """Déplace les modifications de plus de `days` jours vers les archives mensuelles.
+
+    Chaque mois est ajouté à archives/audit_AAAA-MM.jsonl.gz (lignes JSON
+    produites par SQLite) puis catalogué (audit_archives, audit_archive_index) ;
+    les lignes sont supprimées de audit_log dans la même transaction. Les
+    fichiers sont écrits avant le commit : en cas d'échec, les lignes seront
+    réécrites au passage suivant et search_archives les dédoublonne par id.
+    vacuum : rend ensuite la place libérée au système (sinon elle est
+    réutilisée par les écritures suivantes).
+    Retourne le nombre de lignes archivées.
+    """
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    archived_at = datetime.now().isoformat()
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    record = ", ".join(f"'{column}', {column}" for column in AUDIT_COLUMNS)
+    total = 0
+    with database.transaction() as conn:
+        rows = conn.execute(f"""
+        SELECT substr(timestamp, 1, 7), json_object({record})
+        FROM audit_log
+        WHERE timestamp < ?
+        ORDER BY timestamp, id
+        """, (cutoff,))
+        for mois, group in groupby(rows, key=lambda row: row[0]):
+            lines = [line for _, line in group]
+            _append_archive(_archive_path(mois), lines)
+            total += len(lines)
+        if total:
+            conn.execute("""
+            INSERT INTO audit_archives (mois, nb_lignes, premier_ts, dernier_ts, archive_le)
+            SELECT substr(timestamp, 1, 7), count(*), min(timestamp), max(timestamp), ?
+            FROM audit_log
+            WHERE timestamp < ?
+            GROUP BY 1
+            ON CONFLICT (mois) DO UPDATE SET
+                nb_lignes = nb_lignes + excluded.nb_lignes,
+                premier_ts = min(premier_ts, excluded.premier_ts),
+                dernier_ts = max(dernier_ts, excluded.dernier_ts),
+                archive_le = excluded.archive_le
+            """, (archived_at, cutoff))
+            conn.execute("""
+            INSERT INTO audit_archive_index (mois, table_name, nom_complet, nom_course, nb_lignes)
+            SELECT substr(timestamp, 1, 7), table_name, coalesce(nom_complet, ''), coalesce(nom_course, ''), count(*)
+            FROM audit_log
+            WHERE timestamp < ?
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (mois, table_name, nom_complet, nom_course)
+            DO UPDATE SET nb_lignes = nb_lignes + excluded.nb_lignes
+            """, (cutoff,))
+            conn.execute("DELETE FROM audit_log WHERE timestamp < ?", (cutoff,))
+        # Statistiques du planificateur rafraîchies quand audit_log a changé de
+        # taille de plus de 10 % (croissance, archivage) : une base inchangée
+        # reste identique octet pour octet (sauvegardes dédoublonnées)
+        stat = conn.execute(
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = 'audit_log' AND idx = 'idx_audit_log_ts_id'"
+        ).fetchone()
+        count = conn.execute("SELECT count(*) FROM audit_log").fetchone()[0]
+        if stat is None or abs(count - int(stat[0].split()[0])) > count // 10:
+            conn.execute("ANALYZE audit_log")
+    if total and vacuum:
+        with database.connection() as conn:
+            conn.execute("VACUUM")
+    return total
+
+def get_archives():
+    """Archives mensuelles de l'historique (plus récentes d'abord)."""
+    return database.run_query("""
+    SELECT mois, nb_lignes, premier_ts, dernier_ts, archive_le
+    FROM audit_archives
+    ORDER BY mois DESC
+    """)
+
+def search_archives(nom=None, table_name=None, record_id=None, start=None, end=None, limit=200):
+    """Recherche dans l'historique archivé, plus récentes d'abord.
+
+    nom : texte cherché dans le coureur ou la course ; start/end : bornes ISO
+    de timestamp (start <= timestamp < end). Le catalogue désigne les mois
+    concernés : seuls leurs fichiers sont relus.
+    """
+    conditions, params = [], []
+    if nom:
+        conditions.append("(i.nom_complet LIKE ? OR i.nom_course LIKE ?)")
+        params += [f"%{nom}%", f"%{nom}%"]
+    if table_name:
+        conditions.append("i.table_name = ?")
+        params.append(table_name)
+    if start:
+        conditions.append("a.dernier_ts >= ?")
+        params.append(start)
+    if end:
+        conditions.append("a.premier_ts < ?")
+        params.append(end)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    months = database.run_query(f"""
+    SELECT DISTINCT a.mois
+    FROM audit_archives a
+    JOIN audit_archive_index i ON i.mois = a.mois
+    {where}
+    ORDER BY a.mois DESC
+    """, params)
+
+    needle = nom.lower() if nom else None
+    found = {}
+    for mois in months["mois"]:
+        # Mois disjoints et parcourus du plus récent au plus ancien
+        if len(found) >= limit:
+            break
+        with gzip.open(_archive_path(mois), "rt", encoding="utf-8") as f:
+            for line in f:
+                # Ligne sans le texte cherché : inutile de la décoder
+                if needle and needle not in line.lower():
+                    continue
+                record = json.loads(line)
+                if needle and needle not in (record["nom_complet"] or "").lower() \
+                        and needle not in (record["nom_course"] or "").lower():
+                    continue
+                if table_name and record["table_name"] != table_name:
+                    continue
+                if record_id is not None and record["record_id"] != int(record_id):
+                    continue
+                if (start and record["timestamp"] < start) or (end and record["timestamp"] >= end):
+                    continue
+                found[record["id"]] = record
+
+    result = pd.DataFrame(list(found.values()), columns=AUDIT_COLUMNS)
+    result = result.sort_values(["timestamp", "id"], ascending=False)
+    return result.head(limit).reset_index(drop=True)
@@ -1,50 +1,498 @@
+import gzip
+import hashlib
+import json
 import os
 import shutil
 import sqlite3
-from datetime import datetime, date
+import threading
+import time
+from datetime import datetime, date, timedelta
 import database
 
 BACKUP_DIR = "backups"
+# Magasin d'instantanés : un fichier compressé par contenu distinct
+# (store/<sha256>.db.gz), décrit par le manifeste
+BACKUP_STORE = os.path.join(BACKUP_DIR, "store")
+BACKUP_MANIFEST = os.path.join(BACKUP_DIR, "manifest.json")
+# Tables dont le nombre de lignes est noté dans le manifeste
+BACKUP_COUNTED_TABLES = ["challenges", "courses", "coureurs", "resultats", "audit_log"]
+
+# Sauvegardes incrémentales : différences ligne à ligne (par clé primaire)
+# entre la copie de tête, état de la dernière sauvegarde, et la base
+BACKUP_HEAD = os.path.join(BACKUP_DIR, "head.db")
+CHANGESET_DIR = os.path.join(BACKUP_DIR, "changesets")
+CHANGESET_INDEX = os.path.join(BACKUP_DIR, "changesets.json")
+CHANGESET_INTERVAL = 15 * 60  # en secondes, entre deux sauvegardes incrémentales
+# Tables internes sans clé primaire déclarée : colonnes identifiant une ligne
+CHANGESET_KEYS = {"sqlite_sequence": ["name"], "sqlite_stat1": ["tbl", "idx"]}
+
+# Copie par l'API de sauvegarde SQLite : pages copiées par étape, et pause
+# entre deux étapes pour laisser passer les écritures des autres sessions
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE = 0.005  # en secondes
+
+# Sauvegarde en arrière-plan en cours (une seule à la fois)
+_backup_lock = threading.Lock()
+# Magasin (manifestes, copie de tête) : une opération à la fois, réentrant
+# (une sauvegarde incrémentale peut se rabattre sur une sauvegarde complète)
+_store_lock = threading.RLock()
+# Dernière sauvegarde incrémentale lancée par ce processus (time.monotonic)
+_last_changeset_attempt = None
 
 def ensure_backup_dir():
     """Crée le dossier de sauvegarde s'il n'existe pas."""
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
+    for directory in [BACKUP_STORE, CHANGESET_DIR]:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+def _snapshot_path(snapshot_hash):
+    return os.path.join(BACKUP_STORE, f"{snapshot_hash}.db.gz")
+
+def _changeset_path(changeset_id):
+    return os.path.join(CHANGESET_DIR, f"{changeset_id}.json.gz")
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_json(path, data):
+    """Réécrit un manifeste (fichier temporaire renommé : jamais à moitié écrit)."""
+    temp = path + ".tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(temp, path)
+
+def _read_manifest():
+    """Instantanés enregistrés (du plus ancien au plus récent)."""
+    return _read_json(BACKUP_MANIFEST, [])
+
+def _read_changesets():
+    """Index des sauvegardes incrémentales : copie de tête (instantané de
+    départ, dernier changeset, générations) et changesets, dans l'ordre."""
+    return _read_json(CHANGESET_INDEX, {"head": None, "changesets": []})
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _row_counts(conn, schema="main"):
+    return {
+        table: conn.execute(f"SELECT count(*) FROM {schema}.{table}").fetchone()[0]
+        for table in BACKUP_COUNTED_TABLES
+    }
+
+def _generations(conn, schema="main"):
+    return dict(conn.execute(f"SELECT name, value FROM {schema}.generations"))
+
+def _schema_sql(conn, schema="main"):
+    return conn.execute(
+        f"SELECT type, name, sql FROM {schema}.sqlite_master WHERE sql IS NOT NULL ORDER BY type, name"
+    ).fetchall()
+
+def _copy_database(destination):
+    """Copie cohérente de la base via l'API de sauvegarde SQLite, vérifiée.
+
+    La copie avance par étapes de BACKUP_PAGES_PER_STEP pages, dans une
+    transaction de lecture ouverte sur la base : en mode WAL, elle copie
+    l'état validé au début de la sauvegarde sans bloquer les écritures des
+    autres sessions (sans cette transaction, chaque écriture ferait
+    recommencer la copie). Le fichier obtenu est autonome (journal DELETE,
+    sans -wal) et doit passer PRAGMA integrity_check.
+    """
+    dest = sqlite3.connect(destination)
+    try:
+        with database.connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+                conn.backup(
+                    dest,
+                    pages=BACKUP_PAGES_PER_STEP,
+                    progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_PAUSE),
+                )
+            finally:
+                conn.execute("COMMIT")
+        dest.execute("PRAGMA journal_mode = DELETE")
+        result = dest.execute("PRAGMA integrity_check").fetchall()
+        if result != [("ok",)]:
+            raise sqlite3.DatabaseError(f"Sauvegarde corrompue : {result[:5]}")
+    finally:
+        dest.close()
+
 
 def create_backup(force=False):
     """Crée une sauvegarde de la base de données.
-    
+
+    La copie vérifiée est identifiée par son empreinte SHA-256 : un contenu
+    déjà présent dans le magasin n'est pas stocké une seconde fois (journée
+    sans modification), sinon il est compressé dans store/<sha256>.db.gz.
+    L'instantané est noté dans le manifeste avec sa taille, son empreinte et
+    le nombre de lignes des tables principales ; la copie devient la copie
+    de tête des sauvegardes incrémentales suivantes.
+    Retourne le fichier du magasin, ou None en cas d'erreur.
+
     Args:
-        force: Si True, écrase la sauvegarde existante du jour
+        force: Si True, crée une nouvelle sauvegarde même si celle du jour existe
     """
     ensure_backup_dir()
     
     today = date.today().strftime("%Y-%m-%d")
-    backup_filename = f"{BACKUP_DIR}/challenge_{today}.db"
     
     # Éviter les doublons du même jour (sauf si force=True)
-    if os.path.exists(backup_filename) and not force:
-        return backup_filename
+    if not force:
+        for snapshot in _read_manifest():
+            if snapshot["date"] == today:
+                return _snapshot_path(snapshot["hash"])
     
+    temp_filename = os.path.join(BACKUP_DIR, "snapshot.tmp")
     try:
-        # Copie simple du fichier SQLite
-        shutil.copy2(database.DB_NAME, backup_filename)
-        
-        # Nettoyer les anciens backups (garder 30 jours)
-        cleanup_old_backups()
+        with _store_lock:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            _copy_database(temp_filename)
+            snapshot_hash = _file_hash(temp_filename)
+            conn = sqlite3.connect(temp_filename)
+            try:
+                rows = _row_counts(conn)
+                generations = _generations(conn)
+            finally:
+                conn.close()
+            
+            path = _snapshot_path(snapshot_hash)
+            if not os.path.exists(path):
+                # Compressé dans un fichier temporaire, renommé une fois complet
+                with open(temp_filename, "rb") as src, gzip.open(path + ".tmp", "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(path + ".tmp", path)
+            
+            created = datetime.now().isoformat()
+            snapshots = _read_manifest()
+            snapshots.append({
+                "date": today,
+                "created": created,
+                "hash": snapshot_hash,
+                "size": os.path.getsize(temp_filename),
+                "stored_size": os.path.getsize(path),
+                "rows": rows,
+            })
+            _write_json(BACKUP_MANIFEST, snapshots)
+            
+            # Nouvelle chaîne de sauvegardes incrémentales à partir de cet instantané
+            os.replace(temp_filename, BACKUP_HEAD)
+            index = _read_changesets()
+            index["head"] = {"snapshot": created, "last": None, "generations": generations}
+            _write_json(CHANGESET_INDEX, index)
+            
+            # Nettoyer les anciens backups (garder 30 jours)
+            cleanup_old_backups()
         
-        return backup_filename
+        return path
     except Exception as e:
         print(f"Erreur backup: {e}")
         return None
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+def _changeset_tables(conn):
+    """Tables suivies par les changesets : (nom, colonnes, clé), sqlite_sequence
+    en dernier (ses valeurs priment sur celles posées par les insertions)."""
+    tables = []
+    for (table,) in conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' ORDER BY name = 'sqlite_sequence', name"
+    ).fetchall():
+        info = conn.execute(f'PRAGMA main.table_info("{table}")').fetchall()
+        columns = [row[1] for row in info]
+        key = CHANGESET_KEYS.get(table) or [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+        tables.append((table, columns, key))
+    return tables
+
+def _diff(conn):
+    """Différences entre la base (main) et la copie de tête (h) : lignes
+    nouvelles ou modifiées, clés des lignes supprimées, par table."""
+    changes = {}
+    for table, columns, key in _changeset_tables(conn):
+        cols = ", ".join(f'"{c}"' for c in columns)
+        keys = ", ".join(f'"{c}"' for c in key)
+        upserts = conn.execute(
+            f'SELECT {cols} FROM main."{table}" EXCEPT SELECT {cols} FROM h."{table}"'
+        ).fetchall()
+        deletes = conn.execute(
+            f'SELECT {keys} FROM h."{table}" EXCEPT SELECT {keys} FROM main."{table}"'
+        ).fetchall()
+        if upserts or deletes:
+            changes[table] = {"columns": columns, "key": key, "upserts": upserts, "deletes": deletes}
+    return changes
+
+def _apply_changeset(conn, tables):
+    """Applique les différences d'un changeset, dans la transaction ouverte.
+
+    Les triggers sont retirés le temps de l'application puis recréés : les
+    lignes qu'ils maintiennent (classement, audit, générations) font
+    elles-mêmes partie du changeset.
+    """
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER "{name}"')
+    for table, change in tables.items():
+        columns, key = change["columns"], change["key"]
+        positions = [columns.index(c) for c in key]
+        where = " AND ".join(f'"{c}" IS ?' for c in key)
+        cols = ", ".join(f'"{c}"' for c in columns)
+        conn.executemany(
+            f'DELETE FROM "{table}" WHERE {where}',
+            change["deletes"] + [[row[i] for i in positions] for row in change["upserts"]],
+        )
+        conn.executemany(
+            f'INSERT INTO "{table}" ({cols}) VALUES ({", ".join("?" * len(columns))})',
+            change["upserts"],
+        )
+    for _, sql in triggers:
+        conn.execute(sql)
+
+def create_changeset():
+    """Sauvegarde incrémentale : lignes modifiées depuis la sauvegarde précédente.
+
+    La base est comparée, par clé primaire, à la copie de tête (état de la
+    dernière sauvegarde) ; les différences sont écrites dans
+    changesets/<id>.json.gz puis appliquées à la copie de tête. Rien n'est
+    écrit si les générations n'ont pas bougé. Sans copie de tête utilisable
+    (première sauvegarde, schéma migré, copie désynchronisée), une sauvegarde
+    complète est faite à la place.
+    Retourne le fichier écrit, ou None si rien n'a changé.
+    """
+    ensure_backup_dir()
+    with _store_lock:
+        index = _read_changesets()
+        head = index["head"]
+        snapshots = {s["created"] for s in _read_manifest()}
+        if head is None or head["snapshot"] not in snapshots or not os.path.exists(BACKUP_HEAD):
+            return create_backup(force=True)
+        
+        conn = sqlite3.connect(database.DB_NAME, isolation_level=None)
+        try:
+            conn.execute("ATTACH DATABASE ? AS h", (BACKUP_HEAD,))
+            # Transaction de lecture : différences calculées sur un état validé
+            conn.execute("BEGIN")
+            try:
+                generations = _generations(conn)
+                if generations == head["generations"]:
+                    return None
+                # Copie de tête restée à un autre état que celui de l'index
+                # (interruption), ou schéma migré depuis : repartir d'une complète
+                if _generations(conn, "h") != head["generations"] or _schema_sql(conn) != _schema_sql(conn, "h"):
+                    tables = None
+                else:
+                    tables = _diff(conn)
+                    rows = _row_counts(conn)
+            finally:
+                conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if tables is None:
+            return create_backup(force=True)
+        
+        created = datetime.now().isoformat()
+        changeset_id = created.replace("-", "").replace(":", "").replace(".", "_")
+        path = _changeset_path(changeset_id)
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump({"created": created, "snapshot": head["snapshot"], "parent": head["last"],
+                       "tables": tables, "rows": rows}, f)
+        
+        conn = sqlite3.connect(BACKUP_HEAD, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _apply_changeset(conn, tables)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                os.remove(path)
+                raise
+        finally:
+            conn.close()
+        
+        index["changesets"].append({
+            "id": changeset_id,
+            "created": created,
+            "snapshot": head["snapshot"],
+            "parent": head["last"],
+            "changes": {table: [len(c["upserts"]), len(c["deletes"])] for table, c in tables.items()},
+            "size": os.path.getsize(path),
+        })
+        index["head"] = {"snapshot": head["snapshot"], "last": changeset_id, "generations": generations}
+        _write_json(CHANGESET_INDEX, index)
+        return path
+
+def _extract_snapshot(snapshot_hash, destination):
+    """Décompresse un instantané du magasin et vérifie son empreinte."""
+    with gzip.open(_snapshot_path(snapshot_hash), "rb") as src, open(destination, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    if _file_hash(destination) != snapshot_hash:
+        raise ValueError(f"Instantané {snapshot_hash[:12]} altéré : empreinte différente")
+
+def _restore_file(path):
+    """Recopie une base dans la base ouverte par l'API de sauvegarde SQLite
+    (les autres sessions voient directement le nouveau contenu).
+
+    Le cache de requêtes est vidé et le schéma revérifié : un état ancien
+    peut précéder des migrations. Les générations sont ensuite portées
+    au-delà de leurs valeurs d'avant la restauration : recopiées telles
+    quelles, elles reculeraient et les caches qui en dépendent (PDF, index
+    des noms, changesets) serviraient un état périmé.
+    """
+    source = sqlite3.connect(path)
+    try:
+        with database.connection() as conn:
+            before = _generations(conn)
+            source.backup(conn)
+            database.forget_schema()
+            database.init_db()
+            with database.transaction():
+                conn.executemany(
+                    "UPDATE generations SET value = MAX(value, ?) + 1 WHERE name = ?",
+                    [(value, name) for name, value in before.items()],
+                )
+    finally:
+        source.close()
+    database.clear_query_cache()
+
+def restore_backup(snapshot_hash):
+    """Remplace le contenu de la base par un instantané du magasin."""
+    temp_filename = os.path.join(BACKUP_DIR, "restore.tmp")
+    try:
+        with _store_lock:
+            _extract_snapshot(snapshot_hash, temp_filename)
+            _restore_file(temp_filename)
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+def restore_point_in_time(point):
+    """Restaure la base dans son état à l'instant point (ISO, ex. "2026-10-18T14:30").
+
+    Part de la dernière sauvegarde complète antérieure et rejoue dans l'ordre
+    ses changesets jusqu'à point, en vérifiant le nombre de lignes après
+    chacun. Retourne l'horodatage de l'état restauré.
+    """
+    temp_filename = os.path.join(BACKUP_DIR, "restore.tmp")
+    try:
+        with _store_lock:
+            snapshots = [s for s in _read_manifest() if s["created"] <= point]
+            if not snapshots:
+                raise ValueError(f"Aucune sauvegarde antérieure au {point}")
+            snapshot = snapshots[-1]
+            chain = [
+                c for c in _read_changesets()["changesets"]
+                if c["snapshot"] == snapshot["created"] and c["created"] <= point
+            ]
+            
+            _extract_snapshot(snapshot["hash"], temp_filename)
+            conn = sqlite3.connect(temp_filename, isolation_level=None)
+            try:
+                parent = None
+                for entry in chain:
+                    if entry["parent"] != parent:
+                        raise ValueError(f"Changeset {entry['id']} : chaîne interrompue")
+                    with gzip.open(_changeset_path(entry["id"]), "rt", encoding="utf-8") as f:
+                        changeset = json.load(f)
+                    conn.execute("BEGIN")
+                    _apply_changeset(conn, changeset["tables"])
+                    rows = _row_counts(conn)
+                    if rows != changeset["rows"]:
+                        raise ValueError(f"Changeset {entry['id']} : {rows} au lieu de {changeset['rows']}")
+                    conn.execute("COMMIT")
+                    parent = entry["id"]
+            finally:
+                conn.close()
+            
+            _restore_file(temp_filename)
+        return chain[-1]["created"] if chain else snapshot["created"]
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+def _start(task, prepare=None):
+    """Lance task dans un thread d'arrière-plan et rend la main aussitôt.
+
+    prepare : appelée dans le thread avant task. Retourne le thread, ou None
+    si une sauvegarde est déjà en cours.
+    """
+    if not _backup_lock.acquire(blocking=False):
+        return None
+
+    def run():
+        try:
+            if prepare is not None:
+                prepare()
+            task()
+        except Exception as e:
+            print(f"Erreur backup: {e}")
+        finally:
+            _backup_lock.release()
+
+    thread = threading.Thread(target=run, name="backup", daemon=True)
+    thread.start()
+    return thread
+
+def start_backup(force=False, prepare=None):
+    """Lance create_backup en arrière-plan (prepare : ex. archivage de l'historique)."""
+    return _start(lambda: create_backup(force), prepare)
+
+def start_changeset():
+    """Lance create_changeset en arrière-plan."""
+    return _start(create_changeset)
+
+def should_take_changeset():
+    """Vrai si la dernière sauvegarde incrémentale lancée par ce processus
+    date de plus de CHANGESET_INTERVAL secondes."""
+    global _last_changeset_attempt
+    now = time.monotonic()
+    if _last_changeset_attempt is not None and now - _last_changeset_attempt < CHANGESET_INTERVAL:
+        return False
+    _last_changeset_attempt = now
+    return True
 
 def cleanup_old_backups(keep_days=30):
-    """Supprime les backups de plus de keep_days jours."""
+    """Supprime les backups de plus de keep_days jours.
+
+    Les instantanés sortent du manifeste, avec leurs changesets ; un fichier
+    du magasin n'est supprimé que s'il n'est plus référencé par aucun instantané.
+    """
     if not os.path.exists(BACKUP_DIR):
         return
     
-    cutoff_date = datetime.now().timestamp() - (keep_days * 24 * 3600)
+    cutoff = (date.today() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    with _store_lock:
+        snapshots = _read_manifest()
+        kept = [s for s in snapshots if s["date"] >= cutoff]
+        if len(kept) != len(snapshots):
+            _write_json(BACKUP_MANIFEST, kept)
+        referenced = {f"{s['hash']}.db.gz" for s in kept}
+        if os.path.exists(BACKUP_STORE):
+            for filename in os.listdir(BACKUP_STORE):
+                if filename.endswith(".db.gz") and filename not in referenced:
+                    os.remove(os.path.join(BACKUP_STORE, filename))
+        
+        index = _read_changesets()
+        created = {s["created"] for s in kept}
+        changesets = [c for c in index["changesets"] if c["snapshot"] in created]
+        if len(changesets) != len(index["changesets"]):
+            index["changesets"] = changesets
+            _write_json(CHANGESET_INDEX, index)
+        referenced = {f"{c['id']}.json.gz" for c in changesets}
+        if os.path.exists(CHANGESET_DIR):
+            for filename in os.listdir(CHANGESET_DIR):
+                if filename.endswith(".json.gz") and filename not in referenced:
+                    os.remove(os.path.join(CHANGESET_DIR, filename))
     
+    # Copies complètes d'avant le magasin (challenge_YYYY-MM-DD.db)
+    cutoff_date = datetime.now().timestamp() - (keep_days * 24 * 3600)
     for filename in os.listdir(BACKUP_DIR):
         if filename.startswith("challenge_") and filename.endswith(".db"):
             filepath = os.path.join(BACKUP_DIR, filename)
@@ -57,37 +505,22 @@ def cleanup_old_backups(keep_days=30):
 def should_backup_today():
     """Vérifie si un backup est nécessaire aujourd'hui."""
     today = date.today().strftime("%Y-%m-%d")
-    backup_filename = f"{BACKUP_DIR}/challenge_{today}.db"
-    return not os.path.exists(backup_filename)
+    return all(snapshot["date"] != today for snapshot in _read_manifest())
 
 def get_backup_status():
-    """Retourne le statut des sauvegardes."""
-    ensure_backup_dir()
-    
+    """Retourne le statut des sauvegardes (lu dans les manifestes)."""
+    changesets = {}
+    for c in _read_changesets()["changesets"]:
+        changesets[c["snapshot"]] = changesets.get(c["snapshot"], 0) + 1
     backups = []
-    if os.path.exists(BACKUP_DIR):
-        for filename in os.listdir(BACKUP_DIR):
-            if filename.startswith("challenge_") and filename.endswith(".db"):
-                filepath = os.path.join(BACKUP_DIR, filename)
-                size = os.path.getsize(filepath)
-                
-                # Extraire la date du nom de fichier (challenge_YYYY-MM-DD.db)
-                try:
-                    date_str = filename.replace("challenge_", "").replace(".db", "")
-                    file_date = datetime.strptime(date_str, "%Y-%m-%d")
-                    date_display = file_date.strftime("%d/%m/%Y")
-                except:
-                    date_display = "?"
-                
-                # Heure de modification pour plus de précision
-                mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
-                time_display = mtime.strftime("%H:%M")
-                
-                backups.append({
-                    "filename": filename,
-                    "date": f"{date_display} à {time_display}",
-                    "size": f"{size // 1024} Ko"
-                })
-    
-    backups.sort(key=lambda x: x["filename"], reverse=True)
-    return backups[:10]  # 10 derniers backups
\ No newline at end of file
+    for snapshot in reversed(_read_manifest()):
+        created = datetime.fromisoformat(snapshot["created"])
+        backups.append({
+            "filename": f"challenge_{snapshot['date']}",
+            "date": created.strftime("%d/%m/%Y à %H:%M"),
+            "size": f"{snapshot['size'] // 1024} Ko, {snapshot['stored_size'] // 1024} Ko compressé",
+            "hash": snapshot["hash"],
+            "rows": snapshot["rows"],
+            "changesets": changesets.get(snapshot["created"], 0),
+        })
+    return backups[:10]  # 10 derniers backups
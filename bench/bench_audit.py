@@ -0,0 +1,78 @@
+"""Mesure des modifications de points par seconde, audit compris.
+
+Sur une copie de challenge.db, compare :
+- avant : lecture des anciens points, mise à jour validée, puis écriture de
+  l'audit dans une seconde transaction (deux commits par modification) ;
+- après : update_result_points_by_id, audit écrit dans la même transaction.
+
+La mesure est faite avec synchronous=NORMAL (réglage du pool) et FULL, puis
+pour l'écriture de lignes d'audit une à une ou par audit.log_modifications.
+
+    python bench/bench_audit.py [--modifications 500] [--lignes 2000]
+"""
+
+import argparse
+import time
+
+from commun import base_de_travail, chrono
+
+import audit
+import database
+
+
+def ancienne_modification(result_id, new_points):
+    """Modification d'avant : audit écrit après coup, dans sa propre transaction."""
+    with database.connection() as conn:
+        old_points = conn.execute("SELECT points FROM resultats WHERE id = ?", (result_id,)).fetchone()[0]
+    with database.transaction() as conn:
+        conn.execute("UPDATE resultats SET points = ? WHERE id = ?", (new_points, result_id))
+    audit.log_modification("UPDATE", "resultats", result_id, {"points": old_points}, {"points": new_points})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modifications", type=int, default=500)
+    parser.add_argument("--lignes", type=int, default=2000)
+    args = parser.parse_args()
+
+    base_de_travail()
+    with database.connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM resultats ORDER BY id LIMIT 50")]
+
+    def parcours(modifier):
+        compteur = iter(range(args.modifications))
+
+        def une_modification():
+            i = next(compteur)
+            modifier(ids[i % len(ids)], 10 + i % 7)
+        return une_modification
+
+    synchronous = database.PRAGMAS["synchronous"]
+    for mode in ("NORMAL", "FULL"):
+        database.PRAGMAS["synchronous"] = mode
+        database.close_all()
+        # Avant : pas de triggers d'audit, l'audit est écrit explicitement
+        with database.transaction() as conn:
+            conn.execute("UPDATE config SET value = 0 WHERE name = 'audit'")
+        avant = chrono(parcours(ancienne_modification), args.modifications)
+        with database.transaction() as conn:
+            conn.execute("UPDATE config SET value = 1 WHERE name = 'audit'")
+        apres = chrono(parcours(database.update_result_points_by_id), args.modifications)
+        print(f"synchronous={mode:6} {1000 / avant:6.0f} -> {1000 / apres:6.0f} modifications/s")
+    database.PRAGMAS["synchronous"] = synchronous
+    database.close_all()
+
+    records = [("UPDATE", "resultats", i, {"points": 1}, {"points": 2}) for i in range(args.lignes)]
+    debut = time.perf_counter()
+    for record in records:
+        audit.log_modification(*record)
+    une_a_une = time.perf_counter() - debut
+    debut = time.perf_counter()
+    audit.log_modifications(records)
+    groupees = time.perf_counter() - debut
+    print(f"{args.lignes} lignes d'audit : {une_a_une * 1000:.0f} ms une à une, "
+          f"{groupees * 1000:.0f} ms avec log_modifications")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Mesure du coût des connexions SQLite (pool de database.connection()).
+
+Sur une copie de challenge.db, compare :
+- avant : POOL_SIZE = 0, chaque appel ouvre sa connexion (pragmas compris)
+  puis la ferme, comme les anciens get_connection() ;
+- après : connexions réutilisées par le pool.
+
+Deux parcours sont mesurés : les lectures de la page Classement (cache de
+requêtes vidé à chaque itération) et update_result_points_by_id.
+
+    python bench/bench_connexions.py [--iterations 200]
+"""
+
+import argparse
+
+from commun import base_de_travail, chrono
+
+import database
+import ranking
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    base_de_travail()
+    with database.connection() as conn:
+        challenge_id, circuit = conn.execute("""
+            SELECT co.challenge_id, co.circuit FROM resultats r JOIN courses co ON co.id = r.course_id
+            WHERE co.challenge_id IS NOT NULL GROUP BY 1, 2 ORDER BY count(*) DESC LIMIT 1
+        """).fetchone()
+        result_id, points = conn.execute("SELECT id, points FROM resultats ORDER BY id LIMIT 1").fetchone()
+
+    def page_classement():
+        database.clear_query_cache()
+        database.has_results()
+        database.get_challenges()
+        ranking.compute_circuit_rankings(challenge_id, circuit)
+
+    edition = iter(range(args.iterations * 4))
+
+    def modification_points():
+        database.update_result_points_by_id(result_id, points + next(edition) % 2)
+
+    parcours = [
+        ("lectures de la page Classement", page_classement),
+        ("update_result_points_by_id", modification_points),
+        ("get_challenges", database.get_challenges),
+    ]
+    pool_size = database.POOL_SIZE
+    for libelle, fn in parcours:
+        database.POOL_SIZE = 0
+        database.close_all()
+        avant = chrono(fn, args.iterations)
+        database.POOL_SIZE = pool_size
+        apres = chrono(fn, args.iterations)
+        print(f"{libelle:32} {avant:7.3f} ms -> {apres:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
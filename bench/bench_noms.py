@@ -0,0 +1,134 @@
+"""Mesure du rapprochement des noms à l'import (importer.NameIndex).
+
+Génère une base de 50 000 coureurs et un fichier d'import de 2 000 lignes à
+deux coéquipiers (noms existants, noms existants avec une faute de frappe,
+nouveaux noms), puis compare :
+- avant : process.extractOne sur tous les coureurs pour chaque nom, mesuré
+  sur un échantillon et extrapolé (l'import complet prend plusieurs minutes) ;
+- après : construction de l'index puis importer.match_names sur tous les noms.
+
+Les statuts et propositions de l'échantillon doivent être identiques.
+
+    python bench/bench_noms.py [--coureurs 50000] [--lignes 2000] [--echantillon 100]
+"""
+
+import argparse
+import random
+import string
+import time
+from collections import Counter
+
+import pandas as pd
+from commun import base_de_travail
+
+import database
+import importer
+import utils
+from thefuzz import fuzz, process
+
+PRENOMS = [
+    "Alice", "Antoine", "Camille", "Chloé", "Claire", "Clément", "Damien", "Élise", "Emma", "Étienne",
+    "Fanny", "Florian", "Gaëlle", "Guillaume", "Hélène", "Hugo", "Inès", "Jean", "Julie", "Julien",
+    "Léa", "Léo", "Louise", "Lucas", "Manon", "Marc", "Marie", "Mathieu", "Nathalie", "Nicolas",
+    "Noémie", "Olivier", "Pauline", "Pierre", "Quentin", "Romain", "Sarah", "Sébastien", "Sophie", "Thomas",
+]
+SYLLABES = [
+    "ber", "bou", "cha", "dar", "del", "dou", "fer", "gal", "gou", "her", "jar", "ker", "la", "le",
+    "lou", "mar", "mau", "mon", "nel", "per", "pi", "quen", "ra", "ri", "rou", "san", "ta", "ter",
+    "tin", "val", "vi", "zel",
+]
+
+
+def nom_de_famille(rng):
+    return "".join(rng.choice(SYLLABES) for _ in range(rng.randint(2, 4))).upper()
+
+
+def faute_de_frappe(rng, nom):
+    """Remplace une lettre du nom de famille."""
+    prenom, famille = nom.rsplit(" ", 1)
+    i = rng.randrange(len(famille))
+    return f"{prenom} {famille[:i]}{rng.choice(string.ascii_uppercase)}{famille[i + 1:]}"
+
+
+def generer_coureurs(rng, nombre):
+    noms = set()
+    while len(noms) < nombre:
+        noms.add(f"{rng.choice(PRENOMS)} {nom_de_famille(rng)}")
+    return sorted(noms)
+
+
+def generer_fichier(rng, existants, lignes):
+    """Fichier d'import : 50 % de noms existants, 15 % avec une faute, 35 % nouveaux."""
+    def coequipier():
+        tirage = rng.random()
+        if tirage < 0.5:
+            nom = rng.choice(existants)
+        elif tirage < 0.65:
+            nom = faute_de_frappe(rng, rng.choice(existants))
+        else:
+            nom = f"{rng.choice(PRENOMS)} {nom_de_famille(rng)}"
+        return nom.rsplit(" ", 1)
+
+    rows = []
+    for rang in range(1, lignes + 1):
+        (p1, n1), (p2, n2) = coequipier(), coequipier()
+        rows.append({"Clt": rang, "Catégorie": rng.choice(["Homme", "Femme", "Mixte"]),
+                     "Prénom 1": p1, "Nom 1": n1, "Prénom 2": p2, "Nom 2": n2})
+    return rows
+
+
+def ancien_rapprochement(name, existing_names):
+    """Rapprochement d'avant l'index : meilleur score sur tous les coureurs."""
+    best_match, score = process.extractOne(name, existing_names, scorer=fuzz.token_sort_ratio)
+    if score == importer.SCORE_EXACT:
+        return "exact", best_match
+    if score >= importer.SCORE_CONFLICT:
+        return "conflict", best_match
+    return "new", None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--coureurs", type=int, default=50_000)
+    parser.add_argument("--lignes", type=int, default=2_000)
+    parser.add_argument("--echantillon", type=int, default=100)
+    parser.add_argument("--graine", type=int, default=2025)
+    args = parser.parse_args()
+    rng = random.Random(args.graine)
+
+    base_de_travail(copier=False)
+    coureurs = generer_coureurs(rng, args.coureurs)
+    database.import_results("Génération", "2025-01-01", "raideur", None, [
+        (nom, True, utils.UNRANKED_RANK, 1, None, None) for nom in coureurs
+    ])
+    existing_names = [name for _, name in database.get_all_coureurs()]
+
+    df = pd.DataFrame(generer_fichier(rng, coureurs, args.lignes))
+    mappings = [{"mode": "split", "prenom": f"Prénom {i}", "nom": f"Nom {i}"} for i in (1, 2)]
+    names = importer.extract_participants(df, mappings)["full_name"].unique()
+    print(f"{len(existing_names)} coureurs, {len(df)} lignes, {len(names)} noms distincts")
+
+    inconnus = [name for name in names if name not in set(existing_names)]
+    echantillon = rng.sample(inconnus, min(args.echantillon, len(inconnus)))
+    debut = time.perf_counter()
+    avant = {name: ancien_rapprochement(name, existing_names) for name in echantillon}
+    par_nom = (time.perf_counter() - debut) / len(echantillon)
+    print(f"avant : {par_nom * 1000:.0f} ms par nom inconnu, "
+          f"~{par_nom * len(inconnus):.0f} s pour l'import")
+
+    debut = time.perf_counter()
+    name_index = importer.NameIndex(existing_names)
+    construction = time.perf_counter() - debut
+    debut = time.perf_counter()
+    importer.match_names(names, name_index)
+    rapprochement = time.perf_counter() - debut
+    print(f"après : index construit en {construction:.1f} s (mis en cache), "
+          f"rapprochement en {rapprochement:.1f} s")
+
+    ecarts = [name for name in echantillon if name_index.match(name)[:2] != avant[name]]
+    statuts = Counter(status for status, _ in avant.values())
+    print(f"échantillon de {len(echantillon)} noms ({dict(statuts)}) : {len(ecarts)} écart(s)")
+
+
+if __name__ == "__main__":
+    main()
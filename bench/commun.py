@@ -0,0 +1,36 @@
+"""Outils partagés des scripts de mesure (bench/) : base de travail jetable
+et chronométrage."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+import database  # noqa: E402
+
+
+def base_de_travail(copier=True):
+    """Pointe database sur une base d'un dossier temporaire : copie de
+    challenge.db, ou base vide si copier est faux. Retourne son chemin."""
+    dossier = tempfile.mkdtemp(prefix="bench_")
+    chemin = os.path.join(dossier, "challenge.db")
+    if copier:
+        shutil.copy(os.path.join(RACINE, "challenge.db"), chemin)
+    os.chdir(dossier)
+    database.close_all()
+    database.DB_NAME = chemin
+    database.clear_query_cache()
+    database.init_db()
+    return chemin
+
+
+def chrono(fn, iterations):
+    """Durée moyenne d'un appel de fn, en millisecondes."""
+    debut = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - debut) * 1000 / iterations
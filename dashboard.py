@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import database
 import audit
+import ranking
 from datetime import datetime, timedelta
 import backup
 
@@ -61,34 +62,30 @@ def show_simple_summary():
 def show_current_rankings():
     st.subheader("🏆 Classements actuels")
     
-    # Sélection du circuit
+    challenges = database.get_challenges()
+    if not challenges:
+        st.info("Aucun challenge enregistré")
+        return
+    ch_map = {c["id"]: c["range"] for c in challenges}
+    
+    # Sélection du challenge et du circuit
     circuits = database.run_query("SELECT DISTINCT circuit FROM courses ORDER BY circuit")['circuit'].tolist()
     
     if not circuits:
         st.info("Aucun raid enregistré")
         return
     
-    selected_circuit = st.selectbox("Choisir un circuit :", circuits, key="dashboard_circuit")
+    col1, col2 = st.columns(2)
+    with col1:
+        selected_ch_id = st.selectbox("Choisir un challenge :", options=list(ch_map.keys()), format_func=lambda x: ch_map[x], key="dashboard_challenge")
+    with col2:
+        selected_circuit = st.selectbox("Choisir un circuit :", circuits, key="dashboard_circuit")
     
-    # Classement général pour ce circuit
-    ranking = database.run_query(f"""
-        SELECT 
-            c.nom_complet as "Nom",
-            r.categorie_course as "Catégorie",
-            SUM(r.points) as "Total Points",
-            COUNT(*) as "Nb Raids",
-            ROUND(AVG(r.points), 1) as "Moyenne"
-        FROM coureurs c
-        JOIN resultats r ON c.id = r.coureur_id
-        JOIN courses co ON r.course_id = co.id
-        WHERE co.circuit = '{selected_circuit}'
-        GROUP BY c.id, r.categorie_course
-        ORDER BY "Total Points" DESC
-        LIMIT 20
-    """)
+    # Classement général pour ce circuit (même moteur que la page Classement)
+    ranking_table = ranking.compute_circuit_rankings(selected_ch_id, selected_circuit)["Toutes"]
     
-    if not ranking.empty:
-        st.dataframe(ranking, use_container_width=True, hide_index=True)
+    if not ranking_table.empty:
+        st.dataframe(ranking_table.head(20), use_container_width=True, hide_index=True)
     else:
         st.info(f"Aucun résultat pour le circuit {selected_circuit}")
     
@@ -114,9 +111,6 @@ def show_current_rankings():
 def show_modification_history():
     st.subheader("📝 Historique des modifications")
     
-    # Initialiser l'audit log si nécessaire
-    audit.init_audit_log()
-    
     tab1, tab2 = st.tabs(["Modifications récentes", "Changements de points"])
     
     with tab1:
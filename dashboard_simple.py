@@ -141,9 +141,6 @@ def show_detailed_stats():
 def show_modification_history():
     st.subheader("📝 Historique des modifications")
     
-    # Initialiser l'audit log si nécessaire
-    audit.init_audit_log()
-    
     tab1, tab2 = st.tabs(["Modifications récentes", "Changements de points"])
     
     with tab1:
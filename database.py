@@ -1,44 +1,168 @@
+import json
 import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 import pandas as pd
+import utils
 
 DB_NAME = "challenge.db"
 
-
-def get_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON;")
+# Pragmas appliqués à chaque nouvelle connexion du pool.
+# Modifier ce dictionnaire puis appeler close_all() pour les réappliquer.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "cache_size": -16000,  # en Kio (~16 Mo)
+    "mmap_size": 64 * 1024 * 1024,
+    "busy_timeout": 5000,  # en ms
+}
+
+# Nombre maximum de connexions inactives conservées dans le pool
+POOL_SIZE = 4
+
+_pool = []
+_pool_db = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+# Base dont le schéma est à jour pour ce processus (init_db ne refait alors rien)
+_schema_ready = None
+
+# Cache LRU des lectures (run_query et helpers renvoyant des tuples), indexé
+# par requête + paramètres + générations : toute écriture, quelle que soit la
+# session, change la clé et rend les anciennes entrées inaccessibles.
+QUERY_CACHE_SIZE = 256
+query_cache_stats = {"hits": 0, "misses": 0}
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def _open_connection(db_name):
+    # isolation_level=None : autocommit, les transactions sont gérées par transaction()
+    conn = sqlite3.connect(db_name, isolation_level=None, check_same_thread=False)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    # Filtre de catégorie utilisable en SQL : categorie_match(categorie_course, 'Homme')
+    conn.create_function("categorie_match", 2, utils.check_category_match, deterministic=True)
     return conn
 
 
-def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
+def _acquire():
+    global _pool_db
+    with _pool_lock:
+        if _pool_db != DB_NAME:
+            # La base a changé (tests, restauration) : on repart d'un pool vide
+            _close_pooled()
+            _pool_db = DB_NAME
+        db_name = _pool_db
+        if _pool:
+            return db_name, _pool.pop()
+    return db_name, _open_connection(db_name)
+
+
+def _release(db_name, conn):
+    with _pool_lock:
+        if db_name == _pool_db and len(_pool) < POOL_SIZE:
+            _pool.append(conn)
+            return
+    conn.close()
+
+
+def _close_pooled():
+    while _pool:
+        _pool.pop().close()
+
+
+def close_all():
+    """Ferme les connexions inactives du pool (ex: après modification des PRAGMAS)."""
+    with _pool_lock:
+        _close_pooled()
+
+
+@contextmanager
+def connection():
+    """Fournit une connexion du pool.
+
+    Les appels imbriqués dans un même thread réutilisent la même connexion,
+    ce qui permet de grouper plusieurs helpers dans une seule transaction.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
+    db_name, conn = _acquire()
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        _release(db_name, conn)
+
+
+@contextmanager
+def transaction():
+    """Exécute le bloc dans une transaction (commit à la sortie, rollback sur erreur).
+
+    Une transaction ouverte à l'intérieur d'une autre est absorbée par celle-ci.
+    """
+    with connection() as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
 
-    cursor.execute("""
+
+def _execute_script(conn, script):
+    """Exécute un script SQL multi-instructions dans la transaction courante.
+
+    (conn.executescript() forcerait un COMMIT préalable.)
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+
+def _migration_1(conn):
+    """Schéma initial : tables historiques de l'application."""
+    _execute_script(conn, """
     CREATE TABLE IF NOT EXISTS coureurs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         nom_complet TEXT UNIQUE NOT NULL,
         genre TEXT,
         categorie_age TEXT
-    )
-    """)
+    );
+
+    CREATE TABLE IF NOT EXISTS challenges (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom TEXT UNIQUE NOT NULL,
+        start_year INTEGER,
+        end_year INTEGER
+    );
 
-    cursor.execute("""
     CREATE TABLE IF NOT EXISTS courses (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         nom_course TEXT NOT NULL,
         date TEXT,
-        circuit TEXT NOT NULL
-    )
-    """)
+        circuit TEXT NOT NULL,
+        challenge_id INTEGER REFERENCES challenges(id)
+    );
 
-    # Ajout de la colonne challenge_id si elle n'existe pas (pour la migration)
-    try:
-        cursor.execute("ALTER TABLE courses ADD COLUMN challenge_id INTEGER REFERENCES challenges(id)")
-    except sqlite3.OperationalError:
-        pass
-
-    cursor.execute("""
     CREATE TABLE IF NOT EXISTS resultats (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         course_id INTEGER NOT NULL,
@@ -48,102 +172,849 @@ def init_db():
         categorie_course TEXT,
         FOREIGN KEY (course_id) REFERENCES courses (id),
         FOREIGN KEY (coureur_id) REFERENCES coureurs (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        action TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        record_id INTEGER,
+        old_values TEXT,
+        new_values TEXT,
+        user_info TEXT
+    );
+    """)
+
+    # Anciennes bases : la table courses a été créée sans challenge_id
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(courses)")]
+    if "challenge_id" not in columns:
+        conn.execute("ALTER TABLE courses ADD COLUMN challenge_id INTEGER REFERENCES challenges(id)")
+
+
+def _migration_2(conn):
+    """Index pour les jointures du classement, de l'édition et de l'audit."""
+    _execute_script(conn, """
+    CREATE INDEX IF NOT EXISTS idx_resultats_course_coureur ON resultats (course_id, coureur_id);
+    CREATE INDEX IF NOT EXISTS idx_resultats_coureur ON resultats (coureur_id);
+    CREATE INDEX IF NOT EXISTS idx_courses_challenge_circuit_date ON courses (challenge_id, circuit, date);
+    CREATE INDEX IF NOT EXISTS idx_audit_log_table_action_ts ON audit_log (table_name, action, timestamp);
+    """)
+    conn.execute("ANALYZE")
+
+
+def _standings_refresh_key(course, coureur, categorie):
+    """SQL recalculant la ligne de standings d'un coureur/catégorie pour le
+    challenge et le circuit du raid `course` (expressions NEW.x / OLD.x)."""
+    return f"""
+    DELETE FROM standings
+    WHERE (challenge_id, circuit) = (SELECT challenge_id, circuit FROM courses WHERE id = {course})
+      AND coureur_id = {coureur} AND categorie = {categorie};
+    INSERT INTO standings (challenge_id, circuit, coureur_id, categorie, total, nb_raids, points_par_raid)
+    SELECT k.challenge_id, k.circuit, {coureur}, {categorie},
+           SUM(p.points), COUNT(*), json_group_object(p.course_id, p.points)
+    FROM courses k
+    JOIN (
+        SELECT r.course_id, c.challenge_id, c.circuit, SUM(r.points) AS points
+        FROM resultats r
+        JOIN courses c ON c.id = r.course_id
+        WHERE r.coureur_id = {coureur} AND r.categorie_course = {categorie}
+        GROUP BY r.course_id
+    ) p ON p.challenge_id = k.challenge_id AND p.circuit = k.circuit
+    WHERE k.id = {course}
+    GROUP BY k.challenge_id, k.circuit;
+    """
+
+
+def _standings_refresh_course(challenge, circuit, course):
+    """SQL recalculant, pour un challenge/circuit, les lignes de standings de
+    tous les coureurs ayant un résultat sur le raid `course`."""
+    return f"""
+    DELETE FROM standings
+    WHERE challenge_id = {challenge} AND circuit = {circuit}
+      AND (coureur_id, categorie) IN (SELECT coureur_id, categorie_course FROM resultats WHERE course_id = {course});
+    INSERT INTO standings (challenge_id, circuit, coureur_id, categorie, total, nb_raids, points_par_raid)
+    SELECT {challenge}, {circuit}, p.coureur_id, p.categorie_course,
+           SUM(p.points), COUNT(*), json_group_object(p.course_id, p.points)
+    FROM (
+        SELECT r.coureur_id, r.categorie_course, r.course_id, SUM(r.points) AS points
+        FROM resultats r
+        JOIN courses c ON c.id = r.course_id
+        WHERE c.challenge_id = {challenge} AND c.circuit = {circuit}
+          AND (r.coureur_id, r.categorie_course) IN (SELECT coureur_id, categorie_course FROM resultats WHERE course_id = {course})
+        GROUP BY r.coureur_id, r.categorie_course, r.course_id
+    ) p
+    GROUP BY p.coureur_id, p.categorie_course;
+    """
+
+
+# Écriture de masse en cours (config 'bulk') : la maintenance ligne à ligne
+# de standings est suspendue, voir _bulk_standings()
+_NOT_BULK = "NOT EXISTS (SELECT 1 FROM config WHERE name = 'bulk' AND value = 1)"
+
+# Maintien incrémental de la table standings à chaque écriture
+STANDINGS_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS trg_standings_resultats_insert AFTER INSERT ON resultats
+WHEN {_NOT_BULK}
+BEGIN
+    {_standings_refresh_key("NEW.course_id", "NEW.coureur_id", "NEW.categorie_course")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_standings_resultats_delete AFTER DELETE ON resultats
+WHEN {_NOT_BULK}
+BEGIN
+    {_standings_refresh_key("OLD.course_id", "OLD.coureur_id", "OLD.categorie_course")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_standings_resultats_update
+AFTER UPDATE OF course_id, coureur_id, points, categorie_course ON resultats
+WHEN {_NOT_BULK}
+BEGIN
+    {_standings_refresh_key("OLD.course_id", "OLD.coureur_id", "OLD.categorie_course")}
+    {_standings_refresh_key("NEW.course_id", "NEW.coureur_id", "NEW.categorie_course")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_standings_courses_update
+AFTER UPDATE OF challenge_id, circuit ON courses
+BEGIN
+    {_standings_refresh_course("OLD.challenge_id", "OLD.circuit", "NEW.id")}
+    {_standings_refresh_course("NEW.challenge_id", "NEW.circuit", "NEW.id")}
+END;
+"""
+
+# Agrégat de référence (raid par raid) dont standings est la copie matérialisée
+_STANDINGS_SOURCE = """
+SELECT c.challenge_id, c.circuit, r.coureur_id, r.categorie_course AS categorie,
+       r.course_id, SUM(r.points) AS points
+FROM resultats r
+JOIN courses c ON c.id = r.course_id
+WHERE c.challenge_id IS NOT NULL AND r.categorie_course IS NOT NULL
+GROUP BY c.challenge_id, c.circuit, r.coureur_id, r.categorie_course, r.course_id
+"""
+
+
+def _migration_3(conn):
+    """Table standings : classement matérialisé par challenge/circuit/coureur/catégorie."""
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS standings (
+        challenge_id INTEGER NOT NULL,
+        circuit TEXT NOT NULL,
+        coureur_id INTEGER NOT NULL,
+        categorie TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        nb_raids INTEGER NOT NULL,
+        points_par_raid TEXT NOT NULL,  -- JSON {course_id: points}
+        PRIMARY KEY (challenge_id, circuit, coureur_id, categorie)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_standings_total ON standings (challenge_id, circuit, total DESC);
+    """)
+    _execute_script(conn, STANDINGS_TRIGGERS)
+    _rebuild_standings(conn)
+
+
+# Tables dont toute écriture incrémente la génération "data" (invalidation des caches)
+VERSIONED_TABLES = ["resultats", "courses", "coureurs", "challenges"]
+
+
+def _migration_4(conn):
+    """Compteur de génération des données, incrémenté par trigger à chaque écriture."""
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS generations (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO generations (name, value) VALUES ('data', 0);
+    """)
+    for table in VERSIONED_TABLES:
+        for action in ["INSERT", "UPDATE", "DELETE"]:
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_generation_{table}_{action.lower()} AFTER {action} ON {table}
+            BEGIN
+                UPDATE generations SET value = value + 1 WHERE name = 'data';
+            END
+            """)
+
+
+def _migration_5(conn):
+    """Clé de nom normalisée (utils.name_key) pour le rapprochement exact des coureurs.
+
+    Une clé partagée par plusieurs coureurs existants est ambiguë : elle reste
+    NULL pour eux et ces noms passent par le rapprochement approché.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(coureurs)")]
+    if "name_key" not in columns:
+        conn.execute("ALTER TABLE coureurs ADD COLUMN name_key TEXT")
+    keys = {id_: utils.name_key(nom) for id_, nom in conn.execute("SELECT id, nom_complet FROM coureurs")}
+    counts = Counter(keys.values())
+    conn.executemany(
+        "UPDATE coureurs SET name_key = ? WHERE id = ?",
+        [(key, id_) for id_, key in keys.items() if key and counts[key] == 1],
     )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_coureurs_name_key ON coureurs (name_key)")
+
+
+def _migration_6(conn):
+    """Génération "audit", incrémentée à chaque écriture dans audit_log."""
+    conn.execute("INSERT OR IGNORE INTO generations (name, value) VALUES ('audit', 0)")
+    for action in ["INSERT", "UPDATE", "DELETE"]:
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_generation_audit_log_{action.lower()} AFTER {action} ON audit_log
+        BEGIN
+            UPDATE generations SET value = value + 1 WHERE name = 'audit';
+        END
+        """)
+
+
+# Points maximum d'un résultat (barème : 35 points pour le 1er)
+MAX_POINTS = 35
+
+# Types de problèmes suivis dans data_issues (record_id : coureur ou résultat)
+ISSUE_KINDS = ["nom_invalide", "doublon", "points_aberrants"]
+
+
+def _invalid_name_sql(col):
+    """Condition SQL d'un nom de coureur invalide (vide, 'nan'...)."""
+    return f"""({col} IS NULL OR {col} = '' OR
+        LOWER(TRIM({col})) = 'nan' OR LOWER(TRIM({col})) = 'nan nan' OR
+        LOWER({col}) LIKE 'nan %' OR LOWER({col}) LIKE '% nan' OR LOWER({col}) LIKE '% nan %')"""
+
+
+def _issues_refresh_pair(course, coureur):
+    """SQL recalculant les doublons d'un couple course/coureur."""
+    return f"""
+    DELETE FROM data_issues WHERE kind = 'doublon' AND record_id IN (
+        SELECT id FROM resultats WHERE course_id = {course} AND coureur_id = {coureur});
+    INSERT OR IGNORE INTO data_issues (kind, record_id)
+    SELECT 'doublon', id FROM resultats
+    WHERE course_id = {course} AND coureur_id = {coureur}
+      AND (SELECT COUNT(*) FROM resultats WHERE course_id = {course} AND coureur_id = {coureur}) > 1;
+    """
+
+
+def _issues_refresh_result(row):
+    """SQL recalculant les points aberrants du résultat row (NEW)."""
+    return f"""
+    DELETE FROM data_issues WHERE kind = 'points_aberrants' AND record_id = {row}.id;
+    INSERT OR IGNORE INTO data_issues (kind, record_id)
+    SELECT 'points_aberrants', {row}.id WHERE {row}.points > {MAX_POINTS};
+    """
+
+
+# Triggers tenant data_issues à jour à chaque écriture
+DATA_ISSUES_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS trg_issues_coureurs_insert AFTER INSERT ON coureurs
+WHEN {_invalid_name_sql("NEW.nom_complet")}
+BEGIN
+    INSERT OR IGNORE INTO data_issues (kind, record_id) VALUES ('nom_invalide', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_issues_coureurs_update AFTER UPDATE OF nom_complet ON coureurs
+BEGIN
+    DELETE FROM data_issues WHERE kind = 'nom_invalide' AND record_id = OLD.id;
+    INSERT OR IGNORE INTO data_issues (kind, record_id)
+    SELECT 'nom_invalide', NEW.id WHERE {_invalid_name_sql("NEW.nom_complet")};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_issues_coureurs_delete AFTER DELETE ON coureurs
+BEGIN
+    DELETE FROM data_issues WHERE kind = 'nom_invalide' AND record_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_issues_resultats_insert AFTER INSERT ON resultats
+BEGIN
+    {_issues_refresh_result("NEW")}
+    {_issues_refresh_pair("NEW.course_id", "NEW.coureur_id")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_issues_resultats_points
+AFTER UPDATE OF points ON resultats
+WHEN OLD.points > {MAX_POINTS} OR NEW.points > {MAX_POINTS}
+BEGIN
+    {_issues_refresh_result("NEW")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_issues_resultats_pair
+AFTER UPDATE OF course_id, coureur_id ON resultats
+BEGIN
+    DELETE FROM data_issues WHERE kind = 'doublon' AND record_id = OLD.id;
+    {_issues_refresh_pair("OLD.course_id", "OLD.coureur_id")}
+    {_issues_refresh_pair("NEW.course_id", "NEW.coureur_id")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_issues_resultats_delete AFTER DELETE ON resultats
+BEGIN
+    DELETE FROM data_issues WHERE kind IN ('doublon', 'points_aberrants') AND record_id = OLD.id;
+    {_issues_refresh_pair("OLD.course_id", "OLD.coureur_id")}
+END;
+"""
+
+
+# Recalcul complet de référence dont data_issues est la copie incrémentale
+_DATA_ISSUES_SOURCE = f"""
+SELECT 'nom_invalide' AS kind, id AS record_id FROM coureurs WHERE {_invalid_name_sql("nom_complet")}
+UNION ALL
+SELECT 'points_aberrants', id FROM resultats WHERE points > {MAX_POINTS}
+UNION ALL
+SELECT 'doublon', r.id
+FROM resultats r
+JOIN (
+    SELECT course_id, coureur_id FROM resultats
+    GROUP BY course_id, coureur_id HAVING COUNT(*) > 1
+) d ON d.course_id = r.course_id AND d.coureur_id = r.coureur_id
+"""
+
+
+def _rebuild_data_issues(conn):
+    conn.execute("DELETE FROM data_issues")
+    conn.execute(f"INSERT INTO data_issues (kind, record_id) {_DATA_ISSUES_SOURCE}")
+
+
+def _migration_7(conn):
+    """Table data_issues : problèmes de données suivis au fil des écritures."""
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS data_issues (
+        kind TEXT NOT NULL,
+        record_id INTEGER NOT NULL,
+        PRIMARY KEY (kind, record_id)
+    ) WITHOUT ROWID;
     """)
+    _execute_script(conn, DATA_ISSUES_TRIGGERS)
+    _rebuild_data_issues(conn)
 
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS challenges (
+
+def _migration_8(conn):
+    """Table bareme : points par rang (copie de utils.calculate_points)."""
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS bareme (
+        rang INTEGER PRIMARY KEY,
+        points INTEGER NOT NULL
+    );
+    """)
+    conn.executemany(
+        "INSERT OR REPLACE INTO bareme (rang, points) VALUES (?, ?)",
+        [(rang, utils.calculate_points(rang)) for rang in range(1, 31)],
+    )
+
+
+def _migration_9(conn):
+    """Table config (interrupteurs lus par les triggers) et triggers de
+    standings suspendus pendant les écritures de masse."""
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS config (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO config (name, value) VALUES ('bulk', 0);
+    DROP TRIGGER IF EXISTS trg_standings_resultats_insert;
+    DROP TRIGGER IF EXISTS trg_standings_resultats_delete;
+    DROP TRIGGER IF EXISTS trg_standings_resultats_update;
+    """)
+    _execute_script(conn, STANDINGS_TRIGGERS)
+
+
+def _bareme_scope_sql(challenge_id, circuit):
+    """Sous-requête SQL de l'id du barème applicable : celui du challenge et du
+    circuit, sinon du challenge, sinon du circuit, sinon le barème par défaut."""
+    return f"""(SELECT b.id FROM baremes b
+        WHERE (b.challenge_id = {challenge_id} OR b.challenge_id IS NULL)
+          AND (b.circuit = {circuit} OR b.circuit IS NULL)
+        ORDER BY b.challenge_id IS NULL, b.circuit IS NULL
+        LIMIT 1)"""
+
+
+def _bareme_points_sql(rang, challenge_id, circuit):
+    """Expression SQL des points du barème applicable pour le rang donné.
+
+    Même règle que utils.calculate_points : 0 avant le 1er, et un rang absent
+    (ou manquant) reçoit les points du rang défini précédent.
+    """
+    return f"""COALESCE((SELECT p.points FROM bareme_points p
+        WHERE p.bareme_id = {_bareme_scope_sql(challenge_id, circuit)}
+          AND p.rang <= COALESCE({rang}, 2147483647)
+        ORDER BY p.rang DESC
+        LIMIT 1), 0)"""
+
+
+def _migration_10(conn):
+    """Barèmes par challenge et/ou circuit : baremes (portée, NULL = tous) et
+    bareme_points (rang -> points). L'ancienne table bareme devient le barème
+    par défaut."""
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS baremes (
+        id INTEGER PRIMARY KEY,
+        challenge_id INTEGER REFERENCES challenges(id) ON DELETE CASCADE,
+        circuit TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_baremes_scope
+        ON baremes (COALESCE(challenge_id, 0), COALESCE(circuit, ''));
+    CREATE TABLE IF NOT EXISTS bareme_points (
+        bareme_id INTEGER NOT NULL REFERENCES baremes(id) ON DELETE CASCADE,
+        rang INTEGER NOT NULL,
+        points INTEGER NOT NULL,
+        PRIMARY KEY (bareme_id, rang)
+    ) WITHOUT ROWID;
+    INSERT OR IGNORE INTO baremes (id, challenge_id, circuit) VALUES (1, NULL, NULL);
+    INSERT OR IGNORE INTO bareme_points (bareme_id, rang, points) SELECT 1, rang, points FROM bareme;
+    DROP TABLE IF EXISTS bareme;
+    """)
+    for table in ["baremes", "bareme_points"]:
+        for action in ["INSERT", "UPDATE", "DELETE"]:
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_generation_{table}_{action.lower()} AFTER {action} ON {table}
+            BEGIN
+                UPDATE generations SET value = value + 1 WHERE name = 'data';
+            END
+            """)
+
+
+def _migration_11(conn):
+    """Triggers data_issues de mise à jour séparés : un changement de points ne
+    recalcule plus les doublons, et seulement autour du seuil MAX_POINTS."""
+    conn.execute("DROP TRIGGER IF EXISTS trg_issues_resultats_update")
+    _execute_script(conn, DATA_ISSUES_TRIGGERS)
+
+
+def _rebuild_table(conn, table, create_sql, columns):
+    """Reconstruit une table avec un nouveau schéma en conservant ses lignes,
+    ses index et son compteur AUTOINCREMENT (clés étrangères désactivées)."""
+    indexes = [sql for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    )]
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    conn.execute(create_sql.format(table=f"{table}_new"))
+    conn.execute(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    for sql in indexes:
+        conn.execute(sql)
+    if seq:
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (seq[0], table))
+
+
+def _migration_12(conn):
+    """Suppressions en cascade : challenge -> courses -> resultats, et
+    coureur -> resultats (reconstruction des tables courses et resultats).
+
+    Les triggers sont supprimés puis recréés à l'identique autour de la
+    reconstruction ; les lignes orphelines existantes sont nettoyées.
+    """
+    triggers = [sql for (sql,) in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger'")]
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+
+    conn.execute("""
+    UPDATE courses SET challenge_id = NULL
+    WHERE challenge_id IS NOT NULL AND challenge_id NOT IN (SELECT id FROM challenges)
+    """)
+    conn.execute("""
+    DELETE FROM resultats
+    WHERE course_id NOT IN (SELECT id FROM courses) OR coureur_id NOT IN (SELECT id FROM coureurs)
+    """)
+
+    _rebuild_table(conn, "courses", """
+    CREATE TABLE {table} (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nom TEXT UNIQUE NOT NULL,
-        start_year INTEGER,
-        end_year INTEGER
+        nom_course TEXT NOT NULL,
+        date TEXT,
+        circuit TEXT NOT NULL,
+        challenge_id INTEGER REFERENCES challenges(id) ON DELETE CASCADE
+    )
+    """, "id, nom_course, date, circuit, challenge_id")
+    _rebuild_table(conn, "resultats", """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+        coureur_id INTEGER NOT NULL REFERENCES coureurs(id) ON DELETE CASCADE,
+        rang INTEGER NOT NULL,
+        points INTEGER NOT NULL,
+        categorie_course TEXT
+    )
+    """, "id, course_id, coureur_id, rang, points, categorie_course")
+
+    for sql in triggers:
+        conn.execute(sql)
+
+
+# Colonnes journalisées dans audit_log par les triggers d'audit
+AUDITED_TABLES = {
+    "resultats": ["course_id", "coureur_id", "rang", "points", "categorie_course"],
+    "coureurs": ["nom_complet", "genre", "categorie_age"],
+    "courses": ["nom_course", "date", "circuit", "challenge_id"],
+    "challenges": ["nom", "start_year", "end_year"],
+}
+
+# Audit par trigger actif, sauf interrupteur config 'audit' à 0 ou écriture de
+# masse en cours : l'opération groupée écrit alors son propre résumé
+_AUDIT_ON = (
+    "NOT EXISTS (SELECT 1 FROM config WHERE (name = 'audit' AND value = 0) OR (name = 'bulk' AND value = 1))"
+)
+_AUDIT_TIMESTAMP = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+
+def _json_row(row, columns):
+    return "json_object(" + ", ".join(f"'{c}', {row}.{c}" for c in columns) + ")"
+
+
+def _json_changes(row, columns):
+    """JSON des seules colonnes modifiées par un UPDATE, valeurs de row (OLD/NEW)."""
+    unchanged = ", ".join(f"CASE WHEN OLD.{c} IS NEW.{c} THEN '$.{c}' ELSE '$._' END" for c in columns)
+    return f"json_remove({_json_row(row, columns)}, {unchanged})"
+
+
+# Libellés copiés dans audit_log à l'écriture ({row} = NEW ou OLD) : l'historique
+# reste lisible après suppression des lignes et se lit sans jointure
+AUDIT_LABEL_COLUMNS = ["nom_complet", "nom_course", "circuit", "categorie_course"]
+AUDIT_LABELS = {
+    "resultats": {
+        "nom_complet": "(SELECT nom_complet FROM coureurs WHERE id = {row}.coureur_id)",
+        "nom_course": "(SELECT nom_course FROM courses WHERE id = {row}.course_id)",
+        "circuit": "(SELECT circuit FROM courses WHERE id = {row}.course_id)",
+        "categorie_course": "{row}.categorie_course",
+    },
+    "coureurs": {"nom_complet": "{row}.nom_complet"},
+    "courses": {"nom_course": "{row}.nom_course", "circuit": "{row}.circuit"},
+    "challenges": {},
+}
+
+
+def _audit_triggers(table, columns):
+    labels = AUDIT_LABELS[table]
+    insert = (
+        "INSERT INTO audit_log (timestamp, action, table_name, record_id, old_values, new_values, user_info"
+        + "".join(f", {c}" for c in labels) + ")"
     )
+
+    def values(action, row, old_values, new_values):
+        label_values = "".join(f", {sql.format(row=row)}" for sql in labels.values())
+        return (
+            f"VALUES ({_AUDIT_TIMESTAMP}, '{action}', '{table}', {row}.id, "
+            f"{old_values}, {new_values}, 'System'{label_values})"
+        )
+
+    changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in columns)
+    return f"""
+CREATE TRIGGER IF NOT EXISTS trg_audit_{table}_insert AFTER INSERT ON {table}
+WHEN {_AUDIT_ON}
+BEGIN
+    {insert}
+    {values("INSERT", "NEW", "NULL", _json_row("NEW", columns))};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_audit_{table}_update AFTER UPDATE ON {table}
+WHEN ({changed}) AND {_AUDIT_ON}
+BEGIN
+    {insert}
+    {values("UPDATE", "NEW", _json_changes("OLD", columns), _json_changes("NEW", columns))};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_audit_{table}_delete AFTER DELETE ON {table}
+WHEN {_AUDIT_ON}
+BEGIN
+    {insert}
+    {values("DELETE", "OLD", _json_row("OLD", columns), "NULL")};
+END;
+"""
+
+
+AUDIT_TRIGGERS = "".join(_audit_triggers(table, columns) for table, columns in AUDITED_TABLES.items())
+
+
+def _migration_13(conn):
+    """Audit par triggers (JSON) des écritures sur resultats, coureurs, courses
+    et challenges, avec l'interrupteur config 'audit'."""
+    conn.execute("INSERT OR IGNORE INTO config (name, value) VALUES ('audit', 1)")
+    _execute_script(conn, AUDIT_TRIGGERS)
+
+
+# Filtre des changements de points (servi par idx_audit_log_table_action_ts)
+AUDIT_POINTS_FILTER = (
+    "table_name = 'resultats' AND action = 'UPDATE' AND json_extract(new_values, '$.points') IS NOT NULL"
+)
+
+
+def _migration_14(conn):
+    """Libellés dénormalisés dans audit_log, renseignés par les triggers
+    d'audit, et index de pagination par clé (timestamp, id)."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(audit_log)")]
+    for column in AUDIT_LABEL_COLUMNS:
+        if column not in columns:
+            conn.execute(f"ALTER TABLE audit_log ADD COLUMN {column} TEXT")
+
+    # Lignes existantes : libellés des enregistrements encore présents ; pour un
+    # résultat supprimé, coureur et course sont relus dans old_values
+    conn.execute("""
+    UPDATE audit_log
+    SET nom_complet = c.nom_complet, nom_course = co.nom_course, circuit = co.circuit,
+        categorie_course = s.categorie_course
+    FROM (
+        SELECT a.id,
+               COALESCE(r.coureur_id, json_extract(a.old_values, '$.coureur_id')) AS coureur_id,
+               COALESCE(r.course_id, json_extract(a.old_values, '$.course_id')) AS course_id,
+               r.categorie_course
+        FROM audit_log a
+        LEFT JOIN resultats r ON r.id = a.record_id
+        WHERE a.table_name = 'resultats' AND a.record_id IS NOT NULL
+    ) s
+    LEFT JOIN coureurs c ON c.id = s.coureur_id
+    LEFT JOIN courses co ON co.id = s.course_id
+    WHERE audit_log.id = s.id
+    """)
+    conn.execute("""
+    UPDATE audit_log SET nom_complet = c.nom_complet FROM coureurs c
+    WHERE audit_log.table_name = 'coureurs' AND c.id = audit_log.record_id
+    """)
+    conn.execute("""
+    UPDATE audit_log SET nom_course = co.nom_course, circuit = co.circuit FROM courses co
+    WHERE audit_log.table_name = 'courses' AND co.id = audit_log.record_id
     """)
 
-    conn.commit()
-    conn.close()
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_ts_id ON audit_log (timestamp, id)")
+    # Statistiques du nouvel index : sans elles, celles de la migration 2
+    # font préférer idx_audit_log_table_action_ts suivi d'un tri
+    conn.execute("ANALYZE audit_log")
+    for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_audit_%'"
+    ).fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+    _execute_script(conn, AUDIT_TRIGGERS)
+
+
+
+def _migration_15(conn):
+    """Catalogue des archives mensuelles de audit_log (audit.archive_old_modifications).
+
+    audit_archives : un fichier d'archive par mois (audit._archive_path) et son
+    contenu (nombre de lignes, premier et dernier timestamp). audit_archive_index : nombre de
+    lignes archivées par mois, table et libellés, pour ne relire que les
+    fichiers utiles lors d'une recherche.
+    """
+    _execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS audit_archives (
+        mois TEXT PRIMARY KEY,
+        nb_lignes INTEGER NOT NULL,
+        premier_ts TEXT NOT NULL,
+        dernier_ts TEXT NOT NULL,
+        archive_le TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS audit_archive_index (
+        mois TEXT NOT NULL REFERENCES audit_archives(mois) ON DELETE CASCADE,
+        table_name TEXT NOT NULL,
+        nom_complet TEXT NOT NULL DEFAULT '',
+        nom_course TEXT NOT NULL DEFAULT '',
+        nb_lignes INTEGER NOT NULL,
+        PRIMARY KEY (mois, table_name, nom_complet, nom_course)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_audit_archive_index_nom ON audit_archive_index (nom_complet);
+    """)
+
+
+def _migration_16(conn):
+    """Rang par catégorie calculé à l'import (importer.compute_category_ranks).
+
+    Les ex-aequo y sont départagés dans l'ordre du fichier, ce que les lignes
+    de resultats (une par coéquipier) ne permettent pas de retrouver : le
+    recalcul des points (rescore_results) relit donc ce rang. Il reste NULL
+    pour les résultats saisis à la main ou importés auparavant.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(resultats)")]
+    if "rang_categorie" not in columns:
+        conn.execute("ALTER TABLE resultats ADD COLUMN rang_categorie INTEGER")
+
+# Migrations du schéma, dans l'ordre. La version courante est stockée dans
+# PRAGMA user_version : une migration déjà appliquée n'est jamais rejouée.
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+    _migration_10,
+    _migration_11,
+    _migration_12,
+    _migration_13,
+    _migration_14,
+    _migration_15,
+    _migration_16,
+]
+
+
+def get_schema_version():
+    with connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db():
+    """Met le schéma à jour en appliquant les migrations manquantes.
+
+    Une fois le schéma vérifié, les appels suivants du processus retournent
+    immédiatement sans toucher à la base.
+    """
+    global _schema_ready
+    if _schema_ready == DB_NAME:
+        return
+    if get_schema_version() >= len(MIGRATIONS):
+        _schema_ready = DB_NAME
+        return
+
+    with connection() as conn:
+        # Les migrations peuvent reconstruire des tables : clés étrangères
+        # désactivées (pragma sans effet dans une transaction, d'où l'ordre),
+        # puis vérifiées avant le commit
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            with transaction() as conn:
+                # Relecture sous verrou : une autre session a pu migrer entre-temps
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version = {number}")
+                violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+                if violations:
+                    raise sqlite3.IntegrityError(f"Clés étrangères invalides après migration : {violations[:5]}")
+        finally:
+            conn.execute(f"PRAGMA foreign_keys = {PRAGMAS['foreign_keys']}")
+    _schema_ready = DB_NAME
+
+
+def _cached_read(kind, query, params, load):
+    """Lit via le cache de requêtes ; load(conn) exécute la lecture réelle.
+
+    Dans une transaction ouverte, le cache est ignoré : la génération lue peut
+    encore être annulée par un rollback.
+    """
+    with connection() as conn:
+        if conn.in_transaction:
+            return load(conn)
+        generations = tuple(conn.execute("SELECT value FROM generations ORDER BY name"))
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        key = (DB_NAME, kind, query, tuple(params or ()), generations)
+        with _query_cache_lock:
+            if key in _query_cache:
+                _query_cache.move_to_end(key)
+                query_cache_stats["hits"] += 1
+                return _query_cache[key]
+            query_cache_stats["misses"] += 1
+        # La génération est lue avant les données : le résultat est au moins
+        # aussi récent que sa clé
+        result = load(conn)
+    with _query_cache_lock:
+        _query_cache[key] = result
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return result
+
+
+def forget_schema():
+    """Oublie la vérification du schéma (base remplacée, ex. restauration) :
+    le prochain init_db() relit la version et applique les migrations manquantes."""
+    global _schema_ready
+    _schema_ready = None
+
+
+def clear_query_cache():
+    with _query_cache_lock:
+        _query_cache.clear()
+
+
+def get_query_cache_info():
+    """Compteurs du cache de requêtes : hits, misses et nombre d'entrées."""
+    with _query_cache_lock:
+        return {**query_cache_stats, "size": len(_query_cache), "max_size": QUERY_CACHE_SIZE}
 
 
 def run_query(query, params=None):
-    conn = get_connection()
-    try:
-        df = pd.read_sql(query, conn, params=params)
-        return df
-    finally:
-        conn.close()
+    # Copie : l'appelant peut modifier le DataFrame sans altérer le cache
+    return _cached_read(
+        "dataframe", query, params, lambda conn: pd.read_sql(query, conn, params=params)
+    ).copy()
+
+
+def _fetchall(query, params=()):
+    """fetchall() passant par le cache de requêtes (liste de tuples, copiée)."""
+    return list(_cached_read(
+        "rows", query, params, lambda conn: conn.execute(query, params).fetchall()
+    ))
 
 
 def get_all_coureurs():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nom_complet FROM coureurs")
-    data = cursor.fetchall()
-    conn.close()
-    return data
+    return _fetchall("SELECT id, nom_complet FROM coureurs")
 
 
 def get_courses_by_circuit(circuit):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetchall(
         "SELECT id, nom_course, date, circuit, challenge_id FROM courses WHERE circuit = ? ORDER BY date ASC",
         (circuit,),
     )
-    data = cursor.fetchall()
-    conn.close()
-    return data
 
 
 def get_all_courses():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nom_course, date, circuit, challenge_id FROM courses ORDER BY date ASC")
-    data = cursor.fetchall()
-    conn.close()
-    return data
+    return _fetchall(
+        "SELECT id, nom_course, date, circuit, challenge_id FROM courses ORDER BY date ASC"
+    )
 
 
 def create_course(nom_course, date, circuit, challenge_id=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO courses (nom_course, date, circuit, challenge_id) VALUES (?, ?, ?, ?)",
-        (nom_course, date, circuit, challenge_id),
-    )
-    course_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return course_id
+    with transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO courses (nom_course, date, circuit, challenge_id) VALUES (?, ?, ?, ?)",
+            (nom_course, date, circuit, challenge_id),
+        )
+        return cursor.lastrowid
+
+
+# name_key à enregistrer pour un coureur : NULL si la clé appartient déjà à
+# un autre coureur (homonyme créé volontairement)
+_FREE_NAME_KEY = "(SELECT CASE WHEN EXISTS (SELECT 1 FROM coureurs WHERE name_key = :key AND id IS NOT :id) THEN NULL ELSE :key END)"
 
 
 def add_coureur(nom_complet, genre, categorie_age):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            "INSERT INTO coureurs (nom_complet, genre, categorie_age) VALUES (?, ?, ?)",
-            (nom_complet, genre, categorie_age),
-        )
-        new_id = cursor.lastrowid
-        conn.commit()
-        return new_id
-    except sqlite3.IntegrityError:
-        cursor.execute("SELECT id FROM coureurs WHERE nom_complet = ?", (nom_complet,))
-        return cursor.fetchone()[0]
-    finally:
-        conn.close()
+    with transaction() as conn:
+        try:
+            cursor = conn.execute(
+                f"INSERT INTO coureurs (nom_complet, genre, categorie_age, name_key) "
+                f"VALUES (:nom, :genre, :categorie_age, {_FREE_NAME_KEY})",
+                {"nom": nom_complet, "genre": genre, "categorie_age": categorie_age,
+                 "key": utils.name_key(nom_complet), "id": None},
+            )
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            row = conn.execute("SELECT id FROM coureurs WHERE nom_complet = ?", (nom_complet,)).fetchone()
+            return row[0]
 
 
 def update_coureur_name(coureur_id, new_name):
     """Met à jour le nom d'un coureur."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE coureurs SET nom_complet = ? WHERE id = ?",
-        (new_name, coureur_id)
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            f"UPDATE coureurs SET nom_complet = :nom, name_key = {_FREE_NAME_KEY} WHERE id = :id",
+            {"nom": new_name, "key": utils.name_key(new_name), "id": coureur_id},
+        )
+
+
+def get_coureurs_by_name_keys(keys):
+    """Coureurs dont la name_key figure dans keys, en une requête indexée.
+
+    Retourne {name_key: nom_complet}.
+    """
+    with connection() as conn:
+        return dict(conn.execute(
+            "SELECT name_key, nom_complet FROM coureurs "
+            "WHERE name_key IN (SELECT value FROM json_each(?))",
+            (json.dumps([k for k in set(keys) if k]),),
+        ).fetchall())
+
+
+def delete_coureur(coureur_id):
+    """Supprime un coureur et tous ses résultats."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM resultats WHERE coureur_id = ?", (coureur_id,))
+        conn.execute("DELETE FROM coureurs WHERE id = ?", (coureur_id,))
 
 
 def get_coureur_by_id(coureur_id):
@@ -158,30 +1029,90 @@ def get_coureur_by_id(coureur_id):
     return run_query(query, (coureur_id,))
 
 
-def add_result(course_id, coureur_id, rang, points, categorie_course):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO resultats (course_id, coureur_id, rang, points, categorie_course) VALUES (?, ?, ?, ?, ?)",
-        (course_id, coureur_id, rang, points, categorie_course),
-    )
-    conn.commit()
-    conn.close()
+def add_result(course_id, coureur_id, rang, points, categorie_course, rang_categorie=None):
+    """Ajoute un résultat. Une saisie manuelle donne le classement dans la
+    catégorie : il est enregistré comme rang_categorie, seul rang relu par
+    rescore_results."""
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO resultats (course_id, coureur_id, rang, points, categorie_course, rang_categorie) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (course_id, coureur_id, rang, points, categorie_course, rang_categorie),
+        )
+
+
+def import_results(nom_course, date, circuit, challenge_id, participants):
+    """Enregistre un raid importé en une seule transaction : la course, les
+    nouveaux coureurs puis tous les résultats (rien n'est conservé en cas d'erreur).
+
+    participants : liste de (nom_complet, nouveau, rang, points, categorie_course,
+    rang_categorie).
+    Un coureur marqué nouveau est créé s'il n'existe pas déjà ; un nom qui ne
+    correspond à aucun coureur est ignoré.
+    Retourne (course_id, nombre de résultats enregistrés). L'import est tracé
+    par un enregistrement d'audit groupé plutôt que ligne à ligne.
+    """
+    import audit
+
+    with transaction() as conn, _audit_suspended(conn):
+        course_id = conn.execute(
+            "INSERT INTO courses (nom_course, date, circuit, challenge_id) VALUES (?, ?, ?, ?)",
+            (nom_course, date, circuit, challenge_id),
+        ).lastrowid
+
+        new_names = dict.fromkeys(p[0] for p in participants if p[1])
+        max_coureur_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM coureurs").fetchone()[0]
+        conn.executemany(
+            f"INSERT INTO coureurs (nom_complet, name_key) VALUES (:nom, {_FREE_NAME_KEY}) "
+            "ON CONFLICT (nom_complet) DO NOTHING",
+            [{"nom": nom, "key": utils.name_key(nom), "id": None} for nom in new_names],
+        )
+        name_to_id = dict(conn.execute(
+            "SELECT nom_complet, id FROM coureurs "
+            "WHERE nom_complet IN (SELECT value FROM json_each(?))",
+            (json.dumps(list({p[0] for p in participants})),),
+        ).fetchall())
+
+        rows = [
+            (course_id, name_to_id[nom], rang, points, categorie, rang_categorie)
+            for nom, _, rang, points, categorie, rang_categorie in participants
+            if nom in name_to_id
+        ]
+        conn.executemany(
+            "INSERT INTO resultats (course_id, coureur_id, rang, points, categorie_course, rang_categorie) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        nouveaux = conn.execute(
+            "SELECT COUNT(*) FROM coureurs WHERE nom_complet IN (SELECT value FROM json_each(?)) AND id > ?",
+            (json.dumps(list(new_names)), max_coureur_id),
+        ).fetchone()[0]
+        audit.log_batch("BATCH_INSERT", "resultats", {
+            "operation": "import_results",
+            "course_id": course_id,
+            "nom_course": nom_course,
+            "circuit": circuit,
+            "resultats": len(rows),
+            "coureurs": nouveaux,
+        })
+    return course_id, len(rows)
 
 
 def add_results_batch(results_list):
     """Insert multiple results in one transaction."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.executemany(
-        "INSERT INTO resultats (course_id, coureur_id, rang, points, categorie_course) VALUES (?, ?, ?, ?, ?)",
-        results_list,
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT INTO resultats (course_id, coureur_id, rang, points, categorie_course) VALUES (?, ?, ?, ?, ?)",
+            results_list,
+        )
 
 
-def get_ranking_data():
+def get_ranking_data(challenge_id=None, circuit=None, categorie=None):
+    """Résultats détaillés pour le classement.
+
+    Les filtres sont appliqués par SQLite (index sur courses). Sans filtre,
+    toutes les saisons sont renvoyées : à réserver aux exports.
+    """
     query = """
     SELECT 
         c.nom_complet,
@@ -195,129 +1126,435 @@ def get_ranking_data():
     JOIN coureurs c ON r.coureur_id = c.id
     JOIN courses co ON r.course_id = co.id
     """
+    conditions = []
+    params = []
+    if challenge_id is not None:
+        conditions.append("co.challenge_id = ?")
+        params.append(int(challenge_id))
+    if circuit is not None:
+        conditions.append("co.circuit = ?")
+        params.append(circuit)
+    if categorie is not None:
+        conditions.append("categorie_match(r.categorie_course, ?)")
+        params.append(categorie)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    df = run_query(query, params)
+    # Types compacts : les noms, catégories et raids se répètent beaucoup
+    for col in ["nom_complet", "categorie", "circuit", "nom_course"]:
+        df[col] = df[col].astype("category")
+    df["points"] = pd.to_numeric(df["points"], downcast="integer")
+    return df
+
+
+def get_courses_for_challenge(challenge_id, circuit):
+    """Raids d'un circuit pour un challenge, triés par date."""
+    return _fetchall(
+        "SELECT id, nom_course, date, circuit, challenge_id FROM courses WHERE challenge_id = ? AND circuit = ? ORDER BY date ASC",
+        (int(challenge_id), circuit),
+    )
+
+
+def get_standings(challenge_id, circuit, categorie=None):
+    """Classement matérialisé d'un challenge/circuit, trié par total décroissant.
+
+    points_par_raid est un objet JSON {course_id: points}.
+    """
+    query = """
+    SELECT c.nom_complet, s.categorie, s.total, s.nb_raids, s.points_par_raid
+    FROM standings s
+    JOIN coureurs c ON c.id = s.coureur_id
+    WHERE s.challenge_id = ? AND s.circuit = ?
+    """
+    params = [int(challenge_id), circuit]
+    if categorie is not None:
+        query += " AND categorie_match(s.categorie, ?)"
+        params.append(categorie)
+    query += " ORDER BY s.total DESC, c.nom_complet, s.categorie"
+    return run_query(query, params)
+
+
+def _rebuild_standings(conn):
+    conn.execute("DELETE FROM standings")
+    conn.execute(f"""
+    INSERT INTO standings (challenge_id, circuit, coureur_id, categorie, total, nb_raids, points_par_raid)
+    SELECT challenge_id, circuit, coureur_id, categorie,
+           SUM(points), COUNT(*), json_group_object(course_id, points)
+    FROM ({_STANDINGS_SOURCE})
+    GROUP BY challenge_id, circuit, coureur_id, categorie
+    """)
+
+
+def rebuild_standings():
+    """Reconstruit entièrement la table standings à partir de resultats."""
+    with transaction() as conn:
+        _rebuild_standings(conn)
+        # standings n'a pas de trigger de génération : invalider les caches ici
+        conn.execute("UPDATE generations SET value = value + 1 WHERE name = 'data'")
+
+
+def _collect_standings_keys(conn, affected_sql, params):
+    conn.execute(f"""
+    INSERT OR IGNORE INTO temp.standings_keys (challenge_id, circuit, coureur_id, categorie)
+    SELECT c.challenge_id, c.circuit, a.coureur_id, a.categorie_course
+    FROM ({affected_sql}) a
+    JOIN courses c ON c.id = a.course_id
+    WHERE c.challenge_id IS NOT NULL AND a.categorie_course IS NOT NULL
+    """, params)
+
+
+@contextmanager
+def _bulk_standings(conn, affected_sql, params=()):
+    """Écriture de masse sur resultats dans la transaction courante.
+
+    Les triggers de standings sont suspendus pendant le bloc, puis les lignes
+    des coureurs touchés sont recalculées en une seule requête.
+    affected_sql sélectionne (course_id, coureur_id, categorie_course) des
+    résultats modifiés ; il est évalué avant et après le bloc pour couvrir
+    les anciennes et les nouvelles clés.
+    """
+    conn.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS standings_keys (
+        challenge_id INTEGER, circuit TEXT, coureur_id INTEGER, categorie TEXT,
+        PRIMARY KEY (challenge_id, circuit, coureur_id, categorie)
+    )
+    """)
+    conn.execute("DELETE FROM temp.standings_keys")
+    _collect_standings_keys(conn, affected_sql, params)
+    conn.execute("UPDATE config SET value = 1 WHERE name = 'bulk'")
+    try:
+        yield
+    finally:
+        conn.execute("UPDATE config SET value = 0 WHERE name = 'bulk'")
+    _collect_standings_keys(conn, affected_sql, params)
+
+    conn.execute("""
+    DELETE FROM standings
+    WHERE (challenge_id, circuit, coureur_id, categorie) IN (SELECT * FROM temp.standings_keys)
+    """)
+    conn.execute("""
+    INSERT INTO standings (challenge_id, circuit, coureur_id, categorie, total, nb_raids, points_par_raid)
+    SELECT challenge_id, circuit, coureur_id, categorie,
+           SUM(points), COUNT(*), json_group_object(course_id, points)
+    FROM (
+        SELECT k.challenge_id, k.circuit, k.coureur_id, k.categorie, r.course_id, SUM(r.points) AS points
+        FROM temp.standings_keys k
+        JOIN courses c ON c.challenge_id = k.challenge_id AND c.circuit = k.circuit
+        JOIN resultats r ON r.course_id = c.id AND r.coureur_id = k.coureur_id AND r.categorie_course = k.categorie
+        GROUP BY k.challenge_id, k.circuit, k.coureur_id, k.categorie, r.course_id
+    )
+    GROUP BY challenge_id, circuit, coureur_id, categorie
+    """)
+    conn.execute("DELETE FROM temp.standings_keys")
+
+
+@contextmanager
+def _audit_suspended(conn):
+    """Suspend les triggers d'audit dans la transaction courante : l'appelant
+    enregistre un résumé (audit.log_batch) à la place. L'état précédent est
+    rétabli à la sortie, y compris si l'audit était déjà suspendu."""
+    previous = conn.execute("SELECT value FROM config WHERE name = 'audit'").fetchone()[0]
+    conn.execute("UPDATE config SET value = 0 WHERE name = 'audit'")
+    try:
+        yield
+    finally:
+        conn.execute("UPDATE config SET value = ? WHERE name = 'audit'", (previous,))
+
+
+def check_standings():
+    """Compare standings à un recalcul complet depuis resultats.
+
+    Renvoie les écarts (DataFrame vide si la copie matérialisée est cohérente).
+    """
+    query = f"""
+    WITH attendu AS ({_STANDINGS_SOURCE}),
+    materialise AS (
+        SELECT s.challenge_id, s.circuit, s.coureur_id, s.categorie,
+               CAST(j.key AS INTEGER) AS course_id, j.value AS points
+        FROM standings s, json_each(s.points_par_raid) j
+    )
+    SELECT *, 'manquant' AS ecart FROM (SELECT * FROM attendu EXCEPT SELECT * FROM materialise)
+    UNION ALL
+    SELECT *, 'en trop' AS ecart FROM (SELECT * FROM materialise EXCEPT SELECT * FROM attendu)
+    UNION ALL
+    SELECT s.challenge_id, s.circuit, s.coureur_id, s.categorie, NULL, s.total, 'total incohérent'
+    FROM standings s
+    WHERE s.total != (SELECT SUM(j.value) FROM json_each(s.points_par_raid) j)
+       OR s.nb_raids != (SELECT COUNT(*) FROM json_each(s.points_par_raid) j)
+    """
     return run_query(query)
 
 
+def get_data_version():
+    """Génération courante des données (change à chaque écriture, toutes sessions confondues)."""
+    with connection() as conn:
+        return conn.execute("SELECT value FROM generations WHERE name = 'data'").fetchone()[0]
+
+
+def has_results():
+    return _fetchall("SELECT EXISTS (SELECT 1 FROM resultats)")[0][0] == 1
+
+
 def delete_course(course_id):
-    """Delete a raid (course) and its associated results."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    # Remove results linked to this raid
-    cursor.execute("DELETE FROM resultats WHERE course_id = ?", (course_id,))
-    # Remove the raid itself
-    cursor.execute("DELETE FROM courses WHERE id = ?", (course_id,))
-    conn.commit()
-    conn.close()
+    """Delete a raid (course); its results follow by ON DELETE CASCADE.
+
+    Traced by one grouped audit record (course and deleted results).
+    """
+    import audit
+
+    affected = "SELECT course_id, coureur_id, categorie_course FROM resultats WHERE course_id = ?"
+    with transaction() as conn:
+        course = conn.execute(
+            "SELECT nom_course, date, circuit, challenge_id FROM courses WHERE id = ?", (course_id,)
+        ).fetchone()
+        if course is None:
+            return
+        rows = _fetch_rows(conn, "SELECT * FROM resultats WHERE course_id = ?", (course_id,))
+        with _bulk_standings(conn, affected, (course_id,)):
+            conn.execute("DELETE FROM courses WHERE id = ?", (course_id,))
+        audit.log_batch("BATCH_DELETE", "courses", {
+            "operation": "delete_course",
+            "course_id": course_id,
+            "course": dict(zip(AUDITED_TABLES["courses"], course)),
+            "resultats": len(rows),
+            "lignes": rows,
+        })
 
 
 def rename_course(course_id, new_name):
     """Rename a raid (course)."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE courses SET nom_course = ? WHERE id = ?", (new_name, course_id)
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE courses SET nom_course = ? WHERE id = ?", (new_name, course_id)
+        )
 
 
 def change_course_date(course_id, new_date):
     """Change the date of a raid (course)."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE courses SET date = ? WHERE id = ?", (new_date, course_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("UPDATE courses SET date = ? WHERE id = ?", (new_date, course_id))
 
 
 def update_course_challenge(course_id, challenge_id):
     """Change le challenge associé à un raid."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE courses SET challenge_id = ? WHERE id = ?", (challenge_id, course_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("UPDATE courses SET challenge_id = ? WHERE id = ?", (challenge_id, course_id))
 
 
 def get_challenges():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nom, start_year, end_year FROM challenges ORDER BY start_year DESC")
-    data = cursor.fetchall()
-    conn.close()
+    data = _fetchall("SELECT id, nom, start_year, end_year FROM challenges ORDER BY start_year DESC")
     return [{"id": r[0], "range": r[1], "start": r[2], "end": r[3]} for r in data]
 
 
+def get_points_scale(challenge_id=None, circuit=None):
+    """Barème applicable à un challenge/circuit : dict rang -> points."""
+    # Valeurs venant d'un DataFrame : NaN/numpy -> types SQLite
+    challenge_id = None if pd.isna(challenge_id) else int(challenge_id)
+    circuit = None if pd.isna(circuit) else str(circuit)
+    query = f"""
+    SELECT rang, points FROM bareme_points
+    WHERE bareme_id = {_bareme_scope_sql("?", "?")}
+    ORDER BY rang
+    """
+    return dict(_fetchall(query, (challenge_id, circuit)))
+
+
+def get_points_lookup(challenge_id=None, circuit=None):
+    """Barème applicable compilé en tableau NumPy (voir utils.calculate_points_array)."""
+    return utils.compile_points_scale(get_points_scale(challenge_id, circuit))
+
+
+def get_points_scales():
+    """Barèmes définis : liste de dicts (id, challenge_id, circuit, nb_rangs)."""
+    data = _fetchall("""
+    SELECT b.id, b.challenge_id, b.circuit, COUNT(p.rang)
+    FROM baremes b LEFT JOIN bareme_points p ON p.bareme_id = b.id
+    GROUP BY b.id
+    ORDER BY b.challenge_id IS NOT NULL, b.challenge_id, b.circuit IS NOT NULL, b.circuit
+    """)
+    return [{"id": r[0], "challenge_id": r[1], "circuit": r[2], "nb_rangs": r[3]} for r in data]
+
+
+def set_points_scale(scale, challenge_id=None, circuit=None):
+    """Enregistre le barème {rang: points} d'un challenge et/ou d'un circuit
+    (None = tous). Remplace le barème existant de même portée.
+
+    Les points déjà enregistrés ne sont pas modifiés.
+    """
+    import audit
+
+    scale = {int(rang): int(points) for rang, points in scale.items()}
+    if not scale or min(scale) < 1 or min(scale.values()) < 0 or max(scale.values()) > MAX_POINTS:
+        raise ValueError(f"Barème invalide : rangs à partir de 1 et points entre 0 et {MAX_POINTS}")
+
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO baremes (challenge_id, circuit) VALUES (?, ?)", (challenge_id, circuit)
+        )
+        bareme_id = conn.execute(
+            "SELECT id FROM baremes WHERE challenge_id IS ? AND circuit IS ?", (challenge_id, circuit)
+        ).fetchone()[0]
+        conn.execute("DELETE FROM bareme_points WHERE bareme_id = ?", (bareme_id,))
+        conn.executemany(
+            "INSERT INTO bareme_points (bareme_id, rang, points) VALUES (?, ?, ?)",
+            [(bareme_id, rang, points) for rang, points in sorted(scale.items())],
+        )
+        audit.log_batch("BATCH_UPDATE", "bareme_points", {
+            "operation": "set_points_scale",
+            "challenge_id": challenge_id,
+            "circuit": circuit,
+            "bareme": scale,
+        })
+
+
+def delete_points_scale(challenge_id=None, circuit=None):
+    """Supprime le barème d'une portée ; le barème plus général s'applique alors.
+    Le barème par défaut ne peut pas être supprimé. La suppression est tracée
+    avec le barème supprimé, comme set_points_scale."""
+    import audit
+
+    if challenge_id is None and circuit is None:
+        raise ValueError("Le barème par défaut ne peut pas être supprimé")
+    with transaction() as conn:
+        scale = dict(conn.execute("""
+            SELECT p.rang, p.points FROM baremes b JOIN bareme_points p ON p.bareme_id = b.id
+            WHERE b.challenge_id IS ? AND b.circuit IS ? ORDER BY p.rang
+        """, (challenge_id, circuit)).fetchall())
+        if not scale:
+            return
+        conn.execute("DELETE FROM baremes WHERE challenge_id IS ? AND circuit IS ?", (challenge_id, circuit))
+        audit.log_batch("BATCH_DELETE", "bareme_points", {
+            "operation": "delete_points_scale",
+            "challenge_id": challenge_id,
+            "circuit": circuit,
+            "bareme": scale,
+        })
+
+
 def create_challenge(nom, start, end):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO challenges (nom, start_year, end_year) VALUES (?, ?, ?)", (nom, start, end))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("INSERT INTO challenges (nom, start_year, end_year) VALUES (?, ?, ?)", (nom, start, end))
     except sqlite3.IntegrityError:
         pass  # Le challenge existe déjà
-    conn.close()
 
 
 def update_result_points(course_id, coureur_id, new_points):
     """Met à jour les points d'un résultat spécifique."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE resultats SET points = ? WHERE course_id = ? AND coureur_id = ?",
-        (new_points, course_id, coureur_id)
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE resultats SET points = ? WHERE course_id = ? AND coureur_id = ?",
+            (new_points, course_id, coureur_id)
+        )
 
 
 def update_result_points_by_id(result_id, new_points):
-    """Met à jour les points d'un résultat par son ID."""
-    # Récupérer les anciennes valeurs pour l'audit
-    old_data = run_query("SELECT points FROM resultats WHERE id = ?", (result_id,))
-    old_points = old_data.iloc[0]['points'] if not old_data.empty else None
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE resultats SET points = ? WHERE id = ?",
-        (new_points, result_id)
-    )
-    conn.commit()
-    conn.close()
-    
-    # Log de la modification
+    """Met à jour les points d'un résultat par son ID (audit par trigger,
+    dans la même transaction)."""
+    with transaction() as conn:
+        conn.execute("UPDATE resultats SET points = ? WHERE id = ?", (new_points, int(result_id)))
+
+
+def update_results_points(changes):
+    """Met à jour les points de plusieurs résultats en une transaction.
+
+    changes : liste de (result_id, anciens points, nouveaux points). Contrôle
+    optimiste : si un résultat n'a plus les anciens points (modifié ou supprimé
+    depuis le chargement), rien n'est écrit.
+    Retourne {"resultats": n mis à jour, "conflits": [ids refusés]}. Chaque
+    résultat modifié est tracé comme par les triggers d'audit (suspendus en
+    écriture de masse) : une ligne UPDATE avec ses libellés, reprise par
+    l'historique des points.
+    """
+    changes = [(int(id_), int(old), int(new)) for id_, old, new in changes if int(old) != int(new)]
+    if not changes:
+        return {"resultats": 0, "conflits": []}
+    ids = json.dumps([id_ for id_, _, _ in changes])
+
+    with transaction() as conn:
+        current = dict(conn.execute(
+            "SELECT id, points FROM resultats WHERE id IN (SELECT value FROM json_each(?))", (ids,)
+        ).fetchall())
+        conflicts = [id_ for id_, old, _ in changes if current.get(id_) != old]
+        if conflicts:
+            return {"resultats": 0, "conflits": conflicts}
+
+        affected = """SELECT course_id, coureur_id, categorie_course FROM resultats
+                      WHERE id IN (SELECT value FROM json_each(?))"""
+        with _bulk_standings(conn, affected, (ids,)):
+            cursor = conn.executemany(
+                "UPDATE resultats SET points = ? WHERE id = ? AND points = ?",
+                [(new, id_, old) for id_, old, new in changes],
+            )
+            # Garde-fou : la transaction (BEGIN IMMEDIATE) exclut tout autre écrivain
+            if cursor.rowcount != len(changes):
+                raise sqlite3.DatabaseError("Mise à jour des points incomplète")
+        labels = AUDIT_LABELS["resultats"]
+        conn.execute(f"""
+        INSERT INTO audit_log (timestamp, action, table_name, record_id, old_values, new_values, user_info,
+                               {", ".join(labels)})
+        SELECT {_AUDIT_TIMESTAMP}, 'UPDATE', 'resultats', r.id,
+               json_object('points', json_extract(c.value, '$[0]')),
+               json_object('points', json_extract(c.value, '$[1]')), 'System',
+               {", ".join(sql.format(row="r") for sql in labels.values())}
+        FROM json_each(?) c
+        JOIN resultats r ON r.id = CAST(c.key AS INTEGER)
+        WHERE NOT EXISTS (SELECT 1 FROM config WHERE name = 'audit' AND value = 0)
+        """, (json.dumps({id_: [old, new] for id_, old, new in changes}),))
+    return {"resultats": len(changes), "conflits": []}
+
+
+def get_result_cells(challenge_id, circuit):
+    """Résultat porté par chaque cellule (coureur, catégorie, raid) du classement
+    d'un challenge/circuit. Les cellules à plusieurs résultats (doublons) sont
+    exclues : leur total ne correspond à aucun résultat modifiable."""
+    query = """
+    SELECT MIN(r.id) AS id, c.nom_complet, r.categorie_course AS categorie, r.course_id, MIN(r.points) AS points
+    FROM resultats r
+    JOIN coureurs c ON c.id = r.coureur_id
+    JOIN courses co ON co.id = r.course_id
+    WHERE co.challenge_id = ? AND co.circuit = ? AND r.categorie_course IS NOT NULL
+    GROUP BY r.coureur_id, r.categorie_course, r.course_id
+    HAVING COUNT(*) = 1
+    """
+    return run_query(query, (int(challenge_id), circuit))
+
+
+def _fetch_rows(conn, query, params=()):
+    """Lignes complètes d'une requête, en dictionnaires (contenu des audits groupés)."""
+    cursor = conn.execute(query, params)
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def delete_results(result_ids):
+    """Supprime plusieurs résultats en une transaction.
+
+    La suppression est tracée par un enregistrement d'audit groupé contenant
+    toutes les lignes supprimées. Retourne le nombre de résultats supprimés.
+    """
     import audit
-    audit.log_modification(
-        "UPDATE", "resultats", result_id,
-        {"points": old_points},
-        {"points": new_points}
-    )
+
+    ids = json.dumps([int(id_) for id_ in result_ids])
+    selected = "SELECT * FROM resultats WHERE id IN (SELECT value FROM json_each(?))"
+    with transaction() as conn:
+        rows = _fetch_rows(conn, selected, (ids,))
+        if not rows:
+            return 0
+        with _bulk_standings(conn, selected.replace("*", "course_id, coureur_id, categorie_course"), (ids,)):
+            conn.execute("DELETE FROM resultats WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+        audit.log_batch("BATCH_DELETE", "resultats", {
+            "operation": "delete_results",
+            "resultats": len(rows),
+            "lignes": rows,
+        })
+    return len(rows)
 
 
 def delete_result_by_id(result_id):
     """Supprime un résultat par son ID."""
-    import audit
-    
-    # Récupérer les données pour l'audit
-    old_data = run_query(
-        "SELECT coureur_id, course_id, points, rang FROM resultats WHERE id = ?",
-        (result_id,)
-    )
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM resultats WHERE id = ?", (int(result_id),))
-    conn.commit()
-    conn.close()
-    
-    # Log de la suppression
-    if not old_data.empty:
-        audit.log_modification(
-            "DELETE", "resultats", result_id,
-            old_data.iloc[0].to_dict(),
-            None
-        )
+    delete_results([result_id])
 
 
 def get_coureur_results_for_challenge(coureur_name, challenge_id, circuit):
@@ -333,14 +1570,47 @@ def get_coureur_results_for_challenge(coureur_name, challenge_id, circuit):
     return run_query(query, (coureur_name, challenge_id, circuit))
 
 
+def get_data_issue_counts():
+    """Nombre de problèmes de données par type, lu dans data_issues.
+
+    Les doublons sont comptés par couple coureur/course (un cas = plusieurs
+    inscriptions).
+    """
+    counts = dict.fromkeys(ISSUE_KINDS, 0)
+    counts.update(_fetchall("""
+    SELECT kind, COUNT(*) FROM data_issues WHERE kind != 'doublon' GROUP BY kind
+    UNION ALL
+    SELECT 'doublon', COUNT(DISTINCT r.course_id || '-' || r.coureur_id)
+    FROM data_issues d JOIN resultats r ON r.id = d.record_id
+    WHERE d.kind = 'doublon'
+    """))
+    return counts
+
+
+def check_data_issues():
+    """Compare data_issues à un recalcul complet.
+
+    Renvoie les écarts (DataFrame vide si le suivi incrémental est cohérent).
+    """
+    query = f"""
+    WITH attendu AS ({_DATA_ISSUES_SOURCE})
+    SELECT *, 'manquant' AS ecart FROM (SELECT * FROM attendu EXCEPT SELECT kind, record_id FROM data_issues)
+    UNION ALL
+    SELECT *, 'en trop' AS ecart FROM (SELECT kind, record_id FROM data_issues EXCEPT SELECT * FROM attendu)
+    """
+    return run_query(query)
+
+
 def get_aberrant_points():
     """Récupère les résultats avec des points aberrants (> 35)."""
     query = """
-    SELECT r.id, c.nom_complet, co.nom_course, r.points, r.rang, r.categorie_course
-    FROM resultats r
+    SELECT r.id, c.nom_complet, co.nom_course, r.points, r.rang, r.categorie_course,
+           co.challenge_id, co.circuit
+    FROM data_issues d
+    JOIN resultats r ON r.id = d.record_id
     JOIN coureurs c ON r.coureur_id = c.id
     JOIN courses co ON r.course_id = co.id
-    WHERE r.points > 35
+    WHERE d.kind = 'points_aberrants'
     ORDER BY r.points DESC
     """
     return run_query(query)
@@ -350,124 +1620,190 @@ def get_duplicate_results():
     """Détecte les doublons (même coureur inscrit plusieurs fois sur la même course)."""
     query = """
     SELECT r.id, c.nom_complet, co.nom_course, r.points, r.rang, r.categorie_course, co.id as course_id
-    FROM resultats r
+    FROM data_issues d
+    JOIN resultats r ON r.id = d.record_id
     JOIN coureurs c ON r.coureur_id = c.id
     JOIN courses co ON r.course_id = co.id
-    WHERE (r.coureur_id, r.course_id) IN (
-        SELECT coureur_id, course_id
-        FROM resultats
-        GROUP BY coureur_id, course_id
-        HAVING COUNT(*) > 1
-    )
+    WHERE d.kind = 'doublon'
     ORDER BY c.nom_complet, co.nom_course, r.id
     """
     return run_query(query)
 
 
 def fix_aberrant_points():
-    """Corrige automatiquement les points aberrants en les recalculant selon le rang."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Récupérer tous les résultats avec points > 35
-    cursor.execute("""
-        SELECT id, rang FROM resultats WHERE points > 35
-    """)
-    aberrant_results = cursor.fetchall()
-    
-    # Corriger chaque résultat
-    for result_id, rang in aberrant_results:
-        # Recalculer les points selon le rang (max 35)
-        correct_points = min(35, calculate_points_from_rank(rang))
-        cursor.execute(
-            "UPDATE resultats SET points = ? WHERE id = ?",
-            (correct_points, result_id)
+    """Corrige les points aberrants en les recalculant selon le rang (barème de la course).
+
+    Une seule requête UPDATE dans une transaction, tracée par un enregistrement
+    d'audit groupé. Retourne le nombre de résultats corrigés par catégorie.
+    """
+    import audit
+
+    with transaction() as conn:
+        counts = dict(conn.execute("""
+            SELECT COALESCE(r.categorie_course, '(sans catégorie)'), COUNT(*)
+            FROM data_issues d
+            JOIN resultats r ON r.id = d.record_id
+            WHERE d.kind = 'points_aberrants'
+            GROUP BY r.categorie_course
+        """).fetchall())
+        if counts:
+            aberrant_ids = "SELECT record_id FROM data_issues WHERE kind = 'points_aberrants'"
+            affected = f"SELECT course_id, coureur_id, categorie_course FROM resultats WHERE id IN ({aberrant_ids})"
+            with _bulk_standings(conn, affected):
+                conn.execute(f"""
+                    UPDATE resultats
+                    SET points = {_bareme_points_sql("resultats.rang", "co.challenge_id", "co.circuit")}
+                    FROM courses co
+                    WHERE co.id = resultats.course_id AND resultats.id IN ({aberrant_ids})
+                """)
+            audit.log_batch("BATCH_UPDATE", "resultats", {
+                "operation": "fix_aberrant_points",
+                "resultats": sum(counts.values()),
+                "par_categorie": counts,
+            })
+    return counts
+
+
+def rescore_results(course_id=None, challenge_id=None):
+    """Recalcule les points d'une course (ou de toutes les courses d'un challenge)
+    depuis le rang par catégorie et le barème applicable.
+
+    Le rang par catégorie est celui enregistré à l'import, identique à celui qui
+    a servi au calcul des points ; à défaut (saisie manuelle, import antérieur)
+    il est recalculé par fonction de fenêtre parmi les seules lignes sans rang
+    enregistré (leurs rangs scratch ne se comparent pas aux rangs par
+    catégorie des autres). Une ligne sans
+    catégorie ou hors classement reçoit utils.UNSCORED_POINTS, comme à
+    l'import. Seuls les résultats dont les points changent sont réécrits, dans
+    une transaction tracée par un enregistrement d'audit groupé.
+    Retourne le nombre de résultats modifiés par catégorie.
+    """
+    import audit
+
+    if course_id is None and challenge_id is None:
+        raise ValueError("Une course ou un challenge est requis")
+
+    with transaction() as conn:
+        conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS rescore (
+            id INTEGER PRIMARY KEY, categorie TEXT, old_points INTEGER, points INTEGER NOT NULL
         )
-    
-    conn.commit()
-    fixed_count = len(aberrant_results)
-    conn.close()
-    return fixed_count
-
-
-def calculate_points_from_rank(rank):
-    """Calcule les points selon le rang (copie de utils.calculate_points)."""
-    if rank < 1:
-        return 0
-    if rank == 1:
-        return 35
-    elif rank == 2:
-        return 32
-    elif rank == 3:
-        return 29
-    elif rank == 4:
-        return 27
-    elif rank == 5:
-        return 26
-    elif rank == 6:
-        return 25
-    elif 7 <= rank <= 30:
-        return 31 - rank
-    else:
-        return 1
+        """)
+        conn.execute("DELETE FROM temp.rescore")
+        # Coéquipiers d'une même équipe : même rang, donc même rang par catégorie
+        conn.execute(f"""
+        INSERT INTO temp.rescore (id, categorie, old_points, points)
+        SELECT id, categorie_course, points, new_points FROM (
+            SELECT s.id, s.categorie_course, s.points,
+                   CASE WHEN s.rang_categorie IS NULL THEN :unscored
+                        ELSE {_bareme_points_sql("s.rang_categorie", "s.challenge_id", "s.circuit")}
+                   END AS new_points
+            FROM (
+                SELECT r.id, r.categorie_course, r.points, co.challenge_id, co.circuit,
+                       CASE WHEN r.categorie_course IS NULL OR r.rang IS NULL OR r.rang >= :unranked
+                            THEN NULL
+                            ELSE COALESCE(r.rang_categorie, DENSE_RANK() OVER (
+                                PARTITION BY r.course_id, r.categorie_course, r.rang_categorie IS NULL
+                                ORDER BY r.rang
+                            ))
+                       END AS rang_categorie
+                FROM resultats r
+                JOIN courses co ON co.id = r.course_id
+                WHERE co.id = :course_id OR co.challenge_id = :challenge_id
+            ) s
+        )
+        WHERE new_points IS NOT points
+        """, {
+            "unranked": utils.UNRANKED_RANK, "unscored": utils.UNSCORED_POINTS,
+            "course_id": course_id, "challenge_id": challenge_id,
+        })
+
+        changes = conn.execute("SELECT id, categorie, old_points, points FROM temp.rescore").fetchall()
+        counts = dict(Counter(categorie or "(sans catégorie)" for _, categorie, _, _ in changes))
+        if changes:
+            affected = """SELECT course_id, coureur_id, categorie_course FROM resultats
+                          WHERE id IN (SELECT id FROM temp.rescore)"""
+            with _bulk_standings(conn, affected):
+                conn.execute("""
+                    UPDATE resultats SET points = t.points
+                    FROM temp.rescore t
+                    WHERE t.id = resultats.id
+                """)
+            audit.log_batch("BATCH_UPDATE", "resultats", {
+                "operation": "rescore_results",
+                "course_id": course_id,
+                "challenge_id": challenge_id,
+                "resultats": len(changes),
+                "par_categorie": counts,
+                # id -> [anciens points, nouveaux points]
+                "points": {id_: [old, new] for id_, _, old, new in changes},
+            })
+        conn.execute("DELETE FROM temp.rescore")
+    return counts
 
 
 def get_invalid_coureurs():
     """Récupère les coureurs avec des noms invalides."""
     query = """
     SELECT c.id, c.nom_complet, COUNT(r.id) as nb_resultats
-    FROM coureurs c
+    FROM data_issues d
+    JOIN coureurs c ON c.id = d.record_id
     LEFT JOIN resultats r ON c.id = r.coureur_id
-    WHERE c.nom_complet IS NULL OR 
-          c.nom_complet = '' OR 
-          LOWER(TRIM(c.nom_complet)) = 'nan' OR 
-          LOWER(TRIM(c.nom_complet)) = 'nan nan' OR
-          LOWER(c.nom_complet) LIKE 'nan %' OR
-          LOWER(c.nom_complet) LIKE '% nan' OR
-          LOWER(c.nom_complet) LIKE '% nan %'
+    WHERE d.kind = 'nom_invalide'
     GROUP BY c.id, c.nom_complet
     """
     return run_query(query)
 
 
 def clean_invalid_coureurs():
-    """Supprime les coureurs avec des noms invalides (nan, vides, etc.)."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Supprimer les résultats des coureurs invalides d'abord
-    cursor.execute("""
-        DELETE FROM resultats WHERE coureur_id IN (
-            SELECT id FROM coureurs WHERE 
-            nom_complet IS NULL OR 
-            nom_complet = '' OR 
-            nom_complet = 'nan' OR 
-            nom_complet = 'nan nan' OR
-            nom_complet LIKE '%nan%'
-        )
-    """)
-    
-    # Puis supprimer les coureurs invalides
-    cursor.execute("""
-        DELETE FROM coureurs WHERE 
-        nom_complet IS NULL OR 
-        nom_complet = '' OR 
-        nom_complet = 'nan' OR 
-        nom_complet = 'nan nan' OR
-        nom_complet LIKE '%nan%'
-    """)
-    
-    deleted_count = cursor.rowcount
-    conn.commit()
-    conn.close()
-    return deleted_count
+    """Supprime les coureurs avec des noms invalides (nan, vides, etc.) et leurs résultats.
+
+    Retourne {"coureurs": n, "resultats": m} ; la suppression est tracée par un
+    enregistrement d'audit groupé.
+    """
+    import audit
+
+    invalid_ids = "SELECT record_id FROM data_issues WHERE kind = 'nom_invalide'"
+    with transaction() as conn:
+        noms = [row[0] for row in conn.execute(f"SELECT nom_complet FROM coureurs WHERE id IN ({invalid_ids})")]
+        # Supprimer les résultats des coureurs invalides d'abord
+        affected = f"SELECT course_id, coureur_id, categorie_course FROM resultats WHERE coureur_id IN ({invalid_ids})"
+        with _bulk_standings(conn, affected):
+            resultats = conn.execute(f"DELETE FROM resultats WHERE coureur_id IN ({invalid_ids})").rowcount
+            # Puis supprimer les coureurs invalides
+            coureurs = conn.execute(f"DELETE FROM coureurs WHERE id IN ({invalid_ids})").rowcount
+        deleted = {"coureurs": coureurs, "resultats": resultats}
+        if coureurs:
+            audit.log_batch("BATCH_DELETE", "coureurs", {
+                "operation": "clean_invalid_coureurs", **deleted, "noms": noms,
+            })
+    return deleted
 
 
 def delete_challenge(challenge_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM resultats WHERE course_id IN (SELECT id FROM courses WHERE challenge_id = ?)", (challenge_id,))
-    cursor.execute("DELETE FROM courses WHERE challenge_id = ?", (challenge_id,))
-    cursor.execute("DELETE FROM challenges WHERE id = ?", (challenge_id,))
-    conn.commit()
-    conn.close()
+    """Supprime un challenge ; ses raids, leurs résultats et ses barèmes suivent
+    par ON DELETE CASCADE. Tracé par un enregistrement d'audit groupé contenant
+    les raids et les résultats supprimés."""
+    import audit
+
+    affected = """SELECT r.course_id, r.coureur_id, r.categorie_course FROM resultats r
+                  JOIN courses co ON co.id = r.course_id WHERE co.challenge_id = ?"""
+    with transaction() as conn:
+        challenge = conn.execute(
+            "SELECT nom, start_year, end_year FROM challenges WHERE id = ?", (challenge_id,)
+        ).fetchone()
+        if challenge is None:
+            return
+        courses = _fetch_rows(conn, "SELECT * FROM courses WHERE challenge_id = ?", (challenge_id,))
+        rows = _fetch_rows(conn, affected.replace("r.course_id, r.coureur_id, r.categorie_course", "r.*"), (challenge_id,))
+        with _bulk_standings(conn, affected, (challenge_id,)):
+            conn.execute("DELETE FROM challenges WHERE id = ?", (challenge_id,))
+        audit.log_batch("BATCH_DELETE", "challenges", {
+            "operation": "delete_challenge",
+            "challenge_id": challenge_id,
+            "challenge": dict(zip(AUDITED_TABLES["challenges"], challenge)),
+            "courses": len(courses),
+            "resultats": len(rows),
+            "raids": courses,
+            "lignes": rows,
+        })
@@ -0,0 +1,366 @@
+from collections import Counter, defaultdict
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from thefuzz import utils as fuzz_utils
+import database
+import utils
+
+# Seuils de similarité pour le rapprochement des noms (token_sort_ratio)
+SCORE_EXACT = 100
+SCORE_CONFLICT = 88
+
+# Entier écrit en toutes lettres, comme accepté par int("...")
+_INT_PATTERN = r"\s*[+-]?\d+\s*"
+
+
+def normalize_name(s: str) -> str:
+    if pd.isna(s) or s is None:
+        return ""
+    result = str(s).strip()
+    return "" if result.lower() == "nan" else result
+
+
+def normalize_category(val):
+    """Normalise les catégories (H -> Homme, F -> Femme, M -> Mixte).
+    Détecte aussi les mots inclus dans une chaîne (ex: TrotteurHomme -> Homme).
+    """
+    if val is None or pd.isna(val):
+        return None
+    v = str(val).strip().upper()
+    if not v:
+        return None
+
+    # Correspondance exacte d'abord
+    if v in ["H", "HOMME", "HOMMES", "MASCULIN", "MEN", "MALE"]:
+        return "Homme"
+    if v in ["F", "FEMME", "FEMMES", "DAME", "DAMES", "FÉMININE", "FEMININE", "WOMEN", "FEMALE"]:
+        return "Femme"
+    if v in ["M", "MIXTE", "MIXTES", "MIXED", "MIX"]:
+        return "Mixte"
+
+    # Détection des mots inclus dans la chaîne (ex: TrotteurHomme, OrienteurFemme)
+    if "HOMME" in v or "MASCULIN" in v or "MEN" in v or "MALE" in v:
+        return "Homme"
+    if "FEMME" in v or "DAME" in v or "FEMININE" in v or "WOMEN" in v or "FEMALE" in v:
+        return "Femme"
+    if "MIXTE" in v or "MIXED" in v:
+        return "Mixte"
+
+    # Si aucune correspondance, retourner la valeur originale
+    return v
+
+
+def normalize_name_column(s: pd.Series) -> pd.Series:
+    """Version vectorisée de normalize_name pour une colonne entière."""
+    result = s.where(s.notna(), "").astype(str).str.strip()
+    return result.mask(result.str.lower() == "nan", "")
+
+
+def normalize_category_column(s: pd.Series) -> pd.Series:
+    """Normalise une colonne de catégories via une table de correspondance.
+
+    normalize_category n'est appelée qu'une fois par valeur distincte
+    (quelques-unes par fichier), puis le résultat est diffusé par code.
+    """
+    codes, uniques = pd.factorize(s)
+    # Le code -1 (valeur manquante) pointe sur le dernier élément : None
+    table = np.array([normalize_category(u) for u in uniques] + [None], dtype=object)
+    return pd.Series(table[codes], index=s.index, dtype=object)
+
+
+def parse_int_column(df: pd.DataFrame, col) -> pd.Series:
+    """Équivalent vectorisé de int(valeur) : NaN quand la conversion échouerait.
+
+    Les nombres sont tronqués comme int(3.7) ; une chaîne doit contenir un
+    entier ("3", " 12 ") comme pour int("...").
+    """
+    if not col or col not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    s = df[col]
+    values = pd.to_numeric(s, errors="coerce").astype(float)
+    if not pd.api.types.is_numeric_dtype(s):
+        is_text = s.map(type) == str
+        not_int = ~s.astype(str).str.fullmatch(_INT_PATTERN)
+        values = values.mask(is_text & not_int)
+    return np.trunc(values.replace([np.inf, -np.inf], np.nan))
+
+
+def compute_category_ranks(df: pd.DataFrame, col_classement: str, categories: pd.Series):
+    """Calcule le rang de chaque ligne au sein de sa catégorie.
+
+    (ex: 10e au scratch mais 1ere Femme -> rang catégorie 1)
+    Retourne (classé, rang_categorie) : classé indique les lignes ayant un
+    classement numérique ; rang_categorie vaut NaN sans catégorie.
+    """
+    sort_rank = pd.to_numeric(df[col_classement], errors="coerce")
+    ranked = sort_rank.notna()
+    ordered = sort_rank[ranked].sort_values(kind="stable").index
+    cats = categories.loc[ordered]
+    cat_ranks = cats.groupby(cats, dropna=True).cumcount() + 1
+    return ranked, cat_ranks.reindex(df.index)
+
+
+def detect_point_conflicts(
+    df, col_classement, col_points, col_categorie=None, categories=None, points_lookup=utils.POINTS_LOOKUP
+):
+    """Liste les lignes dont les points du fichier ne correspondent pas au rang.
+
+    Les points attendus sont ceux que l'import écrirait (analyze_results) :
+    avec une colonne de catégorie, le rang par catégorie, et
+    utils.UNSCORED_POINTS pour une ligne qui n'en a pas ; sans colonne de
+    catégorie, le rang scratch. Barème compilé points_lookup.
+    """
+    rang = parse_int_column(df, col_classement)
+    points_fichier = parse_int_column(df, col_points)
+    points_attendus = pd.Series(utils.calculate_points_array(rang, points_lookup), index=df.index)
+    if col_categorie:
+        if categories is None:
+            categories = normalize_category_column(df[col_categorie])
+        _, cat_ranks = compute_category_ranks(df, col_classement, categories)
+        points_attendus = pd.Series(
+            utils.calculate_points_array(cat_ranks, points_lookup, missing=utils.UNSCORED_POINTS), index=df.index
+        )
+
+    mask = rang.notna() & points_fichier.notna() & (points_fichier != points_attendus)
+    return [
+        {
+            "ligne": idx + 1,
+            "rang": int(r),
+            "points_fichier": int(p),
+            "points_attendus": int(e),
+        }
+        for idx, r, p, e in zip(
+            df.index[mask], rang[mask], points_fichier[mask], points_attendus[mask]
+        )
+    ]
+
+
+def extract_participants(df: pd.DataFrame, name_mappings: list) -> pd.DataFrame:
+    """Déplie les coéquipiers mappés en une ligne par participant.
+
+    Le résultat est ordonné par ligne du fichier puis par coéquipier ; la
+    colonne "ligne" donne la position de la ligne d'origine dans df.
+    """
+    empty = pd.Series("", index=df.index)
+    frames = []
+    for num, mapping in enumerate(name_mappings):
+        if mapping.get("mode") == "split":
+            prenom = normalize_name_column(df.get(mapping.get("prenom"), empty))
+            nom = normalize_name_column(df.get(mapping.get("nom"), empty))
+        elif mapping.get("mode") == "single":
+            full_cell = normalize_name_column(df.get(mapping.get("full"), empty))
+            # Dernier token comme nom (format le plus fréquent "Prénom Nom")
+            parts = full_cell.str.replace(r"\s+", " ", regex=True).str.rpartition(" ")
+            prenom, nom = parts[0], parts[2]
+        else:
+            continue
+        frames.append(pd.DataFrame({
+            "ligne": np.arange(len(df)),
+            "coequipier": num,
+            "prenom": prenom.to_numpy(),
+            "nom": nom.to_numpy(),
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=["ligne", "coequipier", "prenom", "nom", "full_name"])
+
+    long = pd.concat(frames, ignore_index=True)
+    # Vérifications plus strictes pour éviter les données invalides
+    valid = (
+        (long["prenom"] != "") & (long["prenom"].str.lower() != "nan")
+        & (long["nom"] != "") & (long["nom"].str.lower() != "nan")
+    )
+    long = long[valid].sort_values(["ligne", "coequipier"], kind="stable")
+    long["full_name"] = (long["prenom"] + " " + long["nom"]).str.strip()
+    return long.reset_index(drop=True)
+
+
+def _sorted_tokens(processed: str) -> str:
+    return " ".join(sorted(processed.split()))
+
+
+def _trigrams(key: str) -> list:
+    """Trigrammes du nom entouré d'espaces, numérotés par occurrence.
+
+    ("abab" contient deux fois "ab" : ("ab", 1) et ("ab", 2)) afin que
+    l'intersection des ensembles compte les trigrammes communs avec leur
+    multiplicité.
+    """
+    padded = f" {key} "
+    seen = Counter()
+    grams = []
+    for i in range(len(padded) - 2):
+        gram = padded[i:i + 3]
+        seen[gram] += 1
+        grams.append((gram, seen[gram]))
+    return grams
+
+
+class NameIndex:
+    """Index de rapprochement des noms sur les coureurs existants.
+
+    Donne le même résultat que process.extractOne(nom, noms,
+    scorer=fuzz.token_sort_ratio) dès que le meilleur score atteint
+    SCORE_CONFLICT, mais ne score que les candidats plausibles.
+    Avec d la distance Indel entre les clés (tokens triés) de longueurs l1
+    et l2, le score arrondi vaut au moins 88 ssi 8 * d <= l1 + l2, ce qui
+    impose :
+    - une longueur proche : 8 * |l1 - l2| <= l1 + l2 ;
+    - assez de trigrammes communs : chaque insertion/suppression en détruit
+      au plus 3, donc communs >= max(l1, l2) - 3 * d.
+    """
+
+    def __init__(self, existing_names):
+        self.names = list(existing_names)
+        self.name_set = set(self.names)
+        # Prétraitement identique à celui appliqué aux choix par thefuzz
+        self.keys = [
+            _sorted_tokens(fuzz_utils.full_process(n, force_ascii=True)) for n in self.names
+        ]
+        self.lengths = np.array([len(k) for k in self.keys], dtype=np.int32)
+        postings = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            for gram in _trigrams(key):
+                postings[gram].append(i)
+        self.postings = {g: np.array(ids, dtype=np.int32) for g, ids in postings.items()}
+
+    def candidates(self, key: str) -> np.ndarray:
+        """Indices (croissants) des coureurs pouvant atteindre SCORE_CONFLICT."""
+        lists = [self.postings[g] for g in _trigrams(key) if g in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        counts = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        # Seuil minimal sur toutes les longueurs admissibles (au plus 9/7 de la
+        # requête), affiné ensuite candidat par candidat
+        longest = 9 * len(key) // 7
+        ids = np.flatnonzero(counts >= len(key) - 3 * ((len(key) + longest) // 8))
+        common = counts[ids]
+        lengths = self.lengths[ids]
+        total = lengths + len(key)
+        max_dist = total // 8
+        keep = (
+            (8 * np.abs(lengths - len(key)) <= total)
+            & (common >= np.maximum(lengths, len(key)) - 3 * max_dist)
+        )
+        return ids[keep]
+
+    def match(self, name: str):
+        """Retourne (status, match_proposal, score) pour un nom importé."""
+        if name in self.name_set:
+            return "exact", name, SCORE_EXACT
+        # Prétraitement identique à celui appliqué à la requête par thefuzz
+        key = _sorted_tokens(
+            fuzz_utils.full_process(fuzz_utils.full_process(name), force_ascii=True)
+        )
+        if not key:
+            return "new", None, 0
+        ids = self.candidates(key)
+        if len(ids) == 0:
+            return "new", None, 0
+        # Les candidats restent dans l'ordre de la liste : à score égal, le
+        # premier l'emporte comme avec extractOne
+        _, raw_score, pos = process.extractOne(
+            key, [self.keys[i] for i in ids], scorer=fuzz.ratio, processor=None
+        )
+        score = int(round(raw_score))
+        if score == SCORE_EXACT:
+            return "exact", self.names[ids[pos]], score
+        if score >= SCORE_CONFLICT:
+            return "conflict", self.names[ids[pos]], score
+        return "new", None, score
+
+
+def match_names(names, name_index: NameIndex, progress=None) -> dict:
+    """Rapproche chaque nom distinct des coureurs existants.
+
+    Retourne {nom: (status, match_proposal, score)} avec status parmi
+    "exact", "conflict" et "new". Un nom identique à une clé près (voir
+    utils.name_key) est exact. Pour un nouveau coureur, score n'est
+    qu'indicatif (meilleur candidat examiné). progress(fraction) est appelé
+    au fil de l'eau si fourni.
+    """
+    # Clés normalisées (accents, casse, ordre des mots) résolues en une seule
+    # requête indexée : seules les vraies ambiguïtés passent par l'index approché
+    keys = {name: utils.name_key(name) for name in names if name not in name_index.name_set}
+    by_key = database.get_coureurs_by_name_keys(keys.values())
+    matches = {}
+    for i, name in enumerate(names):
+        if keys.get(name) in by_key:
+            matches[name] = ("exact", by_key[keys[name]], SCORE_EXACT)
+        else:
+            matches[name] = name_index.match(name)
+        if progress:
+            progress((i + 1) / len(names))
+    return matches
+
+
+def analyze_results(
+    df: pd.DataFrame,
+    name_mappings: list,
+    col_classement: str,
+    col_points: str | None,
+    col_categorie: str | None,
+    circuit: str,
+    name_index: NameIndex,
+    use_ranks: bool = False,
+    progress=None,
+    points_lookup=utils.POINTS_LOOKUP,
+) -> list:
+    """Prépare les participants d'un fichier de résultats pour la validation.
+
+    Retourne une entrée par coéquipier valide (prenom, nom, full_name, rang,
+    rang_categorie, points, circuit, categorie, status, match_proposal, score).
+    Les points du fichier sont conservés sauf si use_ranks est demandé ; à
+    défaut ils sont recalculés depuis le rang par catégorie avec le barème
+    compilé points_lookup ; une ligne sans rang par catégorie (catégorie vide
+    ou classement non numérique) reçoit utils.UNSCORED_POINTS (1 point).
+    """
+    rang = parse_int_column(df, col_classement).fillna(utils.UNRANKED_RANK).astype(int)
+
+    categories = pd.Series(np.full(len(df), None, dtype=object), index=df.index, dtype=object)
+    if col_categorie and col_categorie in df.columns:
+        categories = normalize_category_column(df[col_categorie])
+
+    # ATTENTION: Sans catégorie définie, impossible de calculer correctement
+    # les points : 1 point par défaut au lieu d'utiliser le rang scratch
+    points = pd.Series(utils.UNSCORED_POINTS, index=df.index)
+    cat_ranks = pd.Series(np.nan, index=df.index)
+    if col_categorie and col_classement and col_classement in df.columns:
+        _, cat_ranks = compute_category_ranks(df, col_classement, categories)
+        points = pd.Series(
+            utils.calculate_points_array(cat_ranks, points_lookup, missing=utils.UNSCORED_POINTS), index=df.index
+        )
+    if col_points and not use_ranks:
+        points_fichier = parse_int_column(df, col_points)
+        points = points_fichier.where(points_fichier.notna(), points)
+    points = points.astype(int)
+
+    participants = extract_participants(df, name_mappings)
+    lignes = participants["ligne"].to_numpy(dtype=int)
+    matches = match_names(participants["full_name"].unique(), name_index, progress)
+
+    return [
+        {
+            "prenom": prenom,
+            "nom": nom,
+            "full_name": full_name,
+            "rang": int(r),
+            "rang_categorie": None if pd.isna(rc) else int(rc),
+            "points": int(p),
+            "circuit": circuit,
+            "categorie": categorie,
+            "status": matches[full_name][0],
+            "match_proposal": matches[full_name][1],
+            "score": matches[full_name][2],
+        }
+        for prenom, nom, full_name, r, rc, p, categorie in zip(
+            participants["prenom"],
+            participants["nom"],
+            participants["full_name"],
+            rang.to_numpy()[lignes],
+            cat_ranks.to_numpy()[lignes],
+            points.to_numpy()[lignes],
+            categories.to_numpy()[lignes],
+        )
+    ]
@@ -0,0 +1,74 @@
+import json
+import pandas as pd
+import database
+import utils
+
+# Catégories proposées dans les filtres
+CATEGORIES = ["Homme", "Femme", "Mixte"]
+# Ordre des sections du PDF complet
+PDF_CATEGORY_ORDER = ["Femme", "Mixte", "Homme"]
+
+
+def raid_header(course):
+    """En-tête de colonne d'un raid dans le tableau : "Nom du raid\nJJ/MM/AA"."""
+    return f"{course[1]}\n{utils.format_date_fr(course[2])}"
+
+
+def build_ranking_table(standings, challenge_courses):
+    """Construit le tableau de classement à partir des lignes de standings.
+
+    IMPORTANT: Classement par catégorie séparée. Un coureur peut être dans
+    différentes catégories selon les étapes : chaque couple (coureur, catégorie)
+    est une "identité" séparée.
+    Colonnes : Classement, un raid par colonne (ordre chronologique, y compris
+    les raids sans résultats), Total, Prénom Nom.
+    """
+    course_ids = [str(c[0]) for c in challenge_courses]
+    points_par_raid = [json.loads(p) for p in standings["points_par_raid"]]
+    pivot = pd.DataFrame(points_par_raid, columns=course_ids).fillna(0).astype(int)
+    # En-têtes "Nom du raid\nJJ/MM/AA"
+    pivot.columns = [raid_header(c) for c in challenge_courses]
+
+    pivot["Total"] = standings["total"].to_numpy()
+    pivot["Prénom Nom"] = (standings["nom_complet"] + " (" + standings["categorie"] + ")").to_numpy()
+    pivot.insert(0, "Classement", range(1, 1 + len(pivot)))
+    return pivot
+
+
+def build_result_cells(challenge_id, circuit):
+    """Résultat derrière chaque cellule modifiable du tableau de classement.
+
+    Renvoie {(libellé "Prénom Nom", en-tête du raid): (result_id, points)}.
+    """
+    headers = {c[0]: raid_header(c) for c in database.get_courses_for_challenge(challenge_id, circuit)}
+    cells = database.get_result_cells(challenge_id, circuit)
+    labels = cells["nom_complet"] + " (" + cells["categorie"] + ")"
+    return {
+        (label, headers[course_id]): (int(result_id), int(points))
+        for label, course_id, result_id, points in zip(labels, cells["course_id"], cells["id"], cells["points"])
+        if course_id in headers
+    }
+
+
+def compute_circuit_rankings(challenge_id, circuit):
+    """Calcule tous les classements d'un circuit pour un challenge.
+
+    La matrice (coureur, catégorie) × raid est construite une seule fois ;
+    les vues par catégorie en sont des sous-ensembles.
+
+    Renvoie {"Toutes": tableau, "Homme": ..., "Femme": ..., "Mixte": ...},
+    chaque tableau ayant sa propre colonne Classement (1..n).
+    """
+    standings = database.get_standings(challenge_id, circuit)
+    challenge_courses = database.get_courses_for_challenge(challenge_id, circuit)
+    table = build_ranking_table(standings, challenge_courses)
+
+    views = {"Toutes": table}
+    labels = standings["categorie"]
+    for cat in CATEGORIES:
+        # Correspondance évaluée une fois par libellé distinct, pas par ligne
+        matches = {label: utils.check_category_match(label, cat) for label in labels.unique()}
+        view = table[labels.map(matches).to_numpy(dtype=bool)].reset_index(drop=True)
+        view["Classement"] = range(1, 1 + len(view))
+        views[cat] = view
+    return views
@@ -0,0 +1,24 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Copie de challenge.db dans un dossier temporaire (dossier courant du
+    test : sauvegardes et archives y sont écrites), schéma à jour."""
+    shutil.copy(os.path.join(ROOT, "challenge.db"), tmp_path / "challenge.db")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "challenge.db"))
+    database.clear_query_cache()
+    database.init_db()
+    yield database
+    database.close_all()
+    database.clear_query_cache()
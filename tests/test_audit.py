@@ -0,0 +1,65 @@
+import json
+
+import audit
+
+
+def test_batch_points_edit_appears_in_points_history(db):
+    before = len(audit.get_point_modifications(1000))
+    with db.connection() as conn:
+        rows = conn.execute("SELECT id, points FROM resultats ORDER BY id LIMIT 3").fetchall()
+    assert db.update_results_points([(id_, points, points + 1) for id_, points in rows])["resultats"] == 3
+
+    history = audit.get_point_modifications(1000)
+    assert len(history) == before + 3
+    edited = history[history["record_id"].isin([id_ for id_, _ in rows])]
+    assert sorted(zip(edited["old_points"], edited["new_points"])) == sorted((p, p + 1) for _, p in rows)
+    assert edited["nom_complet"].notna().all()
+
+
+def test_cascade_deletes_keep_removed_results(db):
+    with db.connection() as conn:
+        course_id, challenge_id = conn.execute(
+            "SELECT id, challenge_id FROM courses WHERE challenge_id IS NOT NULL ORDER BY id LIMIT 1"
+        ).fetchone()
+        course_rows = conn.execute("SELECT * FROM resultats WHERE course_id = ? ORDER BY id", (course_id,)).fetchall()
+        challenge_rows = conn.execute(
+            "SELECT r.* FROM resultats r JOIN courses co ON co.id = r.course_id "
+            "WHERE co.challenge_id = ? AND co.id <> ? ORDER BY r.id",
+            (challenge_id, course_id),
+        ).fetchall()
+
+    def last_batch():
+        with db.connection() as conn:
+            return json.loads(conn.execute(
+                "SELECT new_values FROM audit_log WHERE action = 'BATCH_DELETE' ORDER BY id DESC LIMIT 1"
+            ).fetchone()[0])
+
+    db.delete_course(course_id)
+    payload = last_batch()
+    assert payload["resultats"] == len(course_rows)
+    assert sorted(tuple(row.values()) for row in payload["lignes"]) == course_rows
+
+    db.delete_challenge(challenge_id)
+    payload = last_batch()
+    assert sorted(tuple(row.values()) for row in payload["lignes"]) == challenge_rows
+    assert len(payload["raids"]) == payload["courses"]
+
+
+def test_audit_suspension_restores_previous_state(db):
+    def audit_flag(conn):
+        return conn.execute("SELECT value FROM config WHERE name = 'audit'").fetchone()[0]
+
+    with db.transaction() as conn:
+        with db._audit_suspended(conn):
+            with db._audit_suspended(conn):
+                assert audit_flag(conn) == 0
+            # Suspension imbriquée : l'audit reste coupé jusqu'à la sortie du bloc englobant
+            assert audit_flag(conn) == 0
+        assert audit_flag(conn) == 1
+
+        try:
+            with db._audit_suspended(conn):
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        assert audit_flag(conn) == 1
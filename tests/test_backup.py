@@ -0,0 +1,52 @@
+import time
+from datetime import datetime
+
+import backup
+
+
+def _dump(database):
+    """Contenu de la base, hors générations (avancées par chaque restauration)."""
+    with database.connection() as conn:
+        return sorted(line for line in conn.iterdump() if not line.startswith('INSERT INTO "generations"'))
+
+
+def _boundary():
+    """Instant strictement entre deux sauvegardes (horodatages ISO)."""
+    time.sleep(0.01)
+    point = datetime.now().isoformat()
+    time.sleep(0.01)
+    return point
+
+
+def test_restore_point_in_time_exact(db):
+    assert backup.create_backup()
+    with db.connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM resultats ORDER BY id LIMIT 4")]
+        course_id = conn.execute(
+            "SELECT course_id FROM resultats GROUP BY course_id ORDER BY count(*) LIMIT 1"
+        ).fetchone()[0]
+
+    edits = [
+        lambda: db.update_result_points_by_id(ids[0], 12),
+        lambda: db.add_coureur("ZZTEST Alice", "F", "Senior"),
+        lambda: db.delete_results(ids[1:3]),
+        lambda: db.delete_course(course_id),
+    ]
+    states = [(_boundary(), _dump(db))]
+    for edit in edits:
+        edit()
+        assert backup.create_changeset()
+        states.append((_boundary(), _dump(db)))
+    # Modification jamais sauvegardée : absente de tous les états restaurés
+    db.update_result_points_by_id(ids[3], 1)
+
+    for point, state in reversed(states):
+        version = db.get_data_version()
+        backup.restore_point_in_time(point)
+        assert _dump(db) == state
+        assert db.get_data_version() > version
+
+
+def test_changeset_skipped_when_unchanged(db):
+    assert backup.create_backup()
+    assert backup.create_changeset() is None
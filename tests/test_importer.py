@@ -0,0 +1,16 @@
+import pandas as pd
+
+import importer
+import utils
+
+
+def test_conflicts_expect_unscored_points_without_category_rank():
+    lookup = utils.compile_points_scale({1: 30, 10: 5})
+    df = pd.DataFrame({
+        "Clt": ["1", "2", "3", "4"],
+        "Catégorie": ["Homme", "", "Homme", ""],
+        "Pts": ["30", "1", "30", "5"],
+    })
+    conflicts = importer.detect_point_conflicts(df, "Clt", "Pts", "Catégorie", points_lookup=lookup)
+    # Seule la ligne 4 diffère de ce que l'import écrirait (1 point sans catégorie)
+    assert conflicts == [{"ligne": 4, "rang": 4, "points_fichier": 5, "points_attendus": utils.UNSCORED_POINTS}]
@@ -0,0 +1,76 @@
+import re
+
+import audit
+
+# Parcours complet de resultats (alias r dans les requêtes)
+RESULTATS_SCAN = re.compile(r"^SCAN (resultats|r)\b")
+
+
+def _plans(db, fn, *args):
+    """Plans (EXPLAIN QUERY PLAN) des SELECT exécutés par fn(*args)."""
+    statements = []
+    db.clear_query_cache()
+    with db.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            fn(*args)
+        finally:
+            conn.set_trace_callback(None)
+        return {
+            sql: [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            for sql in statements
+            if sql.lstrip().upper().startswith(("SELECT", "WITH"))
+        }
+
+
+def _plan(db, sql, params=()):
+    with db.connection() as conn:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def _assert_indexed(plans, table="resultats"):
+    touched = {sql: plan for sql, plan in plans.items() if table in sql}
+    assert touched
+    for sql, plan in touched.items():
+        assert not any(RESULTATS_SCAN.match(step) for step in plan), (sql, plan)
+        assert any(step.startswith("SEARCH") and "USING" in step for step in plan), (sql, plan)
+
+
+def _challenge_circuit(db):
+    with db.connection() as conn:
+        return conn.execute(
+            "SELECT challenge_id, circuit FROM courses WHERE challenge_id IS NOT NULL LIMIT 1"
+        ).fetchone()
+
+
+def test_ranking_join_uses_indexes(db):
+    _assert_indexed(_plans(db, db.get_ranking_data, *_challenge_circuit(db)))
+
+
+def test_coureur_results_use_indexes(db):
+    challenge_id, circuit = _challenge_circuit(db)
+    with db.connection() as conn:
+        nom = conn.execute("SELECT nom_complet FROM coureurs LIMIT 1").fetchone()[0]
+    _assert_indexed(_plans(db, db.get_coureur_results_for_challenge, nom, challenge_id, circuit))
+
+
+def test_duplicate_results_use_indexes(db):
+    _assert_indexed(_plans(db, db.get_duplicate_results))
+
+
+def test_challenge_delete_cascade_uses_indexes(db):
+    challenge_id, _ = _challenge_circuit(db)
+    _assert_indexed(_plans(db, db.delete_challenge, challenge_id))
+    # Recherches faites par les ON DELETE CASCADE (challenge -> raids -> résultats)
+    assert any("idx_courses" in step for step in _plan(db, "SELECT 1 FROM courses WHERE challenge_id = ?", (1,)))
+    assert any(step.startswith("SEARCH") for step in _plan(db, "SELECT 1 FROM resultats WHERE course_id = ?", (1,)))
+
+
+def test_audit_history_uses_indexes(db):
+    plans = _plans(db, audit.get_recent_modifications)
+    plans.update(_plans(db, audit.get_point_modifications))
+    for sql, plan in plans.items():
+        assert any("USING" in step and "INDEX" in step for step in plan), (sql, plan)
+        assert not any("TEMP B-TREE" in step for step in plan), (sql, plan)
+    plans = _plans(db, audit.get_point_modifications)
+    assert any(step.startswith("SEARCH audit_log USING INDEX") for plan in plans.values() for step in plan)
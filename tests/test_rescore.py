@@ -0,0 +1,82 @@
+import pandas as pd
+
+import importer
+import utils
+
+
+def test_rescore_after_import_is_noop(db):
+    # Ex-aequo au scratch dans une même catégorie, équipes de deux coureurs
+    df = pd.DataFrame({
+        "Clt": ["1", "2", "2", "4", "5", "6", "abandon"],
+        "Catégorie": ["Mixte", "Mixte", "Mixte", "Mixte", "Homme", "Homme", "Mixte"],
+        "Prénom 1": ["Anne", "Basile", "Chloé", "David", "Emile", "Fanny", "Gaspard"],
+        "Nom 1": ["Rescore"] * 7,
+        "Prénom 2": ["Hugo", "Inès", "Jules", "Katia", "Louis", "Maud", "Noé"],
+        "Nom 2": ["Rescoreb"] * 7,
+    })
+    mappings = [{"mode": "split", "prenom": f"Prénom {i}", "nom": f"Nom {i}"} for i in (1, 2)]
+    lookup = db.get_points_lookup(None, "raideur")
+    data = importer.analyze_results(
+        df, mappings, "Clt", None, "Catégorie", "raideur", importer.NameIndex([]), points_lookup=lookup,
+    )
+    # Rangs par catégorie de l'import : ex-aequo départagés dans l'ordre du fichier
+    assert [item["rang_categorie"] for item in data[:8:2]] == [1, 2, 3, 4]
+
+    course_id, count = db.import_results("Raid rescore", "2026-01-01", "raideur", None, [
+        (item["full_name"], True, item["rang"], item["points"], item["categorie"], item["rang_categorie"])
+        for item in data
+    ])
+    assert count == len(data) == 14
+    assert db.rescore_results(course_id=course_id) == {}
+
+
+def test_empty_category_scores_one_point(db):
+    db.set_points_scale({1: 30, 10: 5}, circuit="raideur")
+    df = pd.DataFrame({
+        "Clt": ["1", "2", "3"],
+        "Catégorie": ["Homme", "", "Homme"],
+        "Prénom": ["Olga", "Paul", "Rémi"],
+        "Nom": ["Sanscat", "Sanscat", "Sanscat"],
+    })
+    lookup = db.get_points_lookup(None, "raideur")
+    data = importer.analyze_results(
+        df, [{"mode": "split", "prenom": "Prénom", "nom": "Nom"}], "Clt", None, "Catégorie", "raideur",
+        importer.NameIndex([]), points_lookup=lookup,
+    )
+    assert [item["points"] for item in data] == [30, 1, 30]
+
+    course_id, _ = db.import_results("Raid sans catégorie", "2026-01-02", "raideur", None, [
+        (item["full_name"], True, item["rang"], item["points"], item["categorie"], item["rang_categorie"])
+        for item in data
+    ])
+    assert db.rescore_results(course_id=course_id) == {}
+
+    db.delete_points_scale(circuit="raideur")
+    with db.connection() as conn:
+        operation, = conn.execute(
+            "SELECT json_extract(new_values, '$.operation') FROM audit_log ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    assert operation == "delete_points_scale"
+
+
+def _manual_mix(db, stored_ranks):
+    """Raid importé (Homme aux rangs scratch 5, 12 et 20) puis un résultat saisi
+    à la main au 4e rang de la catégorie."""
+    lookup = db.get_points_lookup(None, "raideur")
+    course_id, _ = db.import_results("Raid manuel", "2026-01-03", "raideur", None, [
+        (f"Import{rang} Manuel", True, rang, int(utils.calculate_points(cat_rank, lookup)), "Homme",
+         cat_rank if stored_ranks else None)
+        for cat_rank, rang in enumerate([5, 12, 20], start=1)
+    ])
+    coureur_id = db.add_coureur("Saisie Manuel", None, None)
+    db.add_result(course_id, coureur_id, 4, int(utils.calculate_points(4, lookup)), "Homme", rang_categorie=4)
+    return course_id
+
+
+def test_rescore_keeps_manual_result_among_imported(db):
+    assert db.rescore_results(course_id=_manual_mix(db, stored_ranks=True)) == {}
+
+
+def test_rescore_keeps_manual_result_among_older_imports(db):
+    # Import antérieur au rang par catégorie enregistré : rang recalculé sans la saisie manuelle
+    assert db.rescore_results(course_id=_manual_mix(db, stored_ranks=False)) == {}
@@ -1,36 +1,114 @@
 import datetime
+import os
+import re
+import time
+import unicodedata
+import numpy as np
 from fpdf import FPDF
 
+PDF_CACHE_DIR = "pdf_cache"
 
-def calculate_points(rank: int) -> int:
+# Statistiques du cache PDF pour le processus courant : téléchargements servis
+# depuis le cache (hits) ou générés pour eux (misses)
+pdf_cache_stats = {"hits": 0, "misses": 0, "last_render_ms": None}
+
+
+# Barème par défaut (identique pour Homme, Femme et Mixte) : rang -> points.
+# 1er: 35, 2e: 32, 3e: 29, 4e: 27, 5e: 26, 6e: 25, puis -1 point par place
+# jusqu'au 30e (1 pt). Au-delà du dernier rang, ses points s'appliquent.
+DEFAULT_POINTS_SCALE = {1: 35, 2: 32, 3: 29, 4: 27, 5: 26, 6: 25, **{rank: 31 - rank for rank in range(7, 31)}}
+
+
+def compile_points_scale(scale):
+    """Compile un barème {rang: points} en table de correspondance NumPy.
+
+    Index = rang (0 vaut 0 point) ; un rang absent du barème reçoit les points
+    du rang défini précédent, et le dernier indice vaut pour tous les rangs
+    suivants.
     """
-    Calcule les points en fonction du rang selon le barème du challenge.
-    Barème identique pour Homme, Femme et Mixte :
-    1er: 35, 2e: 32, 3e: 29, 4e: 27, 5e: 26, 6e: 25.
-    Ensuite -1 point par place jusqu'au 30e (1 pt).
-    30e et suivants : 1 pt.
+    lookup = np.zeros(max(scale) + 1, dtype=int)
+    points = 0
+    for rank in range(1, len(lookup)):
+        points = scale.get(rank, points)
+        lookup[rank] = points
+    return lookup
+
+
+# Rang enregistré pour une ligne sans classement exploitable (hors classement)
+UNRANKED_RANK = 999
+
+# Points d'une ligne importée sans rang par catégorie (catégorie vide ou hors
+# classement) : le rang scratch ne permet pas de les calculer
+UNSCORED_POINTS = 1
+
+
+# Barème par défaut compilé : un tableau indexé par le rang
+POINTS_LOOKUP = compile_points_scale(DEFAULT_POINTS_SCALE)
+
+
+def calculate_points(rank: int, lookup=POINTS_LOOKUP) -> int:
+    """
+    Calcule les points en fonction du rang selon le barème du challenge
+    (par défaut DEFAULT_POINTS_SCALE, sinon la table compilée fournie).
     """
     if rank < 1:
         return 0
+    # "not <" couvre aussi un rang manquant (NaN) : points du dernier rang
+    if not rank < len(lookup):
+        return int(lookup[-1])
+    return int(lookup[int(rank)])
+
+
+def calculate_points_array(ranks, lookup=POINTS_LOOKUP, missing=None):
+    """Version vectorisée de calculate_points pour une colonne de rangs.
+
+    Un rang manquant (NaN) reçoit missing points ; à défaut, les points du
+    dernier rang du barème, comme calculate_points(NaN).
+    """
+    last = len(lookup) - 1
+    ranks = np.asarray(ranks, dtype=float)
+    points = lookup[np.clip(np.nan_to_num(ranks, nan=last), 0, last).astype(int)]
+    if missing is not None:
+        points = np.where(np.isnan(ranks), missing, points)
+    return points
 
-    if rank == 1:
-        return 35
-    elif rank == 2:
-        return 32
-    elif rank == 3:
-        return 29
-    elif rank == 4:
-        return 27
-    elif rank == 5:
-        return 26
-    elif rank == 6:
-        return 25
-    elif 7 <= rank <= 30:
-        # 7e=24, ... 30e=1 -> Formule : 31 - rang
-        return 31 - rank
-    else:
-        # 31ème et plus
-        return 1
+
+def name_key(name):
+    """Clé de rapprochement d'un nom : casse, accents, ponctuation et ordre des
+    mots ignorés (ex: "DUPONT Jean-Pierre" -> "dupont jean pierre").
+    Retourne None pour un nom vide."""
+    if name is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(name).casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(sorted(re.findall(r"[^\W_]+", text))) or None
+
+
+def check_category_match(val, target_cat):
+    """Vérifie si la catégorie val correspond au filtre target_cat (ex: 'H' -> 'Homme')."""
+    v = str(val).lower().strip()
+    t = target_cat.lower()
+    if t == "homme":
+        return "homme" in v or "masculin" in v or re.search(r"\bh\b", v) is not None
+    if t == "femme":
+        return "femme" in v or "féminine" in v or "dame" in v or re.search(r"\bf\b", v) is not None
+    if t == "mixte":
+        return "mixte" in v or re.search(r"\bm\b", v) is not None
+    return t in v
+
+
+def format_date_fr(date_str: str) -> str:
+    """Convertit YYYY-MM-DD en DD/MM/YY pour l'affichage."""
+    if not date_str:
+        return ""
+    try:
+        parts = date_str.split("-")
+        if len(parts) == 3:
+            year = parts[0][-2:]  # Prendre les 2 derniers chiffres de l'année
+            return f"{parts[2]}/{parts[1]}/{year}"
+    except:
+        pass
+    return date_str
 
 
 class PDF(FPDF):
@@ -219,3 +297,52 @@ def generate_pdf(dfs_dict):
             pdf.ln(row_h)
 
     return bytes(pdf.output())
+
+
+def _pdf_cache_path(key, data_version):
+    # Le PDF contient la date du jour (pied de page) : elle fait partie de la version
+    tag = f"{data_version}-{datetime.date.today().strftime('%Y%m%d')}"
+    slug = re.sub(r"[^A-Za-z0-9-]+", "-", "_".join(str(k) for k in key))
+    return os.path.join(PDF_CACHE_DIR, f"{slug}_v{tag}.pdf"), f"_v{tag}.pdf"
+
+
+def get_cached_pdf(key, data_version):
+    """Renvoie le PDF déjà généré pour (key, data_version), ou None."""
+    path, _ = _pdf_cache_path(key, data_version)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return data
+
+
+def count_pdf_download(from_cache):
+    """Compte un PDF téléchargé (rappel du bouton de téléchargement) : servi
+    depuis le cache disque, ou généré pour ce téléchargement. Une simple
+    consultation du cache (chaque rerun de la page) n'est pas comptée."""
+    pdf_cache_stats["hits" if from_cache else "misses"] += 1
+
+
+def render_cached_pdf(key, data_version, dfs_dict):
+    """Génère le PDF (voir generate_pdf) et l'enregistre dans le cache disque.
+
+    Les fichiers d'une version de données antérieure sont supprimés au passage.
+    """
+    start = time.perf_counter()
+    data = generate_pdf(dfs_dict)
+    pdf_cache_stats["last_render_ms"] = (time.perf_counter() - start) * 1000
+
+    path, suffix = _pdf_cache_path(key, data_version)
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    for filename in os.listdir(PDF_CACHE_DIR):
+        if not filename.endswith(suffix):
+            try:
+                os.remove(os.path.join(PDF_CACHE_DIR, filename))
+            except OSError:
+                pass
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return data